@@ -0,0 +1,285 @@
+# BatchInterviewRunner: chạy nhiều buổi phỏng vấn không cần người gõ câu trả lời
+#
+# Đọc kịch bản (candidate, topic, answers) từ file JSON, chạy song song bằng thread pool (dùng
+# chung 1 AdaptiveInterviewer, mỗi kịch bản 1 new_session) hoặc process pool (mỗi process tự load
+# model + FAISS). LLM là Gemini thật (qua LLMClientPool) hoặc StubLLM cục bộ, tất định.
+#
+#   python BatchInterviewRunner.py batch_interviews.json --llm stub --workers 8
+#   python BatchInterviewRunner.py batch_interviews.json --llm stub --repeat 50 --output batch_report.json
+#   python BatchInterviewRunner.py batch_interviews.json --llm gemini --processes 2
+#
+# Kịch bản:
+#   [{"candidate": "Tên,Lớp", "topic": "...", "answers": ["...", "[score=8] ..."],
+#     "expected": {"difficulties": ["medium", "hard"], "total_questions": 4}}]
+# - Hết answers thì trả lời "" (StubLLM chấm 0 điểm).
+# - "[score=N]" trong câu trả lời: StubLLM chấm đúng N điểm, dùng để kiểm tra state machine.
+# - "expected" (tùy chọn): so với kết quả thật, sai thì báo và exit 1 -> regression test sau khi
+#   đổi InterviewConfig (ngưỡng, số câu tối đa...).
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.language_models.llms import LLM
+
+SCORE_MARKER = re.compile(r"\[score=(\d+(?:\.\d+)?)\]")
+ANSWER_LINE = re.compile(r"Câu trả lời: (.*)")
+LEVELS = ("yeu", "trung_binh", "kha", "gioi", "xuat_sac")
+
+
+# =======================
+# 1. LLM giả, tất định
+# =======================
+
+def stub_response(prompt: str) -> str:
+    """Câu trả lời cố định theo prompt, đúng dạng JSON mà từng prompt của interviewer yêu cầu"""
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+    if '"score"' in prompt:
+        # Câu trả lời nằm ngay trước phần tài liệu tham chiếu (tài liệu có thể chứa chữ bất kỳ)
+        matches = ANSWER_LINE.findall(prompt.split("Tài liệu tham chiếu")[0])
+        answer = matches[-1].strip() if matches else ""
+        marker = SCORE_MARKER.search(answer)
+        # Không có marker: câu trả lời càng dài điểm càng cao (tối đa 10)
+        score = float(marker.group(1)) if marker else float(min(10, len(answer.split()) // 3))
+        return json.dumps({"score": score, "analysis": f"Nhận xét stub ({len(answer)} ký tự)"}, ensure_ascii=False)
+    if '"question"' in prompt:
+        return json.dumps({"question": f"Câu hỏi stub {digest[:8]}: hãy trình bày và cho ví dụ?"}, ensure_ascii=False)
+    if '"level"' in prompt:
+        return json.dumps({"level": LEVELS[int(digest, 16) % len(LEVELS)]})
+    return f"Câu trả lời stub {digest[:8]}."
+
+
+class StubLLM(LLM):
+    """LLM của langchain trả về stub_response, latency: độ trễ giả lập (giây) mỗi lần gọi"""
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return stub_response(prompt)
+
+
+class _CountingLLM:
+    """Bọc LLM của 1 phiên để đếm số lần gọi (interviewer chỉ dùng invoke / stream)"""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.calls = 0
+
+    def invoke(self, prompt, **kwargs):
+        self.calls += 1
+        return self.llm.invoke(prompt, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        self.calls += 1
+        return self.llm.stream(prompt, **kwargs)
+
+
+# =======================
+# 2. Chạy 1 kịch bản
+# =======================
+
+def load_scripts(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        scripts = json.load(f)
+    for i, script in enumerate(scripts):
+        missing = {"candidate", "topic"} - set(script)
+        if missing:
+            raise ValueError(f"Kịch bản #{i} thiếu {', '.join(sorted(missing))}")
+        script.setdefault("answers", [])
+    return scripts
+
+
+def check_expected(script: dict, result: dict) -> List[str]:
+    """Các điểm khác với script["expected"]"""
+    expected = script.get("expected") or {}
+    mismatches = []
+    for key in ("difficulties", "scores", "total_questions", "level"):
+        if key in expected and expected[key] != result.get(key):
+            mismatches.append(f"{key}: mong đợi {expected[key]}, thực tế {result.get(key)}")
+    if "final_score" in expected and abs(expected["final_score"] - (result.get("final_score") or 0)) > 1e-6:
+        mismatches.append(f"final_score: mong đợi {expected['final_score']}, thực tế {result.get('final_score')}")
+    return mismatches
+
+
+def run_script(base_interviewer, script: dict, index: int) -> dict:
+    """Chạy 1 buổi phỏng vấn theo kịch bản, trả về kết quả + số đo"""
+    interviewer = base_interviewer.new_session()
+    llm = _CountingLLM(interviewer.llm)
+    interviewer.llm = llm
+    result = {"index": index, "candidate": script["candidate"], "topic": script["topic"]}
+    question_ms, answer_ms = [], []
+    start = time.perf_counter()
+    try:
+        state = interviewer.start_interview(script["candidate"], script["topic"])
+        answers = list(script["answers"])
+        while not state.is_finished:
+            t0 = time.perf_counter()
+            question = interviewer.next_question(state)
+            t1 = time.perf_counter()
+            answer = answers.pop(0) if answers else ""
+            interviewer.submit_answer(state, question, answer)
+            t2 = time.perf_counter()
+            question_ms.append((t1 - t0) * 1000)
+            answer_ms.append((t2 - t1) * 1000)
+        summary = interviewer.generate_summary(state, verbose=False)
+        result.update({
+            "ok": True,
+            "level": state.level.value,
+            "total_questions": len(state.history),
+            "difficulties": [attempt.difficulty.value for attempt in state.history],
+            "scores": [attempt.score for attempt in state.history],
+            "final_score": state.final_score,
+            "summary": summary,
+        })
+    except Exception as e:
+        result.update({"ok": False, "error": f"{type(e).__name__}: {e}"})
+    result.update({
+        "session_ms": (time.perf_counter() - start) * 1000,
+        "question_ms": question_ms,
+        "answer_ms": answer_ms,
+        "llm_calls": llm.calls,
+    })
+    if result["ok"]:
+        result["mismatches"] = check_expected(script, result)
+    return result
+
+
+# =======================
+# 3. Pool
+# =======================
+
+def build_interviewer(llm_kind: str, stub_latency: float = 0.0, use_bank: bool = True):
+    from LLMInterviewer2_fixed import AdaptiveInterviewer
+
+    interviewer = AdaptiveInterviewer()
+    if llm_kind == "stub":
+        interviewer.llm = StubLLM(latency=stub_latency)
+    if not use_bank:
+        interviewer.question_bank = None
+    return interviewer
+
+
+_process_interviewer = None
+
+
+def _init_process(llm_kind: str, stub_latency: float, use_bank: bool):
+    global _process_interviewer
+    _process_interviewer = build_interviewer(llm_kind, stub_latency, use_bank)
+
+
+def _run_in_process(script: dict, index: int) -> dict:
+    return run_script(_process_interviewer, script, index)
+
+
+def run_batch(scripts: List[dict], llm_kind: str = "stub", workers: int = 4, processes: int = 0,
+              stub_latency: float = 0.0, use_bank: bool = True) -> dict:
+    results = []
+    lock = threading.Lock()
+
+    def collect(result: dict):
+        with lock:
+            results.append(result)
+            status = "✅" if result["ok"] and not result.get("mismatches") else "❌"
+            print(f"{status} [{len(results)}/{len(scripts)}] {result['candidate']} - {result['topic']}: "
+                  f"{result.get('total_questions', 0)} câu, {result['llm_calls']} lượt LLM, "
+                  f"{result['session_ms'] / 1000:.1f}s")
+
+    if processes:
+        from multiprocessing import get_context
+
+        executor = ProcessPoolExecutor(max_workers=processes, mp_context=get_context("spawn"),
+                                       initializer=_init_process, initargs=(llm_kind, stub_latency, use_bank))
+        with executor:
+            # Chờ các process load xong model trước khi bấm giờ
+            list(executor.map(time.sleep, [0] * processes))
+            start = time.perf_counter()
+            futures = [executor.submit(_run_in_process, script, i) for i, script in enumerate(scripts)]
+            for future in futures:
+                collect(future.result())
+    else:
+        interviewer = build_interviewer(llm_kind, stub_latency, use_bank)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+            futures = [executor.submit(run_script, interviewer, script, i) for i, script in enumerate(scripts)]
+            for future in futures:
+                collect(future.result())
+    elapsed = time.perf_counter() - start
+    results.sort(key=lambda r: r["index"])
+    return summarize(results, elapsed, llm_kind, processes or workers, "process" if processes else "thread")
+
+
+def _percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None}
+    return {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95))}
+
+
+def summarize(results: List[dict], elapsed: float, llm_kind: str, workers: int, pool: str) -> dict:
+    ok = [r for r in results if r["ok"]]
+    return {
+        "llm": llm_kind,
+        "pool": pool,
+        "workers": workers,
+        "sessions": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "regressions": sum(1 for r in ok if r["mismatches"]),
+        "elapsed_seconds": elapsed,
+        "sessions_per_minute": len(ok) / elapsed * 60 if elapsed else 0.0,
+        "llm_calls_per_session": float(np.mean([r["llm_calls"] for r in ok])) if ok else 0.0,
+        "questions_per_session": float(np.mean([r["total_questions"] for r in ok])) if ok else 0.0,
+        "session_ms": _percentiles([r["session_ms"] for r in ok]),
+        "question_ms": _percentiles([ms for r in ok for ms in r["question_ms"]]),
+        "answer_ms": _percentiles([ms for r in ok for ms in r["answer_ms"]]),
+        "results": results,
+    }
+
+
+def print_report(report: dict):
+    def fmt(p):
+        return f"p50 {p['p50']:.0f} ms, p95 {p['p95']:.0f} ms" if p["p50"] is not None else "N/A"
+
+    print(f"\n📊 {report['succeeded']}/{report['sessions']} phiên ({report['llm']} LLM, {report['workers']} "
+          f"{report['pool']}) trong {report['elapsed_seconds']:.1f}s = {report['sessions_per_minute']:.1f} phiên/phút")
+    print(f"   {report['questions_per_session']:.1f} câu hỏi, {report['llm_calls_per_session']:.1f} lượt LLM / phiên")
+    print(f"   Cả phiên: {fmt(report['session_ms'])} | sinh câu hỏi: {fmt(report['question_ms'])} | "
+          f"chấm điểm: {fmt(report['answer_ms'])}")
+    for r in report["results"]:
+        if not r["ok"]:
+            print(f"❌ #{r['index']} {r['candidate']}: {r['error']}")
+        for mismatch in r.get("mismatches") or []:
+            print(f"❌ #{r['index']} {r['candidate']}: {mismatch}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy phỏng vấn theo kịch bản, song song, không cần nhập tay")
+    parser.add_argument("scripts", nargs="?", default="batch_interviews.json")
+    parser.add_argument("--llm", choices=("stub", "gemini"), default="stub")
+    parser.add_argument("--workers", type=int, default=4, help="Số thread (dùng chung model + FAISS)")
+    parser.add_argument("--processes", type=int, default=0, help="Dùng process pool với số process này")
+    parser.add_argument("--repeat", type=int, default=1, help="Lặp lại bộ kịch bản N lần (load test)")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Độ trễ giả lập mỗi lượt StubLLM (giây)")
+    parser.add_argument("--no-bank", action="store_true", help="Không dùng ngân hàng câu hỏi")
+    parser.add_argument("--output", default=None, help="Ghi báo cáo JSON")
+    args = parser.parse_args()
+
+    scripts = load_scripts(args.scripts) * args.repeat
+    report = run_batch(scripts, args.llm, args.workers, args.processes, args.stub_latency, not args.no_bank)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Đã ghi {args.output}")
+    sys.exit(1 if report["failed"] or report["regressions"] else 0)
@@ -0,0 +1,245 @@
+# BuildIndexes: đọc + chia chunk tài liệu 1 lần, build FAISS index cho nhiều embedding model
+#
+#   python BuildIndexes.py                                  # build các store của OthersModel.py
+#   python BuildIndexes.py --low-memory                     # load từng model, giải phóng trước model sau
+#   python BuildIndexes.py --chunker recursive --model intfloat/multilingual-e5-large-instruct:vector_db_e5_large
+#   python BuildIndexes.py --index-type ivf:nlist=256                 # IVF / HNSW / PQ (FaissIndexFactory.py)
+#
+# Chunk được ghi tạm ra chunks.jsonl rồi đọc lại theo block cho từng model, nên RAM không phụ thuộc
+# số model. Mặc định model kế tiếp được load ở background trong lúc model hiện tại đang embed
+# (pipelined); --low-memory thì load tuần tự và release model cũ trước.
+# Cạnh mỗi index còn có bản mmap (MmapVectorStore) và index BM25 (LexicalIndex) cho retrieval hybrid.
+# Mỗi index có build_manifest.json: model, cấu hình chunk, file nguồn, số chunk, thời gian từng bước,
+# loại index và recall so với flat (nếu không phải flat).
+import argparse
+import datetime
+import json
+import os
+import tempfile
+import time
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+from EmbeddingEngine import BatchEmbedder, check_parity, detect_device
+from EmbeddingRegistry import get_embeddings, model_stats, release, warmup
+from FaissIndexFactory import convert_store, parse_index_spec, print_recall, recall_check, store_vectors
+from IncrementalIngest import SPLITTERS, content_hash, file_hash
+from LexicalIndex import write_lexical_index
+from MmapVectorStore import write_mmap_store
+
+BUILD_MANIFEST_FILE = "build_manifest.json"
+DEFAULT_SOURCES = ["Chương 2 Biến, hằng và kiểu dữ liệu.pdf"]
+
+# Các store thử nghiệm (trước đây trong OthersModel.py)
+DEFAULT_MODELS = [
+    {"model_name": "intfloat/multilingual-e5-large-instruct", "folder": "vector_db_e5_large"},
+    {"model_name": "hiieu/halong_embedding", "folder": "vector_db_halong"},
+    {"model_name": "AITeamVN/Vietnamese_Embedding", "folder": "vector_db_aiteam"},
+    # Tầng recall của CascadeRetriever (cùng chunk / id với vector_db_e5_large)
+    {"model_name": "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", "folder": "vector_db_minilm"},
+]
+
+
+# =======================
+# 1. Chia chunk 1 lần
+# =======================
+
+def iter_source_chunks(sources: List[str], chunker: str) -> Iterator[dict]:
+    """Chunk (dict page_content + metadata) của tất cả file nguồn"""
+    from IncrementalIngest import make_splitter, split_pdf
+
+    splitter = make_splitter(chunker)
+    for path in sources:
+        for doc in split_pdf(path, splitter):
+            yield {"page_content": doc.page_content, "metadata": dict(doc.metadata)}
+
+
+def spool_chunks(sources: List[str], chunker: str, spool_path: str) -> int:
+    """Ghi chunk ra file JSONL, id chunk = hash nội dung (giống nhau giữa các index)"""
+    n = 0
+    seen = set()
+    with open(spool_path, "w", encoding="utf-8") as f:
+        for chunk in iter_source_chunks(sources, chunker):
+            chunk_id = content_hash(chunk["page_content"])
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            chunk["id"] = chunk_id
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+def read_spool(spool_path: str, block_size: int) -> Iterator[List[dict]]:
+    with open(spool_path, encoding="utf-8") as f:
+        lines = (json.loads(line) for line in f)
+        while True:
+            block = list(islice(lines, block_size))
+            if not block:
+                return
+            yield block
+
+
+# =======================
+# 2. Build 1 model
+# =======================
+
+def build_one(model_name: str, folder: str, spool_path: str, n_chunks: int, settings: dict,
+              sources: List[str], device: str, normalize: bool = True, block_size: int = 4096,
+              chunk_seconds: Optional[float] = None, index_type: str = "flat",
+              parity_check: bool = False) -> dict:
+    from langchain_community.vectorstores import FAISS
+
+    timings: Dict[str, float] = {"chunk_seconds": chunk_seconds}
+    model_kwargs = {"device": device}
+    encode_kwargs = {"normalize_embeddings": normalize}
+
+    t0 = time.perf_counter()
+    embeddings = get_embeddings(model_name, model_kwargs, encode_kwargs)  # chờ warmup (nếu có)
+    timings["load_wait_seconds"] = time.perf_counter() - t0
+
+    # 1 pool worker (EMBED_WORKERS > 1) cho cả model, không tạo lại theo block
+    with BatchEmbedder(model_name, device=device, normalize=normalize, embeddings=embeddings) as embedder:
+        db = None
+        embed_seconds = index_seconds = 0.0
+        done = 0
+        for block in read_spool(spool_path, block_size):
+            texts = [c["page_content"] for c in block]
+            t1 = time.perf_counter()
+            vectors = embedder.embed(texts, verbose=False).tolist()
+            t2 = time.perf_counter()
+            pairs = list(zip(texts, vectors))
+            metadatas = [c["metadata"] for c in block]
+            ids = [c["id"] for c in block]
+            if db is None:
+                db = FAISS.from_embeddings(pairs, embeddings, metadatas=metadatas, ids=ids)
+            else:
+                db.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+            index_seconds += time.perf_counter() - t2
+            embed_seconds += t2 - t1
+            done += len(block)
+            print(f"\r⏳ [{model_name}] {done}/{n_chunks} chunk ({done / max(embed_seconds, 1e-9):.1f} chunk/s)", end="", flush=True)
+        print()
+        timings["embed_seconds"] = embed_seconds
+        timings["index_seconds"] = index_seconds
+
+        # So vector của BatchEmbedder với embed_documents trên vài chunk đầu
+        parity_max_diff = None
+        if parity_check:
+            sample = next(read_spool(spool_path, 64))
+            parity_max_diff = check_parity(embedder, embeddings, [c["page_content"] for c in sample])
+
+    # Index xấp xỉ: train trên vector flat vừa build, đo recall so với flat
+    recall = None
+    if parse_index_spec(index_type)[0] != "flat":
+        t_convert = time.perf_counter()
+        flat_vectors = store_vectors(db)
+        convert_store(db, index_type)
+        timings["convert_seconds"] = time.perf_counter() - t_convert
+        recall = recall_check(flat_vectors, db.index)
+        print_recall(recall)
+        del flat_vectors
+
+    t3 = time.perf_counter()
+    os.makedirs(folder, exist_ok=True)
+    db.save_local(folder)
+    write_mmap_store(db, folder)
+    write_lexical_index(db, folder)
+    timings["save_seconds"] = time.perf_counter() - t3
+    timings["total_seconds"] = time.perf_counter() - t0
+
+    load_seconds = next((s["load_seconds"] for s in model_stats() if s["model_name"] == model_name
+                         and s["load_seconds"] is not None), None)
+    manifest = {
+        "model_name": model_name,
+        "model_kwargs": model_kwargs,
+        "encode_kwargs": encode_kwargs,
+        "dimension": db.index.d,
+        "index_type": index_type,
+        "recall_vs_flat": recall,
+        "parity_max_diff": parity_max_diff,
+        "chunker": settings,
+        "sources": {path: file_hash(path) for path in sources},
+        "chunks": n_chunks,
+        "model_load_seconds": load_seconds,
+        "timings": timings,
+        "chunks_per_sec": n_chunks / embed_seconds if embed_seconds else None,
+        "built_at": datetime.datetime.now().isoformat(),
+    }
+    with open(os.path.join(folder, BUILD_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"✅ {model_name} -> {folder} ({timings['total_seconds']:.1f}s)")
+    return manifest
+
+
+# =======================
+# 3. Build nhiều model
+# =======================
+
+def build_all(models: List[dict], sources: List[str] = None, chunker: str = "recursive",
+              low_memory: bool = False, device: Optional[str] = None, index_type: str = "flat",
+              parity_check: bool = False) -> List[dict]:
+    """Chia chunk 1 lần rồi build index cho từng model trong models ({"model_name", "folder"})"""
+    sources = [os.path.normpath(s) for s in (sources or DEFAULT_SOURCES)]
+    device = device or detect_device()
+    settings = {"splitter": chunker, **SPLITTERS[chunker]}
+    parse_index_spec(index_type)  # báo lỗi spec sai trước khi load model
+
+    def kwargs_of(m):
+        return dict(model_name=m["model_name"], model_kwargs={"device": device},
+                    encode_kwargs={"normalize_embeddings": m.get("normalize", True)})
+
+    # Model đầu tiên load song song với bước chia chunk
+    if models:
+        warmup(**kwargs_of(models[0]))
+
+    manifests = []
+    with tempfile.TemporaryDirectory(prefix="build_indexes_") as tmp:
+        spool_path = os.path.join(tmp, "chunks.jsonl")
+        t0 = time.perf_counter()
+        n_chunks = spool_chunks(sources, chunker, spool_path)
+        chunk_seconds = time.perf_counter() - t0
+        print(f"✂️ {n_chunks} chunk ({chunker}) trong {chunk_seconds:.1f}s")
+        if n_chunks == 0:
+            raise ValueError(f"Không có chunk nào từ {sources} (PDF rỗng / chỉ có ảnh?), không build index")
+
+        for i, m in enumerate(models):
+            if not low_memory and i + 1 < len(models):
+                # Pipelined: load model kế tiếp trong lúc model hiện tại embed
+                warmup(**kwargs_of(models[i + 1]))
+            print(f"Processing model: {m['model_name']}")
+            manifest = build_one(m["model_name"], m["folder"], spool_path, n_chunks, settings, sources,
+                                 device, normalize=m.get("normalize", True), chunk_seconds=chunk_seconds,
+                                 index_type=m.get("index_type", index_type), parity_check=parity_check)
+            manifests.append(manifest)
+            if low_memory:
+                release(m["model_name"])
+                if i + 1 < len(models):
+                    warmup(**kwargs_of(models[i + 1]))
+    return manifests
+
+
+def _parse_model(spec: str) -> dict:
+    """"model_name:folder" -> {"model_name", "folder"}"""
+    model_name, _, folder = spec.rpartition(":")
+    if not model_name:
+        model_name, folder = spec, "vector_db_" + spec.split("/")[-1].lower().replace("-", "_")
+    return {"model_name": model_name, "folder": folder}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chia chunk 1 lần, build FAISS cho nhiều embedding model")
+    parser.add_argument("sources", nargs="*", default=DEFAULT_SOURCES)
+    parser.add_argument("--model", action="append", help="model_name:folder (lặp lại cho nhiều model)")
+    parser.add_argument("--chunker", choices=list(SPLITTERS), default="recursive")
+    parser.add_argument("--low-memory", action="store_true", help="Load từng model và giải phóng trước model sau")
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--index-type", default="flat", help='flat, "ivf:nlist=256", "hnsw:M=32", "pq:m=64", "ivfpq"')
+    parser.add_argument("--check-parity", action="store_true",
+                        help="So vector batch với embed_documents trên 64 chunk đầu (ghi vào manifest)")
+    args = parser.parse_args()
+
+    models = [_parse_model(s) for s in args.model] if args.model else DEFAULT_MODELS
+    build_all(models, args.sources, args.chunker, args.low_memory, args.device, args.index_type,
+              parity_check=args.check_parity)
+    print("All vector stores have been created and saved successfully!")
@@ -0,0 +1,207 @@
+# CandidateStore: kho hồ sơ thí sinh có cấu trúc, tra cứu chính xác bằng hash index
+#
+# Thay cho similarity_search trên vector_db_csv: tra (Tên, Lớp) qua dict -> O(1),
+# không cần embedding, không trả nhầm thí sinh có tên gần giống.
+# Nếu không khớp chính xác thì fallback sang so khớp mờ không dấu (Nguyen Van An ~ Nguyễn Văn An).
+import difflib
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+COL_NAME = "Tên"
+COL_CLASS = "Lớp"
+COL_MAJOR = "Chuyên ngành"
+COL_ATTENDANCE = "Điểm chuyên cần"
+COL_SCORE_40 = "Điểm 40%"
+
+FUZZY_CUTOFF = 0.85
+
+
+# =======================
+# 1. Chuẩn hóa key
+# =======================
+
+def normalize_key(text: str) -> str:
+    """NFC + bỏ khoảng trắng thừa + không phân biệt hoa thường"""
+    text = unicodedata.normalize("NFC", str(text))
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'Nguyễn Văn Đức' -> 'nguyen van duc'"""
+    text = unicodedata.normalize("NFD", normalize_key(text))
+    text = re.sub("[\u0300-\u036f]", "", text)
+    return text.replace("đ", "d")
+
+
+def _map_unique(s: pd.Series, fn) -> pd.Series:
+    """Áp dụng fn (các phép .str) trên giá trị duy nhất rồi map ngược lại -> rẻ khi cột lặp nhiều (Lớp, Họ)"""
+    codes, uniques = pd.factorize(s.astype(str))
+    mapped = fn(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)
+    return pd.Series(mapped[codes], index=s.index, dtype=object)
+
+
+def _normalize_values(s: pd.Series) -> pd.Series:
+    return (s.str.normalize("NFC")
+            .str.replace(r"\s+", " ", regex=True).str.strip().str.casefold())
+
+
+def _fold_values(s: pd.Series) -> pd.Series:
+    return (s.str.normalize("NFD")
+            .str.replace("[\u0300-\u036f]", "", regex=True).str.replace("đ", "d", regex=False))
+
+
+def _to_float(s: pd.Series) -> np.ndarray:
+    """Cột điểm -> float64, chấp nhận cả dấu phẩy thập phân ("6,7")"""
+    return pd.to_numeric(s.astype(str).str.replace(",", ".", regex=False), errors="coerce").to_numpy(np.float64)
+
+
+def parse_candidate_query(query: str) -> Tuple[str, Optional[str]]:
+    """'Hoàng Thị Oanh,QTKD2' -> ('Hoàng Thị Oanh', 'QTKD2')"""
+    name, _, class_name = query.partition(",")
+    return name.strip(), (class_name.strip() or None)
+
+
+# =======================
+# 2. Store
+# =======================
+
+@dataclass
+class CandidateRecord:
+    name: str
+    class_name: str
+    major: str
+    attendance: float
+    score_40: float
+
+    @property
+    def profile_text(self) -> str:
+        # Cùng format với CsVdataTest.row_to_text để prompt không đổi
+        return f"Họ tên: {self.name}, Lớp: {self.class_name}, " \
+               f"Chuyên ngành: {self.major}, " \
+               f"Điểm chuyên cần: {self.attendance}, " \
+               f"Điểm 40%: {self.score_40}, "
+
+
+class CandidateStore:
+    """Danh sách thí sinh dạng cột (numpy) + hash index trên (Tên, Lớp)"""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df.reset_index(drop=True)
+        n = len(self.df)
+
+        # Cột có kiểu rõ ràng
+        self.names = self.df[COL_NAME].astype(str).to_numpy(dtype=object)
+        self.classes = self.df[COL_CLASS].astype(str).to_numpy(dtype=object)
+        self.majors = self.df[COL_MAJOR].astype(str).to_numpy(dtype=object)
+        self.attendance = _to_float(self.df[COL_ATTENDANCE])
+        self.score_40 = _to_float(self.df[COL_SCORE_40])
+
+        # Hash index (vectorized, không dùng iterrows)
+        name_keys = _map_unique(self.df[COL_NAME], _normalize_values)
+        class_keys = _map_unique(self.df[COL_CLASS], _normalize_values)
+        folded_names = _map_unique(name_keys, _fold_values)
+        positions = pd.Series(np.arange(n))
+
+        self._by_name_class: Dict[Tuple[str, str], int] = dict(zip(zip(name_keys, class_keys), range(n)))
+        self._by_name: Dict[str, np.ndarray] = positions.groupby(name_keys.to_numpy()).indices if n else {}
+        self._by_folded: Dict[str, np.ndarray] = positions.groupby(folded_names.to_numpy()).indices if n else {}
+        self._class_keys = class_keys.to_numpy(dtype=object)
+        self._folded_names = folded_names.to_numpy(dtype=object)
+
+        # Inverted index token (không dấu) -> các tên không dấu, dùng để thu hẹp so khớp mờ
+        self._token_index: Dict[str, List[str]] = {}
+        for folded in self._by_folded:
+            for token in set(folded.split()):
+                self._token_index.setdefault(token, []).append(folded)
+
+    @classmethod
+    def from_csv(cls, path: str = "danhsach_thisinh.csv") -> "CandidateStore":
+        df = pd.read_csv(path, encoding="utf-8-sig", dtype={COL_NAME: str, COL_CLASS: str, COL_MAJOR: str})
+        return cls(df)
+
+    def __len__(self):
+        return len(self.df)
+
+    def record(self, i: int) -> CandidateRecord:
+        return CandidateRecord(
+            name=self.names[i],
+            class_name=self.classes[i],
+            major=self.majors[i],
+            attendance=float(self.attendance[i]),
+            score_40=float(self.score_40[i]),
+        )
+
+    def profile_texts(self) -> List[str]:
+        """Text mô tả của toàn bộ thí sinh (vectorized), dùng cho CsVdataTest.py"""
+        df = self.df
+        return ("Họ tên: " + df[COL_NAME].astype(str) + ", Lớp: " + df[COL_CLASS].astype(str) + ", "
+                + "Chuyên ngành: " + df[COL_MAJOR].astype(str) + ", "
+                + "Điểm chuyên cần: " + df[COL_ATTENDANCE].astype(str) + ", "
+                + "Điểm 40%: " + df[COL_SCORE_40].astype(str) + ", ").tolist()
+
+    # ============ Lookup ============
+    def lookup(self, name: str, class_name: Optional[str] = None) -> Optional[int]:
+        """Tra cứu chính xác (không phân biệt hoa thường / khoảng trắng), trả về vị trí dòng"""
+        name_key = normalize_key(name)
+        if class_name:
+            return self._by_name_class.get((name_key, normalize_key(class_name)))
+        matches = self._by_name.get(name_key)
+        if matches is not None and len(matches) == 1:
+            return int(matches[0])
+        if matches is not None:
+            raise ValueError(f"Có {len(matches)} thí sinh tên '{name}', cần ghi rõ lớp (vd: '{name},Lớp')")
+        return None
+
+    def _filter_class(self, positions, class_name: Optional[str]) -> List[int]:
+        if not class_name:
+            return [int(p) for p in positions]
+        class_key = normalize_key(class_name)
+        return [int(p) for p in positions if self._class_keys[p] == class_key]
+
+    def fuzzy_lookup(self, name: str, class_name: Optional[str] = None) -> Optional[int]:
+        """So khớp không dấu, sau đó so khớp gần đúng (difflib) trên các tên có chung token"""
+        folded = fold_diacritics(name)
+        positions = self._filter_class(self._by_folded.get(folded, []), class_name)
+        if len(positions) == 1:
+            return positions[0]
+
+        # Lấy 2 token hiếm nhất (thường là tên riêng) để thu hẹp tập ứng viên
+        tokens = sorted((t for t in set(folded.split()) if t in self._token_index),
+                        key=lambda t: len(self._token_index[t]))
+        candidates = set()
+        for token in tokens[:2]:
+            candidates.update(self._token_index.get(token, []))
+        if not candidates:
+            return None
+
+        for match in difflib.get_close_matches(folded, list(candidates), n=5, cutoff=FUZZY_CUTOFF):
+            positions = self._filter_class(self._by_folded[match], class_name)
+            if len(positions) == 1:
+                return positions[0]
+        return None
+
+    def find(self, query: str) -> CandidateRecord:
+        """Tìm thí sinh theo 'Tên,Lớp' (hoặc chỉ 'Tên'), raise ValueError nếu không tìm thấy"""
+        name, class_name = parse_candidate_query(query)
+        i = self.lookup(name, class_name)
+        if i is None:
+            i = self.fuzzy_lookup(name, class_name)
+        if i is None:
+            raise ValueError(f"Không tìm thấy hồ sơ cho {query}")
+        return self.record(i)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    store = CandidateStore.from_csv()
+    query = sys.argv[1] if len(sys.argv) > 1 else "Hoang Thi Oanh,QTKD2"
+    start = time.perf_counter()
+    record = store.find(query)
+    print(f"🔎 {query} -> {record.profile_text} ({(time.perf_counter() - start) * 1000:.3f} ms)")
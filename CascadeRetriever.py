@@ -0,0 +1,366 @@
+# CascadeRetriever: retrieval 2 tầng, model nhỏ lấy nhiều ứng viên + e5-large (hoặc cross-encoder) xếp lại
+#
+#   python BuildIndexes.py --model sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2:vector_db_minilm \
+#                          --model intfloat/multilingual-e5-large-instruct:vector_db_e5_large
+#   python CascadeRetriever.py --recall vector_db_minilm --rerank vector_db_e5_large --fetch-k 20,50,100
+#   python CascadeRetriever.py ... --cross-encoder BAAI/bge-reranker-v2-m3     # rerank bằng cross-encoder
+#   CASCADE_RECALL_DB=vector_db_minilm_nltk python LLMInterviewer2_fixed.py    # interviewer dùng cascade
+#
+# Tầng 1 (recall): embed query bằng model nhỏ, search fetch_k chunk trên store của model đó.
+# Tầng 2 (rerank): chỉ chấm điểm fetch_k ứng viên. Với e5, vector của chunk lấy thẳng từ store e5
+# (FAISS reconstruct) theo docstore id: BuildIndexes đặt id = hash nội dung nên id của 2 store trùng nhau.
+# Store cũ có id uuid thì tra theo hash nội dung (dựng 1 lần); chunk không có trong store e5 mới phải
+# embed lúc query (có cache). Query e5 được embed song song với tầng 1.
+#
+# Vì vậy 2 store phải được build từ cùng bộ chunk (cùng --chunker), vd cho KNOWLEDGE_DB_PATH (nltk):
+#   python BuildIndexes.py --chunker nltk --model sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2:vector_db_minilm_nltk
+# Báo cáo so với e5 đơn thuần: recall@k / MRR trên bộ query có nhãn, tỉ lệ top-k trùng với e5, tỉ lệ top-k
+# của e5 nằm trong tập ứng viên, độ trễ p50 / p95 và thời gian từng tầng.
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from EmbeddingRegistry import DEFAULT_MODEL, load_faiss
+from IncrementalIngest import content_hash
+
+DEFAULT_K = 5
+DEFAULT_FETCH_K = 50
+DEFAULT_RECALL_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+DEFAULT_CROSS_ENCODER = "BAAI/bge-reranker-v2-m3"
+MAX_EMBEDDED_CHUNKS = 4096  # cache vector e5 của các chunk phải embed lúc query
+
+
+# =======================
+# 1. Reranker
+# =======================
+
+def _reconstruct(index, positions: List[int]) -> np.ndarray:
+    """Vector gốc tại các vị trí (flat, HNSW, mmap; IVF cần direct map, dựng 1 lần)"""
+    try:
+        return np.stack([index.reconstruct(int(p)) for p in positions])
+    except RuntimeError:
+        import faiss
+
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is None:
+            raise
+        ivf.make_direct_map()
+        return np.stack([index.reconstruct(int(p)) for p in positions])
+
+
+class VectorReranker:
+    """Xếp lại theo khoảng cách L2 (cùng metric với FAISS store) trong không gian vector của store lớn"""
+
+    name = "vector"
+
+    def __init__(self, db):
+        self.db = db
+        self._by_id: Optional[Dict[str, int]] = None
+        self._by_hash: Optional[Dict[str, int]] = None
+        self._embedded: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"by_id": 0, "by_hash": 0, "embedded": 0}
+
+    def prepare(self, query: str) -> np.ndarray:
+        return np.asarray(self.db.embeddings.embed_query(query), dtype=np.float32)
+
+    def _position_maps(self, need_hash: bool) -> Tuple[Dict[str, int], Optional[Dict[str, int]]]:
+        with self._lock:
+            if self._by_id is None:
+                self._by_id = {str(doc_id): pos for pos, doc_id in self.db.index_to_docstore_id.items()}
+            if need_hash and self._by_hash is None:
+                start = time.perf_counter()
+                self._by_hash = {}
+                for pos, doc_id in self.db.index_to_docstore_id.items():
+                    doc = self.db.docstore.search(doc_id)
+                    if hasattr(doc, "page_content"):
+                        self._by_hash.setdefault(content_hash(doc.page_content), pos)
+                print(f"🔗 Map hash nội dung -> vị trí cho {len(self._by_hash)} chunk "
+                      f"({time.perf_counter() - start:.1f}s)")
+            return self._by_id, self._by_hash
+
+    def _vectors(self, candidates: List[Tuple[str, Document]]) -> np.ndarray:
+        by_id, by_hash = self._position_maps(need_hash=False)
+        positions: List[Optional[int]] = [by_id.get(doc_id) for doc_id, _ in candidates]
+        hashes = [content_hash(doc.page_content) if pos is None else None
+                  for pos, (_, doc) in zip(positions, candidates)]
+        if any(h is not None for h in hashes):
+            _, by_hash = self._position_maps(need_hash=True)
+            positions = [by_hash.get(h) if h is not None else pos for pos, h in zip(positions, hashes)]
+        self.stats["by_id"] += sum(h is None for h in hashes)
+        self.stats["by_hash"] += sum(h is not None and pos is not None for pos, h in zip(positions, hashes))
+
+        vectors = np.empty((len(candidates), self.db.index.d), dtype=np.float32)
+        found = [i for i, pos in enumerate(positions) if pos is not None]
+        if found:
+            vectors[found] = _reconstruct(self.db.index, [positions[i] for i in found])
+
+        missing = [i for i, pos in enumerate(positions) if pos is None]
+        with self._lock:
+            to_embed = [i for i in missing if hashes[i] not in self._embedded]
+        if to_embed:
+            embedded = self.db.embeddings.embed_documents([candidates[i][1].page_content for i in to_embed])
+            self.stats["embedded"] += len(to_embed)
+            with self._lock:
+                for i, vector in zip(to_embed, embedded):
+                    self._embedded[hashes[i]] = np.asarray(vector, dtype=np.float32)
+                    while len(self._embedded) > MAX_EMBEDDED_CHUNKS:
+                        self._embedded.popitem(last=False)
+        with self._lock:
+            for i in missing:
+                vectors[i] = self._embedded[hashes[i]]
+        return vectors
+
+    def score(self, query_vector: np.ndarray, candidates: List[Tuple[str, Document]]) -> np.ndarray:
+        """Điểm càng lớn càng liên quan (= -khoảng cách L2 bình phương)"""
+        vectors = self._vectors(candidates)
+        return -((vectors - query_vector) ** 2).sum(axis=1)
+
+
+class CrossEncoderReranker:
+    """Xếp lại bằng cross-encoder (sentence_transformers.CrossEncoder) trên cặp (query, chunk)"""
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER, device: Optional[str] = None,
+                 batch_size: int = 32):
+        from sentence_transformers import CrossEncoder
+
+        from EmbeddingEngine import detect_device
+
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, device=device or detect_device())
+        self.batch_size = batch_size
+        self.stats: Dict[str, int] = {}
+
+    def prepare(self, query: str) -> str:
+        return query
+
+    def score(self, query: str, candidates: List[Tuple[str, Document]]) -> np.ndarray:
+        pairs = [(query, doc.page_content) for _, doc in candidates]
+        return np.asarray(self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False),
+                          dtype=np.float32)
+
+
+# =======================
+# 2. Cascade
+# =======================
+
+class CascadeRetriever:
+    """recall_db (model nhỏ) lấy fetch_k ứng viên, reranker giữ lại k chunk tốt nhất"""
+
+    def __init__(self, recall_db, reranker, k: int = DEFAULT_K, fetch_k: int = DEFAULT_FETCH_K,
+                 parallel: bool = True):
+        self.recall_db = recall_db
+        self.reranker = reranker
+        self.k = k
+        self.fetch_k = fetch_k
+        # Embed query cho tầng 2 trong lúc tầng 1 chạy (forward của torch nhả GIL)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cascade-rerank") if parallel else None
+        self.last_timings: Dict[str, float] = {}
+
+    def recall(self, query: str, fetch_k: int) -> List[Tuple[str, Document]]:
+        """Top fetch_k (docstore id, Document) của store model nhỏ"""
+        vector = np.asarray([self.recall_db.embeddings.embed_query(query)], dtype=np.float32)
+        if getattr(self.recall_db, "_normalize_L2", False):
+            vector /= np.maximum(np.linalg.norm(vector, axis=1, keepdims=True), 1e-12)
+        _, positions = self.recall_db.index.search(vector, min(fetch_k, self.recall_db.index.ntotal))
+        candidates = []
+        for pos in positions[0]:
+            if pos < 0:
+                continue
+            doc_id = self.recall_db.index_to_docstore_id[int(pos)]
+            doc = self.recall_db.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                candidates.append((str(doc_id), doc))
+        return candidates
+
+    def search_with_scores(self, query: str, k: Optional[int] = None,
+                           fetch_k: Optional[int] = None) -> List[Tuple[Document, float]]:
+        k = k or self.k
+        fetch_k = max(fetch_k or self.fetch_k, k)
+        start = time.perf_counter()
+        prepared_future = self._executor.submit(self.reranker.prepare, query) if self._executor else None
+        candidates = self.recall(query, fetch_k)
+        recalled = time.perf_counter()
+        prepared = prepared_future.result() if prepared_future else self.reranker.prepare(query)
+        prepared_at = time.perf_counter()
+        scores = self.reranker.score(prepared, candidates) if candidates else np.zeros(0)
+        order = np.argsort(-scores, kind="stable")[:k]
+        done = time.perf_counter()
+        self.last_timings = {
+            "recall_ms": (recalled - start) * 1000,
+            "prepare_wait_ms": (prepared_at - recalled) * 1000,
+            "rerank_ms": (done - prepared_at) * 1000,
+            "total_ms": (done - start) * 1000,
+            "candidates": len(candidates),
+        }
+        return [(candidates[i][1], float(scores[i])) for i in order]
+
+    def search(self, query: str, k: Optional[int] = None, fetch_k: Optional[int] = None) -> List[Document]:
+        return [doc for doc, _ in self.search_with_scores(query, k, fetch_k)]
+
+    def similarity_search(self, query: str, k: int = DEFAULT_K, **kwargs) -> List[Document]:
+        """Cùng chữ ký với FAISS.similarity_search (fetch_k truyền qua kwargs)"""
+        return self.search(query, k, kwargs.get("fetch_k"))
+
+    def as_retriever(self, search_kwargs: Optional[dict] = None, **kwargs) -> "CascadeLangchainRetriever":
+        """Giống FAISS.as_retriever: search_kwargs={"k": 5, "fetch_k": 50}"""
+        search_kwargs = search_kwargs or {}
+        return CascadeLangchainRetriever(cascade=self, k=search_kwargs.get("k", self.k),
+                                         fetch_k=search_kwargs.get("fetch_k", self.fetch_k), **kwargs)
+
+
+class CascadeLangchainRetriever(BaseRetriever):
+    """Retriever langchain (invoke / batch / chain) bọc CascadeRetriever"""
+
+    cascade: Any
+    k: int = DEFAULT_K
+    fetch_k: int = DEFAULT_FETCH_K
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.cascade.search(query, self.k, self.fetch_k)
+
+
+def _store_model(folder: str, default: str) -> str:
+    from RetrievalBenchmark import read_build_manifest
+
+    return (read_build_manifest(folder) or {}).get("model_name") or default
+
+
+def load_cascade(recall_folder: str, rerank_folder: str, recall_model: Optional[str] = None,
+                 rerank_model: Optional[str] = None, cross_encoder: Optional[str] = None,
+                 k: int = DEFAULT_K, fetch_k: int = DEFAULT_FETCH_K, query_cache: bool = True,
+                 rerank_db=None) -> CascadeRetriever:
+    """Load 2 store qua EmbeddingRegistry (model lấy từ build_manifest.json nếu không truyền).
+
+    rerank_db: store lớn đã load sẵn (vd knowledge_db của interviewer) thay cho rerank_folder.
+    """
+    recall_model = recall_model or _store_model(recall_folder, DEFAULT_RECALL_MODEL)
+    recall_db = load_faiss(recall_folder, recall_model, query_cache=query_cache)
+    if cross_encoder:
+        reranker = CrossEncoderReranker(cross_encoder)
+    else:
+        if rerank_db is None:
+            rerank_model = rerank_model or _store_model(rerank_folder, DEFAULT_MODEL)
+            rerank_db = load_faiss(rerank_folder, rerank_model, query_cache=query_cache)
+        reranker = VectorReranker(rerank_db)
+    return CascadeRetriever(recall_db, reranker, k=k, fetch_k=fetch_k)
+
+
+# =======================
+# 3. So sánh với e5 đơn thuần
+# =======================
+
+def _texts(docs: List[Document]) -> List[str]:
+    return [doc.page_content for doc in docs]
+
+
+def evaluate(cascade: CascadeRetriever, baseline_db, queries: List[dict], k: int = DEFAULT_K,
+             fetch_ks: Tuple[int, ...] = (DEFAULT_FETCH_K,), repeats: int = 3) -> dict:
+    """Chất lượng + độ trễ của e5 đơn thuần (baseline_db) và cascade với từng fetch_k"""
+    from RetrievalBenchmark import first_relevant_rank, percentiles_ms, score_ranks
+
+    # Làm nóng cả 2 model (không tính vào độ trễ)
+    baseline_db.similarity_search(queries[0]["query"], k=k)
+    cascade.search(queries[0]["query"], k, max(fetch_ks))
+
+    baseline_top, ranks, latencies = [], [], []
+    for q in queries:
+        docs = baseline_db.similarity_search(q["query"], k=k)
+        baseline_top.append(_texts(docs))
+        ranks.append(first_relevant_rank(_texts(docs), q["relevant"]))
+    for _ in range(repeats):
+        for q in queries:
+            start = time.perf_counter()
+            baseline_db.similarity_search(q["query"], k=k)
+            latencies.append(time.perf_counter() - start)
+    report = {"k": k, "queries": len(queries), "reranker": cascade.reranker.name,
+              "e5_only": {**score_ranks(ranks, k), "latency": percentiles_ms(latencies)}, "cascade": []}
+
+    for fetch_k in fetch_ks:
+        ranks, overlap, coverage, latencies = [], [], [], []
+        stages = {"recall_ms": [], "prepare_wait_ms": [], "rerank_ms": []}
+        for q, truth in zip(queries, baseline_top):
+            docs = cascade.search(q["query"], k, fetch_k)
+            ranks.append(first_relevant_rank(_texts(docs), q["relevant"]))
+            overlap.append(len(set(_texts(docs)) & set(truth)) / max(len(truth), 1))
+            pool = {doc.page_content for _, doc in cascade.recall(q["query"], fetch_k)}
+            coverage.append(len(pool & set(truth)) / max(len(truth), 1))
+        for _ in range(repeats):
+            for q in queries:
+                start = time.perf_counter()
+                cascade.search(q["query"], k, fetch_k)
+                latencies.append(time.perf_counter() - start)
+                for name in stages:
+                    stages[name].append(cascade.last_timings[name])
+        report["cascade"].append({
+            "fetch_k": fetch_k,
+            **score_ranks(ranks, k),
+            f"overlap@{k}_e5": float(np.mean(overlap)),
+            f"e5_top{k}_in_pool": float(np.mean(coverage)),
+            "latency": percentiles_ms(latencies),
+            "stages_ms": {name: float(np.mean(values)) for name, values in stages.items()},
+        })
+    report["reranker_stats"] = dict(cascade.reranker.stats)
+    return report
+
+
+def print_evaluation(report: dict):
+    k = report["k"]
+    print(f"\n📊 Cascade ({report['reranker']}) so với e5 đơn thuần, {report['queries']} query, k={k}")
+    print(f"{'':<16}{f'recall@{k}':>10}{f'MRR@{k}':>9}{'trùng e5':>10}{'e5 trong pool':>15}{'p50':>10}{'p95':>10}")
+    e5 = report["e5_only"]
+    print(f"{'e5-only':<16}{e5[f'recall@{k}']:>10.3f}{e5[f'mrr@{k}']:>9.3f}{'-':>10}{'-':>15}"
+          f"{e5['latency']['p50_ms']:>8.1f}ms{e5['latency']['p95_ms']:>8.1f}ms")
+    for r in report["cascade"]:
+        print(f"{'fetch_k=' + str(r['fetch_k']):<16}{r[f'recall@{k}']:>10.3f}{r[f'mrr@{k}']:>9.3f}"
+              f"{r[f'overlap@{k}_e5']:>10.3f}{r[f'e5_top{k}_in_pool']:>15.3f}"
+              f"{r['latency']['p50_ms']:>8.1f}ms{r['latency']['p95_ms']:>8.1f}ms")
+        s = r["stages_ms"]
+        print(f"{'':<16}recall {s['recall_ms']:.1f} ms | chờ query e5 {s['prepare_wait_ms']:.1f} ms | "
+              f"rerank {s['rerank_ms']:.1f} ms")
+    stats = report.get("reranker_stats") or {}
+    if stats:
+        print(f"🔗 Vector ứng viên: {stats['by_id']} theo id, {stats['by_hash']} theo hash nội dung, "
+              f"{stats['embedded']} phải embed lúc query")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from RetrievalBenchmark import QUERIES_FILE, load_queries
+
+    parser = argparse.ArgumentParser(description="Retrieval 2 tầng: model nhỏ recall + e5 / cross-encoder rerank")
+    parser.add_argument("--recall", default="vector_db_minilm", help="Store của model nhỏ")
+    parser.add_argument("--rerank", default="vector_db_e5_large", help="Store e5 (vector rerank + baseline)")
+    parser.add_argument("--recall-model", default=None, help="Mặc định lấy từ build_manifest.json")
+    parser.add_argument("--rerank-model", default=None)
+    parser.add_argument("--cross-encoder", nargs="?", const=DEFAULT_CROSS_ENCODER, default=None)
+    parser.add_argument("--fetch-k", default=str(DEFAULT_FETCH_K), help="Danh sách fetch_k, vd 20,50,100")
+    parser.add_argument("-k", type=int, default=DEFAULT_K)
+    parser.add_argument("--queries", default=QUERIES_FILE)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Ghi báo cáo JSON")
+    args = parser.parse_args()
+
+    # Không dùng query cache để độ trễ đo đúng 1 lần forward mỗi query
+    cascade = load_cascade(args.recall, args.rerank, args.recall_model, args.rerank_model, args.cross_encoder,
+                           k=args.k, query_cache=False)
+    baseline = load_faiss(args.rerank, args.rerank_model or _store_model(args.rerank, DEFAULT_MODEL))
+    report = evaluate(cascade, baseline, load_queries(args.queries), args.k,
+                      tuple(int(x) for x in args.fetch_k.split(",")), args.repeats)
+    print_evaluation(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Đã ghi {args.output}")
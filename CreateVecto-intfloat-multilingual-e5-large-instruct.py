@@ -3,10 +3,20 @@
 
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from EmbeddingEngine import BatchEmbedder, build_faiss, check_parity
+from EmbeddingRegistry import get_embeddings, warmup
 import os
 
+model_name = "intfloat/multilingual-e5-large-instruct"
+warmup(model_name)  # load model ở background trong lúc đọc PDF
+
+# INCREMENTAL=1: chỉ embed chunk mới/thay đổi, cập nhật index có sẵn (xem IncrementalIngest.py)
+if os.environ.get("INCREMENTAL", "0") == "1":
+    from IncrementalIngest import ingest
+
+    ingest("vector_db2", ["Chương 2 Biến, hằng và kiểu dữ liệu.pdf"], "recursive", model_name, encode_kwargs={})
+    raise SystemExit(0)
+
 # Load PDF
 loader = PyPDFLoader("Chương 2 Biến, hằng và kiểu dữ liệu.pdf")
 documents = loader.load()
@@ -47,13 +57,26 @@ docs = text_splitter.split_documents(documents)
 # db.save_local(save_path)
 
 # model khác
-model_name = "intfloat/multilingual-e5-large-instruct"
-# Embedding
-embeddings = HuggingFaceEmbeddings(model_name=model_name)
+# Embedding (đã warmup ở đầu file)
+embeddings = get_embeddings(model_name)
 # Note: If you want to use a different model, you can change the model_name parameter.
 
-# Vector store (FAISS)
-db = FAISS.from_documents(docs, embeddings)
+# Vector store (FAISS), embed theo batch (EMBED_BATCH_SIZE, EMBED_WORKERS)
+embedder = BatchEmbedder(model_name, normalize=False, embeddings=embeddings)
+db = build_faiss([d.page_content for d in docs], [d.metadata for d in docs], embeddings, embedder)
+# CHECK_PARITY=1: so vector batch với embed_documents (đường serial) trên vài chunk đầu
+if os.environ.get("CHECK_PARITY", "0") == "1":
+    check_parity(embedder, embeddings, [d.page_content for d in docs])
+embedder.close()  # dừng worker process (EMBED_WORKERS > 1)
+
+# INDEX_TYPE=ivf / hnsw / pq / ivfpq (vd "ivf:nlist=256"): đổi sang index xấp xỉ cho corpus lớn
+index_type = os.environ.get("INDEX_TYPE", "flat")
+if index_type != "flat":
+    from FaissIndexFactory import convert_store, print_recall, recall_check, store_vectors
+
+    flat_vectors = store_vectors(db)
+    convert_store(db, index_type)
+    print_recall(recall_check(flat_vectors, db.index))
 
 # Save to disk (create folder if not exists)
 save_path = "vector_db2"
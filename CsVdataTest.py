@@ -1,24 +1,21 @@
 import os
 
-import pandas as pd
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 
-# 1. Đọc dữ liệu CSV
-df = pd.read_csv("danhsach_thisinh.csv")
+from CandidateStore import CandidateStore
+from EmbeddingRegistry import get_embeddings
 
-# 2. Chuyển thành text mô tả từng thí sinh
-def row_to_text(row):
-    return f"Họ tên: {row['Tên']}, Lớp: {row['Lớp']}, " \
-           f"Chuyên ngành: {row['Chuyên ngành']}, " \
-           f"Điểm chuyên cần: {row['Điểm chuyên cần']}, " \
-           f"Điểm 40%: {row['Điểm 40%']}, " \
+# Lưu ý: interviewer tra hồ sơ bằng CandidateStore (hash index trên Tên, Lớp),
+# vector_db_csv chỉ còn dùng cho tìm kiếm ngữ nghĩa / thử nghiệm.
 
+# 1. Đọc dữ liệu CSV
+store = CandidateStore.from_csv("danhsach_thisinh.csv")
 
-texts = [row_to_text(r) for _, r in df.iterrows()]
+# 2. Chuyển thành text mô tả từng thí sinh (vectorized, không dùng iterrows)
+texts = store.profile_texts()
 
 # 3. Khởi tạo embedding model
-embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large-instruct")
+embeddings = get_embeddings()
 
 # 4. Tạo vector store từ text
 vectorstore = FAISS.from_texts(texts, embeddings)
@@ -0,0 +1,202 @@
+# EmbeddingEngine: embed chunk theo batch cho các script build index
+#
+# - Tự chọn device (cuda / mps / cpu), ghi đè bằng biến môi trường EMBEDDING_DEVICE
+# - Sắp chunk theo độ dài trước khi chia batch (giống SentenceTransformer.encode) để giảm padding
+# - Trên CPU có thể chạy nhiều process, mỗi process 1 bản model + 1 phần số core; pool giữ nguyên giữa
+#   các lần embed() (model chỉ load 1 lần / worker), đóng bằng close() hoặc dùng "with BatchEmbedder(...)"
+# - In tiến độ và throughput (chunk/s)
+#
+# Batch được chia giống hệt đường serial (embeddings.embed_documents) nên vector thu được
+# trùng với cách build cũ; check_parity() dùng để kiểm tra lại.
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def _env_workers() -> int:
+    """EMBED_WORKERS=N hoặc "auto" (1 process cho mỗi 4 core)"""
+    value = os.environ.get("EMBED_WORKERS", "1")
+    if value == "auto":
+        return max(1, (os.cpu_count() or 1) // 4)
+    return int(value)
+
+
+DEFAULT_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "32"))
+DEFAULT_WORKERS = _env_workers()
+
+
+def detect_device() -> str:
+    """cuda nếu có GPU, mps trên Mac, còn lại cpu"""
+    device = os.environ.get("EMBEDDING_DEVICE")
+    if device:
+        return device
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def length_sorted_batches(texts: Sequence[str], batch_size: int) -> List[np.ndarray]:
+    """Chia batch theo thứ tự độ dài giảm dần (cùng cách sắp của SentenceTransformer.encode)"""
+    order = np.argsort([-len(t) for t in texts])
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+# =======================
+# 1. Worker process (CPU)
+# =======================
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, num_threads: int):
+    global _worker_model
+    from EmbeddingRegistry import resolve_backend
+
+    backend = resolve_backend(model_name)  # process con: EMBEDDING_BACKEND kế thừa từ biến môi trường
+    if backend in ("onnx", "onnx-int8"):
+        from OnnxEmbeddings import load_onnx_embeddings
+
+        _worker_model = load_onnx_embeddings(model_name, quantized=backend == "onnx-int8", num_threads=num_threads)
+        return
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(num_threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_batch(batch_id: int, texts: List[str], normalize: bool):
+    vectors = _worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=normalize,
+                                   convert_to_numpy=True, show_progress_bar=False)
+    return batch_id, vectors.astype(np.float32)
+
+
+# =======================
+# 2. Engine
+# =======================
+
+class BatchEmbedder:
+    """Embed danh sách chunk theo batch, 1 process hoặc pool nhiều process CPU (tạo ở lần embed đầu)"""
+
+    def __init__(self, model_name: str, batch_size: int = DEFAULT_BATCH_SIZE, workers: int = DEFAULT_WORKERS,
+                 device: Optional[str] = None, normalize: bool = True, embeddings=None):
+        self.model_name = model_name
+        self.embeddings = embeddings  # instance có sẵn (registry) cho đường 1 process
+        self.batch_size = batch_size
+        self.device = device or detect_device()
+        # Nhiều process chỉ có lợi trên CPU
+        self.workers = max(1, workers) if self.device == "cpu" else 1
+        self.normalize = normalize
+        self.last_stats: dict = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "BatchEmbedder":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Dừng các worker process (nếu có)"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _worker_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(self.model_name, threads))
+        return self._pool
+
+    def _embeddings(self):
+        if self.embeddings is None:
+            from EmbeddingRegistry import get_embeddings
+
+            self.embeddings = get_embeddings(self.model_name, {"device": self.device},
+                                             {"normalize_embeddings": self.normalize})
+        return self.embeddings
+
+    def _report(self, done: int, total: int, start: float):
+        elapsed = time.perf_counter() - start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"\r⏳ Embed {done}/{total} chunk ({rate:.1f} chunk/s)", end="", flush=True)
+
+    def embed(self, texts: Sequence[str], verbose: bool = True) -> np.ndarray:
+        """Trả về ma trận (len(texts), dim) float32 theo đúng thứ tự đầu vào"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        batches = length_sorted_batches(texts, self.batch_size)
+        results = {}
+        start = time.perf_counter()
+        done = 0
+
+        if self.workers == 1:
+            embeddings = self._embeddings()
+            for batch_id, idx in enumerate(batches):
+                results[batch_id] = np.asarray(embeddings.embed_documents([texts[i] for i in idx]), dtype=np.float32)
+                done += len(idx)
+                if verbose:
+                    self._report(done, len(texts), start)
+        else:
+            pool = self._worker_pool()
+            futures = [pool.submit(_encode_batch, batch_id, [texts[i] for i in idx], self.normalize)
+                       for batch_id, idx in enumerate(batches)]
+            for future in as_completed(futures):
+                batch_id, vectors = future.result()
+                results[batch_id] = vectors
+                done += len(batches[batch_id])
+                if verbose:
+                    self._report(done, len(texts), start)
+
+        dim = results[0].shape[1]
+        out = np.empty((len(texts), dim), dtype=np.float32)
+        for batch_id, idx in enumerate(batches):
+            out[idx] = results[batch_id]
+
+        seconds = time.perf_counter() - start
+        self.last_stats = {
+            "model_name": self.model_name,
+            "device": self.device,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "chunks": len(texts),
+            "seconds": seconds,
+            "chunks_per_sec": len(texts) / seconds if seconds > 0 else 0.0,
+        }
+        if verbose:
+            print(f"\n✅ Embed {len(texts)} chunk trong {seconds:.1f}s "
+                  f"({self.last_stats['chunks_per_sec']:.1f} chunk/s, {self.workers} process, {self.device})")
+        return out
+
+
+def build_faiss(texts: List[str], metadatas: Optional[List[dict]], embeddings, embedder: BatchEmbedder,
+                ids: Optional[List[str]] = None):
+    """Tương đương FAISS.from_texts(texts, embeddings, metadatas) nhưng embed bằng BatchEmbedder"""
+    from langchain_community.vectorstores import FAISS
+
+    vectors = embedder.embed(texts)
+    return FAISS.from_embeddings(list(zip(texts, vectors.tolist())), embeddings, metadatas=metadatas, ids=ids)
+
+
+def check_parity(embedder: BatchEmbedder, embeddings, texts: Sequence[str], sample: int = 64) -> float:
+    """So sánh vector của engine với embeddings.embed_documents (đường serial), trả về sai số lớn nhất"""
+    texts = list(texts)[:sample]
+    ours = embedder.embed(texts)
+    serial = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    max_diff = float(np.max(np.abs(ours - serial))) if len(texts) else 0.0
+    status = "✅" if max_diff < 1e-4 else "⚠️"
+    print(f"{status} Parity với đường serial: max |diff| = {max_diff:.2e} trên {len(texts)} chunk")
+    return max_diff
+
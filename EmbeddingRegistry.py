@@ -0,0 +1,263 @@
+# EmbeddingRegistry: load mỗi embedding model tối đa 1 lần / process và dùng chung cho mọi FAISS store
+#
+#   from EmbeddingRegistry import get_embeddings, load_faiss, warmup
+#   warmup()                                   # load model ở background
+#   db = load_faiss("vector_db2chunk_nltk")    # FAISS dùng chung instance embeddings (mmap nếu có)
+#   print_model_stats()                        # thời gian load + RAM của từng model
+#
+# EMBEDDING_BACKEND=torch (mặc định, HuggingFaceEmbeddings) | onnx | onnx-int8 (OnnxEmbeddings, cần export trước;
+# model chưa export vẫn chạy torch)
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODEL = "intfloat/multilingual-e5-large-instruct"
+# Dùng định dạng mmap (MmapVectorStore) khi store có và còn khớp index.faiss; MMAP_STORE=0 để tắt
+USE_MMAP_STORE = os.environ.get("MMAP_STORE", "1") == "1"
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+
+
+# =======================
+# 1. Đo bộ nhớ process
+# =======================
+
+def current_rss_mb() -> Optional[float]:
+    """RSS hiện tại của process (MB), None nếu không đo được"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# =======================
+# 2. Registry
+# =======================
+
+class _ModelEntry:
+    def __init__(self, model_name: str, model_kwargs: dict, encode_kwargs: dict):
+        self.model_name = model_name
+        self.model_kwargs = model_kwargs
+        self.encode_kwargs = encode_kwargs
+        self.backend = resolve_backend(model_name)
+        self.future: Future = Future()
+        self.load_seconds: Optional[float] = None
+        self.rss_delta_mb: Optional[float] = None
+
+
+_lock = threading.Lock()
+_load_lock = threading.Lock()  # load tuần tự để đo RAM của từng model cho chính xác
+_entries: Dict[tuple, _ModelEntry] = {}
+_stores: Dict[tuple, object] = {}
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-warmup")
+
+
+def resolve_backend(model_name: str) -> str:
+    """Backend thực tế của model: EMBEDDING_BACKEND=onnx* chỉ áp dụng cho model đã export"""
+    if EMBEDDING_BACKEND not in ("onnx", "onnx-int8"):
+        return EMBEDDING_BACKEND
+    from OnnxEmbeddings import has_export
+
+    if has_export(model_name, quantized=EMBEDDING_BACKEND == "onnx-int8"):
+        return EMBEDDING_BACKEND
+    print(f"⚠️ {model_name} chưa export ONNX ({EMBEDDING_BACKEND}), dùng torch")
+    return "torch"
+
+
+def _key(model_name: str, model_kwargs: dict, encode_kwargs: dict) -> tuple:
+    return (model_name,
+            json.dumps(model_kwargs, sort_keys=True),
+            json.dumps(encode_kwargs, sort_keys=True))
+
+
+def _create(entry: _ModelEntry) -> Embeddings:
+    if entry.backend in ("onnx", "onnx-int8"):
+        from OnnxEmbeddings import load_onnx_embeddings
+
+        return load_onnx_embeddings(entry.model_name, quantized=entry.backend == "onnx-int8",
+                                    device=entry.model_kwargs.get("device", "cpu"),
+                                    normalize=entry.encode_kwargs.get("normalize_embeddings", False))
+    if entry.backend != "torch":
+        raise ValueError(f"EMBEDDING_BACKEND không hợp lệ: {entry.backend} (torch | onnx | onnx-int8)")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=entry.model_name,
+        model_kwargs=entry.model_kwargs,
+        encode_kwargs=entry.encode_kwargs,
+    )
+
+
+def _load(entry: _ModelEntry):
+    with _load_lock:
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        embeddings = _create(entry)
+        entry.load_seconds = time.perf_counter() - start
+        rss_after = current_rss_mb()
+        if rss_before is not None and rss_after is not None:
+            entry.rss_delta_mb = rss_after - rss_before
+    print(f"🧠 Loaded {entry.model_name} ({entry.backend}) trong {entry.load_seconds:.1f}s")
+    return embeddings
+
+
+def _get_entry(model_name: str, model_kwargs: Optional[dict], encode_kwargs: Optional[dict],
+               background: bool) -> _ModelEntry:
+    model_kwargs = model_kwargs or {}
+    encode_kwargs = encode_kwargs or {}
+    key = _key(model_name, model_kwargs, encode_kwargs)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            return entry
+        entry = _entries[key] = _ModelEntry(model_name, model_kwargs, encode_kwargs)
+
+    def run():
+        try:
+            entry.future.set_result(_load(entry))
+        except BaseException as e:
+            # Cho phép thử load lại ở lần gọi sau
+            with _lock:
+                _entries.pop(key, None)
+            entry.future.set_exception(e)
+
+    if background:
+        _executor.submit(run)
+    else:
+        run()
+    return entry
+
+
+def warmup(model_name: str = DEFAULT_MODEL, model_kwargs: Optional[dict] = None,
+           encode_kwargs: Optional[dict] = None) -> Future:
+    """Bắt đầu load model ở background (nếu chưa load), trả về Future"""
+    return _get_entry(model_name, model_kwargs, encode_kwargs, background=True).future
+
+
+def get_embeddings(model_name: str = DEFAULT_MODEL, model_kwargs: Optional[dict] = None,
+                   encode_kwargs: Optional[dict] = None, lazy: bool = False,
+                   query_cache: bool = False) -> Embeddings:
+    """Lấy instance embeddings dùng chung.
+
+    lazy=True: trả về proxy ngay lập tức, model load ở background và chỉ chặn
+    khi thật sự cần embed (ví dụ FAISS.load_local không cần model).
+    query_cache=True: embed_query đi qua QueryEmbeddingCache dùng chung.
+    """
+    entry = _get_entry(model_name, model_kwargs, encode_kwargs, background=lazy)
+    embeddings = LazyEmbeddings(entry.future) if lazy else entry.future.result()
+    if query_cache:
+        from QueryEmbeddingCache import CachedQueryEmbeddings, get_query_cache
+        # Không dùng chung cache khi vector khác nhau: ONNX (nhất là int8) lệch nhẹ so với torch,
+        # encode_kwargs (normalize_embeddings...) đổi vector
+        namespace = model_name if entry.backend == "torch" else f"{model_name}#{entry.backend}"
+        if entry.encode_kwargs:
+            namespace += "#" + json.dumps(entry.encode_kwargs, sort_keys=True)
+        embeddings = CachedQueryEmbeddings(embeddings, namespace, get_query_cache())
+    return embeddings
+
+
+class LazyEmbeddings(Embeddings):
+    """Proxy Embeddings: chờ model load xong ở lần embed đầu tiên"""
+
+    def __init__(self, future: Future):
+        self._future = future
+
+    @property
+    def model(self) -> Embeddings:
+        return self._future.result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+def load_faiss(folder: str, model_name: str = DEFAULT_MODEL, model_kwargs: Optional[dict] = None,
+               encode_kwargs: Optional[dict] = None, lazy: bool = False, query_cache: bool = False):
+    """Load FAISS store 1 lần / process, dùng embeddings chung của registry.
+
+    Store trả về chỉ dùng để đọc: nếu có định dạng mmap thì vector + docstore không nằm
+    trong RAM riêng của process. Cần ghi (ingest) thì dùng FAISS.load_local trực tiếp.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    from MmapVectorStore import has_mmap_store, load_mmap_store
+
+    key = (os.path.abspath(folder), query_cache) + _key(model_name, model_kwargs or {}, encode_kwargs or {})
+    with _lock:
+        store = _stores.get(key)
+    if store is not None:
+        return store
+
+    embeddings = get_embeddings(model_name, model_kwargs, encode_kwargs, lazy=lazy, query_cache=query_cache)
+    if USE_MMAP_STORE and has_mmap_store(folder):
+        store = load_mmap_store(folder, embeddings)
+    else:
+        store = FAISS.load_local(folder, embeddings, allow_dangerous_deserialization=True)
+    with _lock:
+        return _stores.setdefault(key, store)
+
+
+def release(model_name: str):
+    """Bỏ mọi instance của model (và các FAISS store dùng nó) khỏi registry để giải phóng RAM/VRAM"""
+    import gc
+
+    with _lock:
+        for key in [k for k, e in _entries.items() if e.model_name == model_name]:
+            del _entries[key]
+        for key in [k for k in _stores if k[2] == model_name]:
+            del _stores[key]
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+# =======================
+# 3. Báo cáo
+# =======================
+
+def model_stats() -> List[dict]:
+    """Thời gian load và RAM tăng thêm (MB) của từng model đã load"""
+    with _lock:
+        entries = list(_entries.values())
+    return [{
+        "model_name": e.model_name,
+        "backend": e.backend,
+        "model_kwargs": e.model_kwargs,
+        "encode_kwargs": e.encode_kwargs,
+        "loaded": e.future.done() and e.future.exception() is None,
+        "load_seconds": e.load_seconds,
+        "rss_delta_mb": e.rss_delta_mb,
+    } for e in entries]
+
+
+def print_model_stats():
+    for s in model_stats():
+        load = f"{s['load_seconds']:.1f}s" if s["load_seconds"] is not None else "đang load"
+        rss = f"{s['rss_delta_mb']:.0f} MB" if s["rss_delta_mb"] is not None else "N/A"
+        print(f"🧠 {s['model_name']} ({s['backend']}): load {load}, RAM {rss}")
+    rss_total = current_rss_mb()
+    if rss_total is not None:
+        print(f"📦 RSS process: {rss_total:.0f} MB")
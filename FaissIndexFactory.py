@@ -0,0 +1,221 @@
+# FaissIndexFactory: chọn loại FAISS index (flat / IVF / HNSW / PQ) cho store lớn
+#
+#   "flat"                      exact, 4 KB / vector với e5-large (1024 chiều float32)
+#   "ivf:nlist=256"             chia cụm, chỉ quét nprobe cụm khi search
+#   "hnsw:M=32"                 đồ thị HNSW, chỉnh efSearch khi search
+#   "pq:m=64"                   product quantization, 64 byte / vector
+#   "ivfpq:nlist=256,m=64"      IVF + PQ cho corpus rất lớn
+#
+# Store vẫn được build như cũ (flat), sau đó convert_store() train index mới trên 1 mẫu vector,
+# add toàn bộ vector theo đúng thứ tự nên docstore / index_to_docstore_id giữ nguyên.
+# Metric luôn là L2 giống IndexFlatL2 mà langchain tạo, để score không đổi ý nghĩa.
+#
+#   python FaissIndexFactory.py vector_db2chunk_nltk --index-type ivf:nlist=64 --output vector_db2chunk_nltk_ivf
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "ivfpq")
+
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+DEFAULT_HNSW_M = 32
+MAX_TRAIN_SIZE = 50000
+MIN_POINTS_PER_CENTROID = 39  # faiss cảnh báo nếu ít hơn
+
+
+# =======================
+# 1. Spec
+# =======================
+
+def parse_index_spec(spec: str) -> Tuple[str, dict]:
+    """"ivfpq:nlist=256,m=64" -> ("ivfpq", {"nlist": 256, "m": 64})"""
+    kind, _, params = (spec or "flat").partition(":")
+    kind = kind.strip().lower()
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Loại index không hỗ trợ: {kind} (chọn 1 trong {', '.join(INDEX_TYPES)})")
+    options = {}
+    for item in filter(None, (p.strip() for p in params.split(","))):
+        key, _, value = item.partition("=")
+        options[key.strip()] = int(value)
+    return kind, options
+
+
+def _auto_nlist(n: int) -> int:
+    """~4*sqrt(n) cụm, nhưng đủ MIN_POINTS_PER_CENTROID điểm train cho mỗi cụm"""
+    nlist = int(4 * np.sqrt(n))
+    return max(1, min(nlist, n // MIN_POINTS_PER_CENTROID))
+
+
+def _pq_m(d: int, m: Optional[int]) -> int:
+    """Số sub-vector của PQ phải chia hết số chiều, mặc định d/16 (64 với e5-large)"""
+    m = m or max(1, d // 16)
+    while d % m:
+        m -= 1
+    return m
+
+
+def factory_string(kind: str, options: dict, d: int, n: int) -> str:
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return f"HNSW{options.get('M', DEFAULT_HNSW_M)},Flat"
+    # PQ 8 bit cần >= 256 điểm train cho mỗi codebook, store nhỏ thì giảm số bit
+    nbits = options.get("nbits", max(1, min(8, int(np.log2(max(n, 2))))))
+    if kind == "pq":
+        return f"PQ{_pq_m(d, options.get('m'))}x{nbits}"
+    nlist = options.get("nlist") or _auto_nlist(n)
+    if kind == "ivf":
+        return f"IVF{nlist},Flat"
+    return f"IVF{nlist},PQ{_pq_m(d, options.get('m'))}x{nbits}"
+
+
+# =======================
+# 2. Build / convert
+# =======================
+
+def build_index(vectors: np.ndarray, spec: str = "flat", seed: int = 0):
+    """Tạo index theo spec, train trên mẫu (tối đa MAX_TRAIN_SIZE vector) rồi add toàn bộ theo thứ tự"""
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vectors.shape
+    kind, options = parse_index_spec(spec)
+    index = faiss.index_factory(d, factory_string(kind, options, d, n), faiss.METRIC_L2)
+
+    if not index.is_trained:
+        train_size = min(n, options.get("train_size", MAX_TRAIN_SIZE))
+        sample = vectors
+        if train_size < n:
+            rng = np.random.default_rng(seed)
+            sample = vectors[np.sort(rng.choice(n, train_size, replace=False))]
+        start = time.perf_counter()
+        index.train(sample)
+        print(f"🏋️ Train {spec} trên {len(sample)} vector ({time.perf_counter() - start:.1f}s)")
+
+    index.add(vectors)
+    set_search_params(index, options.get("nprobe", DEFAULT_NPROBE), options.get("efSearch", DEFAULT_EF_SEARCH))
+    return index
+
+
+def store_vectors(db) -> np.ndarray:
+    """Toàn bộ vector của store theo thứ tự id trong index (chỉ dùng được khi index lưu vector gốc)"""
+    return db.index.reconstruct_n(0, db.index.ntotal)
+
+
+def convert_store(db, spec: str):
+    """Thay index của FAISS store (langchain) bằng index loại spec, giữ nguyên docstore"""
+    if parse_index_spec(spec)[0] == "flat":
+        return db
+    flat_vectors = store_vectors(db)
+    db.index = build_index(flat_vectors, spec)
+    return db
+
+
+def set_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Chỉnh nprobe (IVF) / efSearch (HNSW) lúc query, bỏ qua nếu index không có tham số đó"""
+    import faiss
+
+    if not isinstance(index, faiss.Index):  # vd MmapFlatIndex
+        return
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    inner = faiss.downcast_index(index)
+    if ef_search and hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = ef_search
+
+
+def supports_remove(index) -> bool:
+    """Index xóa được vector (remove_ids): flat / IVF / PQ được, HNSW thì không"""
+    import faiss
+
+    if not isinstance(index, faiss.Index):
+        return False
+    return not hasattr(faiss.downcast_index(index), "hnsw")
+
+
+def describe_index(index) -> str:
+    import faiss
+
+    if not isinstance(index, faiss.Index):
+        return type(index).__name__
+    ivf = faiss.try_extract_index_ivf(index)
+    inner = faiss.downcast_index(index)
+    if ivf is not None:
+        return f"{type(inner).__name__} (nlist={ivf.nlist}, nprobe={ivf.nprobe})"
+    if hasattr(inner, "hnsw"):
+        return f"{type(inner).__name__} (efSearch={inner.hnsw.efSearch})"
+    return type(inner).__name__
+
+
+# =======================
+# 3. Recall so với flat
+# =======================
+
+def recall_check(flat_vectors: np.ndarray, index, k: int = 10, n_queries: int = 200,
+                 queries: Optional[np.ndarray] = None, seed: int = 0) -> dict:
+    """Tỉ lệ top-k của index trùng với top-k exact (IndexFlatL2) + độ trễ search trung bình.
+
+    queries=None: lấy mẫu n_queries vector trong store làm query.
+    """
+    import faiss
+
+    flat_vectors = np.ascontiguousarray(flat_vectors, dtype=np.float32)
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        n_queries = min(n_queries, len(flat_vectors))
+        queries = flat_vectors[rng.choice(len(flat_vectors), n_queries, replace=False)]
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(flat_vectors))
+
+    exact = faiss.IndexFlatL2(flat_vectors.shape[1])
+    exact.add(flat_vectors)
+    t0 = time.perf_counter()
+    _, truth = exact.search(queries, k)
+    t1 = time.perf_counter()
+    _, found = index.search(queries, k)
+    t2 = time.perf_counter()
+
+    overlap = [len(set(t) & set(f)) / k for t, f in zip(truth, found)]
+    return {
+        f"recall@{k}": float(np.mean(overlap)),
+        "queries": len(queries),
+        "flat_ms_per_query": (t1 - t0) * 1000 / len(queries),
+        "index_ms_per_query": (t2 - t1) * 1000 / len(queries),
+        "index": describe_index(index),
+    }
+
+
+def print_recall(report: dict):
+    recall_key = next(key for key in report if key.startswith("recall@"))
+    print(f"🎯 {report['index']}: {recall_key} so với flat = {report[recall_key]:.3f} | "
+          f"{report['index_ms_per_query']:.2f} ms/query (flat {report['flat_ms_per_query']:.2f} ms)")
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from langchain_community.vectorstores import FAISS
+
+    from EmbeddingRegistry import DEFAULT_MODEL, get_embeddings
+
+    parser = argparse.ArgumentParser(description="Chuyển FAISS store flat sang IVF / HNSW / PQ và kiểm tra recall")
+    parser.add_argument("folder", help="Store flat có sẵn")
+    parser.add_argument("--index-type", default="ivf", help='vd "ivf:nlist=64", "hnsw:M=32", "ivfpq:m=64"')
+    parser.add_argument("--output", default=None, help="Thư mục lưu store mới (mặc định: <folder>_<loại>)")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    db = FAISS.load_local(args.folder, get_embeddings(args.model, lazy=True), allow_dangerous_deserialization=True)
+    flat = store_vectors(db)
+    convert_store(db, args.index_type)
+    print_recall(recall_check(flat, db.index, k=args.k))
+
+    output = args.output or f"{args.folder}_{parse_index_spec(args.index_type)[0]}"
+    os.makedirs(output, exist_ok=True)
+    db.save_local(output)
+    print(f"✅ Đã lưu {output}")
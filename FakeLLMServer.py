@@ -0,0 +1,283 @@
+# FakeLLMServer: server LLM giả (HTTP, chỉ dùng thư viện chuẩn) để load test LLMClientPool offline
+#
+#   python FakeLLMServer.py --port 8765                       # chạy server
+#   LLM_BACKEND=fake FAKE_LLM_URL=http://127.0.0.1:8765 python LLMInterviewer2_fixed.py
+#   python FakeLLMServer.py --load-test --requests 300 --concurrency 32
+#
+# Server giới hạn requests/phút theo từng key giống quota của Gemini (trả 429), có độ trễ ngẫu
+# nhiên và tỉ lệ lỗi 503 cấu hình được. Câu trả lời là JSON đúng dạng mà các prompt của
+# interviewer yêu cầu ("question" / "score" + "analysis" / "level"), prompt khác nhận text thường.
+# --malformed-rate: tỉ lệ JSON bị làm lỗi kiểu LLM hay trả (code fence, xuống dòng thô, phẩy thừa),
+# trừ khi request có "schema" (giống response_schema của Gemini: luôn trả JSON chuẩn).
+#
+# POST /generate  {"key": "...", "prompt": "...", "stream": false, "schema": null} -> {"text": "..."}
+#                 "stream": true -> NDJSON, mỗi dòng {"text": "<đoạn>"}
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from LLMClientPool import RateLimitError, TransientLLMError
+
+DEFAULT_URL = os.environ.get("FAKE_LLM_URL", "http://127.0.0.1:8765")
+
+
+# =======================
+# 1. Nội dung trả về
+# =======================
+
+def fake_response(prompt: str, rng: random.Random) -> str:
+    if '"question"' in prompt:
+        return json.dumps({"question": f"Câu hỏi giả #{rng.randint(1, 10 ** 6)}: hãy giải thích khái niệm này "
+                                       f"trong Java và cho ví dụ?"}, ensure_ascii=False)
+    if '"score"' in prompt:
+        return json.dumps({"score": rng.randint(0, 10), "analysis": "Nhận xét giả: câu trả lời tạm ổn."},
+                          ensure_ascii=False)
+    if '"level"' in prompt:
+        return json.dumps({"level": rng.choice(["yeu", "trung_binh", "kha", "gioi", "xuat_sac"])})
+    return "Đây là câu trả lời giả từ FakeLLMServer. " * 3
+
+
+def malform(text: str) -> str:
+    """JSON hợp lệ -> dạng lỗi hay gặp ở output LLM (TolerantJson đọc lại được)"""
+    return "```json\n" + text.replace("\\n", "\n").rstrip("}") + ",\n}\n```"
+
+
+# =======================
+# 2. Server
+# =======================
+
+class FakeLLMBackend:
+    """Trạng thái dùng chung của server: cửa sổ 60s các request theo key"""
+
+    def __init__(self, rpm_per_key: int = 10, latency: float = 0.3, error_rate: float = 0.0, seed: int = 0,
+                 malformed_rate: float = 0.0):
+        self.rpm_per_key = rpm_per_key
+        self.latency = latency
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+        self.windows = {}
+        self.counters = {"requests": 0, "rate_limited": 0, "errors": 0}
+        self.lock = threading.Lock()
+
+    def admit(self, key: str) -> int:
+        """HTTP status cho request của key: 200 / 429 / 503"""
+        now = time.monotonic()
+        with self.lock:
+            self.counters["requests"] += 1
+            window = self.windows.setdefault(key, deque())
+            while window and window[0] <= now - 60:
+                window.popleft()
+            if len(window) >= self.rpm_per_key:
+                self.counters["rate_limited"] += 1
+                return 429
+            window.append(now)
+            if self.random.random() < self.error_rate:
+                self.counters["errors"] += 1
+                return 503
+            return 200
+
+    def delay(self) -> float:
+        with self.lock:
+            return self.random.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+
+
+def make_handler(backend: FakeLLMBackend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path != "/generate":
+                return self._reply(404, {"error": "not found"})
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            status = backend.admit(data.get("key", ""))
+            if status == 429:
+                return self._reply(429, {"error": "RESOURCE_EXHAUSTED: quota exceeded"})
+            if status != 200:
+                return self._reply(status, {"error": "service unavailable"})
+
+            with backend.lock:
+                text = fake_response(data.get("prompt", ""), backend.random)
+                if text.startswith("{") and not data.get("schema") and backend.random.random() < backend.malformed_rate:
+                    text = malform(text)
+            total_delay = backend.delay()
+            if not data.get("stream"):
+                time.sleep(total_delay)
+                return self._reply(200, {"text": text})
+
+            # Stream: chia text thành ~8 đoạn, độ trễ rải đều
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            size = max(1, len(text) // 8)
+            for i in range(0, len(text), size):
+                time.sleep(total_delay / 8)
+                line = (json.dumps({"text": text[i:i + size]}, ensure_ascii=False) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def start_server(port: int = 8765, backend: FakeLLMBackend = None) -> ThreadingHTTPServer:
+    """Chạy server ở thread nền, trả về server (server.shutdown() để dừng)"""
+    backend = backend or FakeLLMBackend()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(backend))
+    server.daemon_threads = True
+    server.backend = backend
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# =======================
+# 3. Client (dùng trong LLMClientPool)
+# =======================
+
+class FakeLLMClient:
+    """Có invoke / stream giống LLM của langchain, lỗi HTTP được đổi sang lỗi của LLMClientPool"""
+
+    def __init__(self, url: str, key: str, timeout: float = 60, response_schema: str = None):
+        self.url = url.rstrip("/") + "/generate"
+        self.key = key
+        self.timeout = timeout
+        self.response_schema = response_schema
+
+    def _open(self, prompt: str, stream: bool):
+        body = json.dumps({"key": self.key, "prompt": prompt, "stream": stream,
+                           "schema": self.response_schema}).encode("utf-8")
+        request = urllib.request.Request(self.url, body, {"Content-Type": "application/json"})
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                raise RateLimitError(f"429 {e.read().decode('utf-8', 'replace')}") from None
+            raise TransientLLMError(f"{e.code} {e.reason}") from None
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"Không kết nối được FakeLLMServer ({self.url}): {e.reason}") from None
+
+    def invoke(self, prompt: str) -> str:
+        with self._open(prompt, False) as response:
+            return json.loads(response.read())["text"]
+
+    def stream(self, prompt: str):
+        with self._open(prompt, True) as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)["text"]
+
+
+def fake_keys() -> list:
+    return [f"fake-key-{i}" for i in range(1, int(os.environ.get("FAKE_LLM_KEYS", "3")) + 1)]
+
+
+def fake_client_factory(key: str, model: str, temperature: float, response_schema: str = None) -> FakeLLMClient:
+    return FakeLLMClient(DEFAULT_URL, key, response_schema=response_schema)
+
+
+# =======================
+# 4. Load test
+# =======================
+
+def load_test(requests: int, concurrency: int, keys: int, server_rpm: int, pool_rpm: float,
+              latency: float, error_rate: float, port: int, stream: bool = False) -> dict:
+    from LLMClientPool import LLMClientPool, LLMUnavailableError
+
+    server = start_server(port, FakeLLMBackend(server_rpm, latency, error_rate))
+    url = f"http://127.0.0.1:{port}"
+    pool = LLMClientPool([f"fake-key-{i}" for i in range(1, keys + 1)], rpm=pool_rpm,
+                         max_concurrency=concurrency, client_factory=lambda key, model, t: FakeLLMClient(url, key))
+    prompts = ['Trả về JSON: {"question": "..."}', 'Trả về JSON: {"score": 5, "analysis": "..."}', "Xin chào"]
+    latencies, failures = [], 0
+
+    def one(i):
+        start = time.perf_counter()
+        prompt = prompts[i % len(prompts)]
+        if stream:
+            "".join(pool.stream(prompt))
+        else:
+            pool.invoke(prompt)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency * 2) as executor:
+        for future in [executor.submit(one, i) for i in range(requests)]:
+            try:
+                latencies.append(future.result())
+            except (LLMUnavailableError, RuntimeError):
+                failures += 1
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    report = {
+        "requests": requests,
+        "succeeded": len(latencies),
+        "failed": failures,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "latency_p95": float(np.percentile(latencies, 95)) if latencies else None,
+        "server": dict(server.backend.counters),
+        "pool": pool.stats.to_dict(),
+        "keys": pool.key_stats(),
+    }
+    pool.print_stats()
+    p50 = f"{report['latency_p50']:.2f}s" if latencies else "N/A"
+    p95 = f"{report['latency_p95']:.2f}s" if latencies else "N/A"
+    print(f"📈 {report['succeeded']}/{requests} thành công trong {elapsed:.1f}s "
+          f"({report['throughput_rps']:.1f} req/s), p50 {p50}, p95 {p95}, "
+          f"server trả {report['server']['rate_limited']} lần 429 / {report['server']['errors']} lần 503")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server LLM giả + load test LLMClientPool")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=int, default=10, help="Giới hạn requests/phút mỗi key phía server")
+    parser.add_argument("--latency", type=float, default=0.3, help="Độ trễ trung bình (giây)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ trả 503")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Tỉ lệ JSON bị làm lỗi khi request không có schema")
+    parser.add_argument("--load-test", action="store_true", help="Chạy server nền + bắn request qua LLMClientPool")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--pool-rpm", type=float, default=None,
+                        help="Giới hạn requests/phút mỗi key phía pool (mặc định = --rpm), lớn hơn để thử backoff")
+    parser.add_argument("--stream", action="store_true", help="Load test qua pool.stream")
+    args = parser.parse_args()
+
+    if args.load_test:
+        load_test(args.requests, args.concurrency, args.keys, args.rpm, args.pool_rpm or args.rpm,
+                  args.latency, args.error_rate, args.port, args.stream)
+    else:
+        server = start_server(args.port, FakeLLMBackend(args.rpm, args.latency, args.error_rate,
+                                                        malformed_rate=args.malformed_rate))
+        print(f"🧪 FakeLLMServer chạy tại http://127.0.0.1:{args.port} (Ctrl+C để dừng)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -7,4 +7,14 @@ def loadapi():
     load_dotenv()
 
     API_KEY = os.getenv("GOOGLE_API_KEY")
-    return API_KEY
\ No newline at end of file
+    return API_KEY
+
+
+def loadapis():
+    """Danh sách API key cho LLMClientPool: GOOGLE_API_KEYS="key1,key2,..." hoặc chỉ GOOGLE_API_KEY"""
+    load_dotenv()
+
+    keys = [k.strip() for k in os.getenv("GOOGLE_API_KEYS", "").split(",") if k.strip()]
+    if not keys and os.getenv("GOOGLE_API_KEY"):
+        keys = [os.getenv("GOOGLE_API_KEY")]
+    return keys
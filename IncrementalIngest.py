@@ -0,0 +1,263 @@
+# IncrementalIngest: cập nhật FAISS store tăng dần thay vì build lại từ đầu
+#
+# Giữ 1 manifest (ingest_manifest.json) cạnh index.faiss: hash của từng file nguồn,
+# các trang và hash nội dung của từng chunk. Mỗi lần chạy:
+#   - file không đổi (cùng sha256 + cùng cấu hình chunk) -> bỏ qua, không đọc lại PDF
+#   - chunk mới / thay đổi -> chỉ embed những chunk đó rồi add vào index hiện có
+#   - chunk không còn được file nào tham chiếu -> xóa khỏi index + docstore
+#
+#   python IncrementalIngest.py --db vector_db2chunk_nltk --splitter nltk "Chương 2 ....pdf" "Chương 3 ....pdf"
+#
+# Lần đầu chạy trên 1 store cũ (chưa có manifest), các chunk có sẵn được nhận lại theo
+# hash nội dung nên không phải embed lại; chunk cũ không khớp với file nào trong danh sách
+# sẽ bị xóa, vì vậy lần đầu cần truyền đủ tất cả file nguồn của store.
+# Index HNSW không xóa được vector: chỉ thêm chunk, có chunk cần xóa thì build lại (BuildIndexes.py).
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from EmbeddingRegistry import DEFAULT_MODEL, get_embeddings
+
+MANIFEST_FILE = "ingest_manifest.json"
+
+# Cấu hình chunk giống các script build hiện có
+SPLITTERS = {
+    "recursive": {"chunk_size": 1000, "chunk_overlap": 200},  # CreateVecto-...py
+    "nltk": {"chunk_size": 1600, "chunk_overlap": 400, "separator": "\n\n"},  # NLTK.py
+}
+
+
+# =======================
+# 1. Hash & manifest
+# =======================
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(folder: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(folder: str, manifest: dict):
+    path = os.path.join(folder, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _adopt_existing(db) -> Dict[str, List[str]]:
+    """Store cũ chưa có manifest: map hash nội dung -> docstore id của các chunk có sẵn (chunk trùng
+    nội dung có nhiều id, xóa thì xóa hết)"""
+    chunks: Dict[str, List[str]] = {}
+    for doc_id in db.index_to_docstore_id.values():
+        doc = db.docstore.search(doc_id)
+        if hasattr(doc, "page_content"):
+            chunks.setdefault(content_hash(doc.page_content), []).append(doc_id)
+    return chunks
+
+
+def _chunk_ids(value) -> List[str]:
+    """Docstore id của 1 chunk trong manifest (manifest cũ lưu 1 id dạng str)"""
+    return [value] if isinstance(value, str) else list(value)
+
+
+# =======================
+# 2. Chia chunk
+# =======================
+
+def make_splitter(name: str):
+    """Splitter langchain cho "recursive"; "nltk" trả về None (dùng StreamingIngest)"""
+    settings = SPLITTERS[name]
+    if name == "nltk":
+        import nltk
+
+        nltk.download("punkt", quiet=True)
+        nltk.download("punkt_tab", quiet=True)
+        return None
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(length_function=len, **settings)
+
+
+def split_pdf(path: str, splitter) -> Iterable:
+    """Chia PDF thành chunk có metadata source + page.
+
+    splitter=None (nltk): dùng pipeline streaming của StreamingIngest, cho ra đúng các chunk
+    mà NLTK.py build, nên store build đầy đủ có thể được nhận lại mà không phải embed lại.
+    """
+    if splitter is None:
+        from langchain.schema import Document
+        from StreamingIngest import iter_pdf_chunks
+
+        settings = SPLITTERS["nltk"]
+        return (Document(page_content=c["page_content"], metadata=c["metadata"])
+                for c in iter_pdf_chunks(path, **settings))
+
+    from langchain_community.document_loaders import PyPDFLoader
+
+    pages = PyPDFLoader(path).lazy_load()
+    return (chunk for page in pages for chunk in splitter.split_documents([page]))
+
+
+# =======================
+# 3. Ingest
+# =======================
+
+def ingest(folder: str, sources: Iterable[str], splitter_name: str = "nltk",
+           model_name: str = DEFAULT_MODEL, model_kwargs: Optional[dict] = None,
+           encode_kwargs: Optional[dict] = None, prune: bool = False, embeddings=None) -> dict:
+    """Đồng bộ store trong folder với các file nguồn, chỉ embed chunk mới/thay đổi.
+
+    prune=True: xóa luôn các file có trong manifest nhưng không có trong sources.
+    Trả về thống kê {"added", "removed", "unchanged_files", ...}.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    start = time.perf_counter()
+    sources = [os.path.normpath(s) for s in sources]
+    encode_kwargs = encode_kwargs if encode_kwargs is not None else {"normalize_embeddings": True}
+    settings = {"splitter": splitter_name, **SPLITTERS[splitter_name]}
+
+    db = None
+    if os.path.exists(os.path.join(folder, "index.faiss")):
+        db = FAISS.load_local(folder, embeddings or get_embeddings(model_name, model_kwargs, encode_kwargs, lazy=True),
+                              allow_dangerous_deserialization=True)
+
+    manifest = load_manifest(folder)
+    if manifest is None or manifest.get("model_name") != model_name:
+        if manifest is not None:
+            raise ValueError(f"Store {folder} được build bằng {manifest.get('model_name')}, "
+                             f"không thể ingest tăng dần bằng {model_name}")
+        manifest = {"model_name": model_name, "sources": {}, "chunks": _adopt_existing(db) if db else {}}
+
+    # --- Đọc các file thay đổi ---
+    splitter = None
+    new_docs: Dict[str, object] = {}
+    unchanged_files = 0
+    for path in sources:
+        sha = file_hash(path)
+        entry = manifest["sources"].get(path)
+        if entry and entry["sha256"] == sha and entry["settings"] == settings:
+            unchanged_files += 1
+            continue
+
+        if splitter is None:
+            splitter = make_splitter(splitter_name)
+        pages: Dict[str, List[str]] = {}
+        for doc in split_pdf(path, splitter):
+            h = content_hash(doc.page_content)
+            pages.setdefault(str(doc.metadata.get("page", 0)), []).append(h)
+            if h not in manifest["chunks"] and h not in new_docs:
+                doc.metadata["chunk_hash"] = h
+                new_docs[h] = doc
+        manifest["sources"][path] = {"sha256": sha, "settings": settings, "pages": pages}
+        print(f"📄 {path}: {sum(len(v) for v in pages.values())} chunk")
+
+    if prune:
+        for path in list(manifest["sources"]):
+            if path not in sources:
+                del manifest["sources"][path]
+                print(f"🗑️ Bỏ nguồn {path}")
+
+    # --- Tính chunk cần thêm / xóa ---
+    wanted = {h for entry in manifest["sources"].values() for hashes in entry["pages"].values() for h in hashes}
+    stale = [h for h in manifest["chunks"] if h not in wanted]
+    to_add = [h for h in new_docs if h in wanted]
+
+    if stale and db is not None:
+        from FaissIndexFactory import describe_index, supports_remove
+
+        if not supports_remove(db.index):
+            raise ValueError(f"Store {folder} dùng {describe_index(db.index)}, không xóa được {len(stale)} "
+                             f"chunk cũ: build lại bằng BuildIndexes.py thay vì ingest tăng dần")
+        db.delete([doc_id for h in stale for doc_id in _chunk_ids(manifest["chunks"][h])])
+    for h in stale:
+        del manifest["chunks"][h]
+
+    embed_seconds = 0.0
+    if to_add:
+        from EmbeddingEngine import BatchEmbedder
+
+        embeddings = embeddings or get_embeddings(model_name, model_kwargs, encode_kwargs)
+        texts = [new_docs[h].page_content for h in to_add]
+        metadatas = [new_docs[h].metadata for h in to_add]
+        t0 = time.perf_counter()
+        with BatchEmbedder(model_name, normalize=encode_kwargs.get("normalize_embeddings", False),
+                           embeddings=embeddings) as embedder:
+            vectors = embedder.embed(texts).tolist()
+        embed_seconds = time.perf_counter() - t0
+        if db is None:
+            db = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=to_add)
+        else:
+            db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=to_add)
+        for h in to_add:
+            manifest["chunks"][h] = [h]
+
+    os.makedirs(folder, exist_ok=True)
+    if db is not None and (to_add or stale):
+        db.save_local(folder)
+        from MmapVectorStore import has_mmap_store, write_mmap_store
+        if has_mmap_store(folder, check_fresh=False):
+            write_mmap_store(db, folder)
+        # BM25 build lại toàn bộ (rẻ so với embed), vị trí chunk phải khớp index.faiss mới
+        from LexicalIndex import write_lexical_index
+        write_lexical_index(db, folder)
+    save_manifest(folder, manifest)
+
+    stats = {
+        "added": len(to_add),
+        "removed": len(stale),
+        "unchanged_files": unchanged_files,
+        "total_chunks": len(manifest["chunks"]),
+        "embed_seconds": embed_seconds,
+        "total_seconds": time.perf_counter() - start,
+    }
+    print(f"✅ Ingest {folder}: +{stats['added']} / -{stats['removed']} chunk, "
+          f"{stats['total_chunks']} chunk trong index ({stats['total_seconds']:.1f}s)")
+    return stats
+
+
+def refresh_context_index(folder: str, db=None):
+    """Nếu store có context_index.json (RetrievalContextIndex) thì build lại sau khi index thay đổi"""
+    from RetrievalContextIndex import CONTEXT_INDEX_FILE, build_context_index, build_queries
+
+    if not os.path.exists(os.path.join(folder, CONTEXT_INDEX_FILE)):
+        return
+    from EmbeddingRegistry import load_faiss
+    from LLMInterviewer2_fixed import InterviewConfig, QuestionDifficulty
+
+    db = db or load_faiss(folder)
+    build_context_index(db, folder,
+                        build_queries(InterviewConfig.TOPICS, [d.value for d in QuestionDifficulty]),
+                        k=InterviewConfig.RETRIEVAL_K)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest tăng dần PDF vào FAISS store")
+    parser.add_argument("sources", nargs="+", help="Các file PDF nguồn")
+    parser.add_argument("--db", default="vector_db2chunk_nltk", help="Thư mục FAISS store")
+    parser.add_argument("--splitter", choices=list(SPLITTERS), default="nltk")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--prune", action="store_true", help="Xóa các nguồn không còn trong danh sách")
+    args = parser.parse_args()
+
+    result = ingest(args.db, args.sources, args.splitter, args.model, prune=args.prune)
+    if result["added"] or result["removed"]:
+        refresh_context_index(args.db)
@@ -0,0 +1,397 @@
+# InterviewServer: chạy nhiều buổi phỏng vấn đồng thời trong 1 process (asyncio + ASGI)
+#
+# Chạy:  uvicorn InterviewServer:app --host 0.0.0.0 --port 8000
+#
+# HTTP API:
+#   POST   /sessions                     {"candidate": "Tên,Lớp", "topic": "..."} -> câu hỏi đầu tiên
+#                                        (phiên chỉ được tạo khi câu hỏi đầu sinh xong: lỗi thì gọi lại)
+#   POST   /sessions/{id}/answer         {"answer": "..."}                        -> điểm + câu hỏi tiếp / tổng kết
+#                                        (409 nếu chưa có câu hỏi đang chờ: gọi /question trước)
+#   POST   /sessions/{id}/question       sinh lại câu hỏi hiện tại nếu lần trước bị lỗi
+#   GET    /sessions/{id}                trạng thái phiên
+#   DELETE /sessions/{id}                đóng phiên
+#   GET    /health
+#   GET    /metrics                      thời gian từng stage + token (Prometheus, InterviewTracing.py)
+#
+# WebSocket /ws (mỗi kết nối = 1 phiên):
+#   -> {"action": "start", "candidate": "...", "topic": "..."}   gửi lại "start" = đóng phiên cũ, mở phiên mới
+#   -> {"action": "answer", "answer": "..."}
+#   -> {"action": "question"}                     sinh lại câu hỏi hiện tại nếu lần trước bị lỗi
+#   <- {"type": "question" | "evaluation" | "summary" | "error", ...}
+#   <- {"type": "question_delta", "text": "..."}   từng đoạn câu hỏi khi đang sinh (stream), sau đó
+#                                                  vẫn có "question" với câu hỏi đầy đủ
+#
+# SPECULATIVE_PREFETCH=1: sinh trước câu hỏi cho các nhánh harder/same/easier trong lúc
+# thí sinh trả lời (SpeculativePrefetch.py), thống kê nằm trong GET /sessions/{id}.
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from EmbeddingRegistry import model_stats
+from InterviewTracing import get_tracer
+from LLMClientPool import LLMUnavailableError
+from QueryEmbeddingCache import get_query_cache
+from LLMInterviewer2_fixed import AdaptiveInterviewer, InterviewConfig, InterviewState
+from SpeculativePrefetch import QuestionPrefetcher
+
+
+# =======================
+# 1. Session Engine
+# =======================
+
+@dataclass
+class InterviewSession:
+    session_id: str
+    interviewer: AdaptiveInterviewer
+    state: InterviewState
+    current_question: Optional[str] = None
+    summary: Optional[Dict] = None
+    prefetcher: Optional[QuestionPrefetcher] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "candidate": self.state.candidate_name,
+            "topic": self.state.topic,
+            "level": self.state.level.value,
+            "difficulty": self.state.current_difficulty.value,
+            "question_number": self.state.total_questions_asked + 1,
+            "question": self.current_question,
+            "is_finished": self.state.is_finished,
+            "final_score": self.state.final_score,
+            **({"prefetch": self.prefetcher.stats.to_dict()} if self.prefetcher else {}),
+        }
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class NoPendingQuestion(RuntimeError):
+    """Nhận câu trả lời khi chưa có câu hỏi nào đang chờ (lần sinh câu hỏi trước bị lỗi / gửi lại answer)"""
+
+
+class InterviewSessionManager:
+    """Quản lý nhiều phiên phỏng vấn, dùng chung 1 AdaptiveInterviewer (model, FAISS, LLM).
+
+    Các bước nặng (retrieval, LLM) chạy trong thread pool nên không chặn event loop,
+    mỗi phiên có lock riêng để các request của cùng 1 phiên được xử lý tuần tự.
+    """
+
+    def __init__(self, interviewer: Optional[AdaptiveInterviewer] = None,
+                 max_workers: int = 32, session_ttl: float = 3600,
+                 speculative: bool = InterviewConfig.SPECULATIVE_PREFETCH):
+        self._interviewer = interviewer
+        self.speculative = speculative
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="interview")
+        self._startup_lock = asyncio.Lock()
+        self.session_ttl = session_ttl
+        self.sessions: Dict[str, InterviewSession] = {}
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def startup(self):
+        """Load model + FAISS 1 lần duy nhất cho cả process"""
+        async with self._startup_lock:
+            if self._interviewer is None:
+                self._interviewer = await self._run(AdaptiveInterviewer)
+
+    async def shutdown(self):
+        self.sessions.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get(self, session_id: str) -> InterviewSession:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise SessionNotFound(session_id)
+        return session
+
+    async def start_session(self, candidate_name: str, topic: str,
+                            on_event: Optional[Callable[[dict], None]] = None) -> Dict:
+        if self._interviewer is None:
+            await self.startup()
+        interviewer = self._interviewer.new_session(uuid.uuid4().hex)
+        state = await self._run(interviewer.start_interview, candidate_name, topic)
+
+        session = InterviewSession(session_id=interviewer.session_id, interviewer=interviewer, state=state)
+        if self.speculative:
+            session.prefetcher = QuestionPrefetcher(interviewer, self._executor)
+        # Đăng ký sau khi có câu hỏi đầu: lỗi LLM ở đây thì client không có session_id để dùng,
+        # phiên không được giữ lại tới khi hết TTL
+        async with session.lock:
+            await self._ensure_question(session, on_event)
+        self.sessions[session.session_id] = session
+        return session.to_dict()
+
+    async def _ensure_question(self, session: InterviewSession,
+                               on_event: Optional[Callable[[dict], None]] = None) -> str:
+        """on_event (gọi từ thread worker): nhận {"type": "question_delta"} khi câu hỏi được stream"""
+        if session.current_question is None:
+            question = None
+            if session.prefetcher is not None:
+                question = await self._run(session.prefetcher.commit, session.state)
+            if question is None:
+                on_token = (lambda text: on_event({"type": "question_delta", "text": text})) \
+                    if on_event is not None else None
+                question = await self._run(session.interviewer.next_question, session.state, on_token)
+            session.current_question = question
+            session.updated_at = time.time()
+            if session.prefetcher is not None:
+                # Sinh trước câu kế tiếp trong lúc thí sinh trả lời câu này
+                session.prefetcher.start(session.state)
+        return session.current_question
+
+    async def next_question(self, session_id: str, on_event: Optional[Callable[[dict], None]] = None) -> Dict:
+        session = self.get(session_id)
+        async with session.lock:
+            if not session.state.is_finished:
+                await self._ensure_question(session, on_event)
+        return session.to_dict()
+
+    async def submit_answer(self, session_id: str, answer: str,
+                            on_event: Optional[Callable[[dict], None]] = None) -> Dict:
+        """on_event: nhận {"type": "evaluation"} ngay khi chấm xong, trước khi sinh câu hỏi tiếp"""
+        session = self.get(session_id)
+        async with session.lock:
+            if session.state.is_finished:
+                return {**session.to_dict(), "summary": session.summary}
+
+            # Không tự sinh câu hỏi ở đây: thí sinh chưa thấy câu đó, và khi client gửi lại answer
+            # (câu hỏi tiếp bị lỗi sau khi đã chấm) câu trả lời sẽ bị ghi 2 lần
+            question = session.current_question
+            if question is None:
+                raise NoPendingQuestion(session_id)
+            score, analysis = await self._run(session.interviewer.submit_answer,
+                                              session.state, question, answer)
+            session.current_question = None
+            session.updated_at = time.time()
+            result = {"score": score, "analysis": analysis}
+            if on_event is not None:
+                on_event({"type": "evaluation", **result})
+
+            if session.state.is_finished:
+                if session.prefetcher is not None:
+                    session.prefetcher.cancel()
+                session.summary = await self._run(session.interviewer.generate_summary, session.state, False)
+                result["summary"] = session.summary
+            else:
+                await self._ensure_question(session, on_event)
+            return {**session.to_dict(), **result}
+
+    def close_session(self, session_id: str) -> Optional[InterviewSession]:
+        session = self.sessions.pop(session_id, None)
+        if session is not None and session.prefetcher is not None:
+            session.prefetcher.cancel()
+        return session
+
+    async def cleanup_expired(self, interval: float = 60):
+        """Dọn các phiên không hoạt động quá session_ttl giây"""
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            expired = [sid for sid, s in self.sessions.items() if now - s.updated_at > self.session_ttl]
+            for sid in expired:
+                self.close_session(sid)
+
+
+# =======================
+# 2. ASGI App (HTTP + WebSocket)
+# =======================
+
+async def _read_body(receive) -> dict:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return json.loads(body) if body else {}
+
+
+async def _send_text(send, status: int, text: str, content_type: bytes = b"text/plain; charset=utf-8"):
+    body = text.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status: int, payload: dict):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class InterviewAPI:
+    def __init__(self, manager: Optional[InterviewSessionManager] = None):
+        self.manager = manager or InterviewSessionManager(
+            max_workers=int(os.environ.get("INTERVIEW_WORKERS", "32")))
+        self._cleanup_task = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.manager.startup()
+                self._cleanup_task = asyncio.create_task(self.manager.cleanup_expired())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._cleanup_task:
+                    self._cleanup_task.cancel()
+                await self.manager.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        method = scope["method"]
+        parts = [p for p in scope["path"].split("/") if p]
+        try:
+            if parts == ["health"] and method == "GET":
+                return await _send_json(send, 200, {"status": "ok", "sessions": len(self.manager.sessions),
+                                                  "models": model_stats(),
+                                                  "query_cache": get_query_cache().stats()})
+
+            if parts == ["metrics"] and method == "GET":
+                return await _send_text(send, 200, get_tracer().render_prometheus(),
+                                        b"text/plain; version=0.0.4; charset=utf-8")
+
+            if parts == ["sessions"] and method == "POST":
+                body = await _read_body(receive)
+                result = await self.manager.start_session(body["candidate"], body["topic"])
+                return await _send_json(send, 201, result)
+
+            if len(parts) == 2 and parts[0] == "sessions":
+                if method == "GET":
+                    return await _send_json(send, 200, self.manager.get(parts[1]).to_dict())
+                if method == "DELETE":
+                    self.manager.close_session(parts[1])
+                    return await _send_json(send, 200, {"closed": parts[1]})
+
+            if len(parts) == 3 and parts[0] == "sessions" and method == "POST":
+                if parts[2] == "answer":
+                    body = await _read_body(receive)
+                    result = await self.manager.submit_answer(parts[1], body.get("answer", ""))
+                    return await _send_json(send, 200, result)
+                if parts[2] == "question":
+                    return await _send_json(send, 200, await self.manager.next_question(parts[1]))
+
+            await _send_json(send, 404, {"error": "Không tìm thấy endpoint"})
+        except SessionNotFound as e:
+            await _send_json(send, 404, {"error": f"Không tìm thấy phiên {e}"})
+        except NoPendingQuestion as e:
+            await _send_json(send, 409, {"error": f"Phiên {e} không có câu hỏi đang chờ (no pending question), "
+                                                  f"gọi POST /sessions/{e}/question"})
+        except (KeyError, json.JSONDecodeError) as e:
+            await _send_json(send, 400, {"error": f"Request không hợp lệ: {e}"})
+        except ValueError as e:
+            await _send_json(send, 400, {"error": str(e)})
+        except LLMUnavailableError as e:
+            # Hết quota / circuit breaker đang mở: client chờ retry_after giây rồi gửi lại
+            await _send_json(send, 503, {"error": f"⏳ {e}", "retry_after": round(e.retry_after, 1)})
+        except Exception as e:
+            # Lỗi LLM / retrieval: phiên vẫn giữ nguyên, client có thể gửi lại
+            await _send_json(send, 502, {"error": f"❌ Lỗi: {e}"})
+
+    async def _websocket(self, scope, receive, send):
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        await send({"type": "websocket.accept"})
+
+        async def send_msg(payload: dict):
+            await send({"type": "websocket.send", "text": json.dumps(payload, ensure_ascii=False)})
+
+        # Event từ thread worker (token câu hỏi, điểm) được đẩy qua queue về event loop
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        def on_event(event: dict):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        async def streaming(coro):
+            """Chạy coro, gửi các event phát sinh trong lúc chạy, trả về kết quả của coro"""
+            task = asyncio.ensure_future(coro)
+            while True:
+                getter = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    break
+                await send_msg(getter.result())
+            while not events.empty():
+                await send_msg(events.get_nowait())
+            return task.result()
+
+        session_id = None
+        try:
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                try:
+                    data = json.loads(message.get("text") or message.get("bytes") or "{}")
+                    action = data.get("action")
+                    if action == "start":
+                        if session_id:
+                            self.manager.close_session(session_id)
+                            session_id = None
+                        result = await streaming(self.manager.start_session(data["candidate"], data["topic"],
+                                                                            on_event))
+                        session_id = result["session_id"]
+                        await send_msg({"type": "question", **result})
+                    elif action == "answer" and session_id:
+                        # "evaluation" được gửi qua on_event trước khi câu hỏi tiếp bắt đầu stream
+                        result = await streaming(self.manager.submit_answer(session_id, data.get("answer", ""),
+                                                                            on_event))
+                        if result["is_finished"]:
+                            await send_msg({"type": "summary", "summary": result.get("summary")})
+                        else:
+                            await send_msg({"type": "question", **result})
+                    elif action == "question" and session_id:
+                        result = await streaming(self.manager.next_question(session_id, on_event))
+                        await send_msg({"type": "question", **result})
+                    else:
+                        await send_msg({"type": "error", "error": "Cần gửi 'start' trước khi 'answer'"})
+                except NoPendingQuestion:
+                    await send_msg({"type": "error", "error": "Chưa có câu hỏi đang chờ, gửi 'question' để sinh lại"})
+                except LLMUnavailableError as e:
+                    await send_msg({"type": "error", "error": f"⏳ {e}", "retry_after": round(e.retry_after, 1)})
+                except Exception as e:
+                    await send_msg({"type": "error", "error": f"❌ Lỗi: {e}"})
+        finally:
+            if session_id:
+                self.manager.close_session(session_id)
+
+
+app = InterviewAPI()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "8000")))
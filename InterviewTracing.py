@@ -0,0 +1,252 @@
+# InterviewTracing: đo thời gian từng bước của vòng phỏng vấn (span) + metrics kiểu Prometheus
+#
+#   with span("llm_call", session_id=..., kind="question") as s:
+#       result = llm.invoke(prompt)
+#       s.set(prompt_tokens=..., response_tokens=...)
+#
+# Các stage: profile_lookup, llm_call, prompt_build, json_parse, context_index, embedding,
+# faiss_search, cascade_search, hybrid_search, state_update. Mỗi span được ghi 1 dòng JSON vào INTERVIEW_TRACE_PATH
+# (mặc định interview_traces.jsonl, ghi theo lô) và cộng vào histogram trong RAM:
+#   - InterviewServer: GET /metrics
+#   - CLI interviewer: METRICS_PORT=9100 để mở endpoint /metrics riêng
+#
+#   python InterviewTracing.py interview_traces.jsonl      # p50/p95 từng stage trên mọi phiên
+#
+# INTERVIEW_TRACE=0 để tắt (span vẫn chạy nhưng không ghi gì).
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+DEFAULT_TRACE_PATH = os.environ.get("INTERVIEW_TRACE_PATH", "interview_traces.jsonl")
+TRACE_ENABLED = os.environ.get("INTERVIEW_TRACE", "1") == "1"
+FLUSH_EVERY = 64  # số span mỗi lần ghi file
+RESERVOIR_SIZE = 10000  # số span gần nhất mỗi stage dùng để tính p50/p95 trong RAM
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Span:
+    __slots__ = ("stage", "session_id", "attrs", "start", "duration")
+
+    def __init__(self, stage: str, session_id: Optional[str], attrs: dict):
+        self.stage = stage
+        self.session_id = session_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        return {"stage": self.stage, "session_id": self.session_id, "start": self.start,
+                "duration_ms": round(self.duration * 1000, 3), **self.attrs}
+
+
+class _StageStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+        self.tokens: Dict[str, int] = defaultdict(int)
+        self.errors = 0
+
+
+class Tracer:
+    def __init__(self, path: Optional[str] = DEFAULT_TRACE_PATH, enabled: bool = TRACE_ENABLED):
+        self.path = path or None
+        self.enabled = enabled
+        self._stages: Dict[str, _StageStats] = defaultdict(_StageStats)
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def record(self, s: Span):
+        if not self.enabled:
+            return
+        line = json.dumps(s.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            stats = self._stages[s.stage]
+            stats.count += 1
+            stats.total += s.duration
+            for i, bound in enumerate(BUCKETS):
+                if s.duration <= bound:
+                    stats.buckets[i] += 1
+            stats.recent.append(s.duration)
+            for key in ("prompt_tokens", "response_tokens"):
+                if key in s.attrs:
+                    stats.tokens[key] += int(s.attrs[key])
+            if "error" in s.attrs:
+                stats.errors += 1
+            if self.path:
+                self._pending.append(line)
+                if len(self._pending) >= FLUSH_EVERY:
+                    self._write_pending()
+
+    def _write_pending(self):
+        lines, self._pending = self._pending, []
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def flush(self):
+        with self._lock:
+            if self.path and self._pending:
+                self._write_pending()
+
+    # ============ Thống kê ============
+    def stage_stats(self) -> Dict[str, dict]:
+        with self._lock:
+            items = [(stage, stats.count, stats.total, list(stats.recent)) for stage, stats in self._stages.items()]
+        return {stage: {"count": count, "mean_ms": total / count * 1000,
+                        "p50_ms": float(np.percentile(recent, 50)) * 1000,
+                        "p95_ms": float(np.percentile(recent, 95)) * 1000}
+                for stage, count, total, recent in sorted(items)}
+
+    def render_prometheus(self) -> str:
+        """Histogram thời gian + tổng token theo stage, định dạng text của Prometheus"""
+        lines = ["# HELP interview_stage_duration_seconds Thời gian từng bước của vòng phỏng vấn",
+                 "# TYPE interview_stage_duration_seconds histogram"]
+        token_lines = ["# HELP interview_llm_tokens_total Token ước lượng (~4 ký tự / token) của các lần gọi LLM",
+                       "# TYPE interview_llm_tokens_total counter"]
+        error_lines = ["# HELP interview_stage_errors_total Số span kết thúc bằng exception",
+                       "# TYPE interview_stage_errors_total counter"]
+        with self._lock:
+            for stage, stats in sorted(self._stages.items()):
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    lines.append(f'interview_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'interview_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats.count}')
+                lines.append(f'interview_stage_duration_seconds_sum{{stage="{stage}"}} {stats.total:.6f}')
+                lines.append(f'interview_stage_duration_seconds_count{{stage="{stage}"}} {stats.count}')
+                for key, value in sorted(stats.tokens.items()):
+                    kind = key.replace("_tokens", "")
+                    token_lines.append(f'interview_llm_tokens_total{{stage="{stage}",kind="{kind}"}} {value}')
+                error_lines.append(f'interview_stage_errors_total{{stage="{stage}"}} {stats.errors}')
+        return "\n".join(lines + token_lines + error_lines) + "\n"
+
+    def print_summary(self):
+        for stage, s in self.stage_stats().items():
+            print(f"⏱️ {stage:<15} {s['count']:>6} lần | p50 {s['p50_ms']:8.1f} ms | p95 {s['p95_ms']:8.1f} ms")
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+
+@contextmanager
+def span(stage: str, session_id: Optional[str] = None, **attrs):
+    s = Span(stage, session_id, attrs)
+    start = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        s.duration = time.perf_counter() - start
+        get_tracer().record(s)
+
+
+def record_span(stage: str, started_at: float, session_id: Optional[str] = None, **attrs):
+    """Ghi span cho đoạn code đã chạy từ started_at (time.perf_counter()), khi không tiện bọc bằng with"""
+    s = Span(stage, session_id, attrs)
+    s.duration = time.perf_counter() - started_at
+    s.start = time.time() - s.duration
+    get_tracer().record(s)
+
+
+# =======================
+# Endpoint /metrics cho CLI
+# =======================
+
+def start_metrics_server(port: int):
+    """Mở http://0.0.0.0:port/metrics ở thread nền (interviewer chạy bằng CLI, không có InterviewServer)"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = get_tracer().render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📡 Metrics: http://0.0.0.0:{port}/metrics")
+    return server
+
+
+# =======================
+# Tổng hợp file trace
+# =======================
+
+def read_spans(paths: Iterable[str]) -> List[dict]:
+    spans = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            spans.extend(json.loads(line) for line in f if line.strip())
+    return spans
+
+
+def summarize_spans(spans: List[dict]) -> Dict[str, dict]:
+    """p50 / p95 / mean (ms) + token trung bình theo stage"""
+    by_stage = defaultdict(list)
+    for s in spans:
+        by_stage[s["stage"]].append(s)
+    summary = {}
+    for stage, items in sorted(by_stage.items()):
+        durations = np.array([s["duration_ms"] for s in items])
+        summary[stage] = {
+            "count": len(items),
+            "p50_ms": float(np.percentile(durations, 50)),
+            "p95_ms": float(np.percentile(durations, 95)),
+            "mean_ms": float(durations.mean()),
+            "errors": sum(1 for s in items if "error" in s),
+        }
+        for key in ("prompt_tokens", "response_tokens"):
+            values = [s[key] for s in items if key in s]
+            if values:
+                summary[stage][f"mean_{key}"] = float(np.mean(values))
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="p50/p95 từng stage từ file trace JSONL")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_TRACE_PATH])
+    args = parser.parse_args()
+
+    spans = read_spans(args.paths)
+    sessions = {s.get("session_id") for s in spans if s.get("session_id")}
+    print(f"📊 {len(spans)} span, {len(sessions)} phiên")
+    for stage, s in summarize_spans(spans).items():
+        tokens = ""
+        if "mean_prompt_tokens" in s:
+            tokens = f" | ~{s['mean_prompt_tokens']:.0f} token prompt, ~{s.get('mean_response_tokens', 0):.0f} token output"
+        print(f"⏱️ {stage:<15} {s['count']:>7} lần | p50 {s['p50_ms']:8.1f} ms | p95 {s['p95_ms']:8.1f} ms"
+              f" | lỗi {s['errors']}{tokens}")
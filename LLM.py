@@ -1,30 +1,33 @@
+import os
+import time
+
 import keyboard
 from langchain.memory import ConversationBufferMemory
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, GoogleGenerativeAI
 from langchain.chains import RetrievalQA,ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
 from langchain.prompts import PromptTemplate
-from langchain_huggingface import HuggingFaceEmbeddings
-
-from GetApikey import loadapi
+from langchain_core.messages import get_buffer_string
+from EmbeddingRegistry import load_faiss
+from QueryEmbeddingCache import print_query_cache_stats
+from LLMClientPool import get_llm, print_pool_stats
+from LLMStreaming import print_latency_stats, print_token, stream_text
+from SemanticCache import SemanticResponseCache
 
-API_KEY=loadapi()
+# In câu trả lời theo từng token, STREAM_OUTPUT=0 để dùng ConversationalRetrievalChain như cũ
+STREAM_OUTPUT = os.environ.get("STREAM_OUTPUT", "1") == "1"
 
-# Embeddings Google
-embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large-instruct")
-
-# Load FAISS database đã lưu
-db = FAISS.load_local("vector_db2", embeddings, allow_dangerous_deserialization=True)
+# Load FAISS database đã lưu (embeddings lấy từ registry, load 1 lần / process)
+db = load_faiss("vector_db2", query_cache=True)
 
 # Tạo retriever từ FAISS
 retriever = db.as_retriever(search_kwargs={"k": 5})
 
-# LLM Google Gemini (text-only)
-llm = GoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    google_api_key=API_KEY,
-    temperature=0.5
-)
+# Cache câu trả lời theo ý nghĩa câu hỏi (SemanticCache.py), SEMANTIC_CACHE=0 để tắt
+semantic_cache = SemanticResponseCache("vector_db2", db.embeddings) \
+    if os.environ.get("SEMANTIC_CACHE", "1") == "1" else None
+
+# LLM Google Gemini (text-only), đi qua pool dùng chung (LLMClientPool: nhiều key, quota, retry)
+llm = get_llm(temperature=0.5)
 
 # Prompt cho RAG
 prompt_template = """
@@ -58,19 +61,96 @@ qa_chain = ConversationalRetrievalChain.from_llm(
     combine_docs_chain_kwargs={"prompt": prompt}
 )
 
+
+def answer_from_cache(query: str, question: str):
+    """In câu trả lời đã cache cho câu hỏi gần giống question, None nếu không có"""
+    hit = semantic_cache.lookup(question) if semantic_cache is not None else None
+    if hit is None:
+        return None
+    print("🤖 Bot:", hit.answer)
+    print(f"🧠 Trả lời từ cache (cosine {hit.similarity:.3f} với \"{hit.entry.question}\")")
+    memory.save_context({"question": query}, {"answer": hit.answer})
+    return hit.answer
+
+
+def standalone_question(query: str) -> str:
+    """Có lịch sử thì viết lại câu hỏi thành câu độc lập (giống bước condense của chain, không stream)"""
+    chat_history = memory.load_memory_variables({})["chat_history"]
+    if not chat_history:
+        return query
+    return llm.invoke(CONDENSE_QUESTION_PROMPT.format(
+        chat_history=get_buffer_string(chat_history), question=query)).strip()
+
+
+def answer_streaming(query: str) -> str:
+    """Các bước của qa_chain nhưng câu trả lời được stream ra terminal"""
+    # 1. Câu hỏi độc lập (cache tra theo câu này)
+    standalone = standalone_question(query)
+    cached = answer_from_cache(query, standalone)
+    if cached is not None:
+        return cached
+    # 2. Retrieve + ghép context
+    start = time.perf_counter()
+    docs = retriever.invoke(standalone)
+    context = "\n\n".join(doc.page_content for doc in docs)
+    # 3. Stream câu trả lời
+    print("🤖 Bot: ", end="", flush=True)
+    result = stream_text(llm, prompt.format(context=context, question=standalone), print_token)
+    print()
+    ttft = f"{result.ttft_seconds:.2f}s" if result.ttft_seconds is not None else "N/A"
+    print(f"⏱️ Token đầu tiên sau {ttft}, xong sau {result.total_seconds:.2f}s")
+    memory.save_context({"question": query}, {"answer": result.text})
+    if semantic_cache is not None:
+        semantic_cache.put(standalone, result.text, time.perf_counter() - start)
+    return result.text
+
+
+def answer_with_chain(query: str) -> str:
+    # Viết lại câu hỏi trước để cache tra theo câu độc lập: câu gốc ("còn nó thì sao?") phụ thuộc lịch sử
+    first_turn = not memory.chat_memory.messages
+    standalone = standalone_question(query)
+    cached = answer_from_cache(query, standalone)
+    if cached is not None:
+        return cached
+    start = time.perf_counter()
+    if first_turn:
+        answer = qa_chain.invoke({"question": query})["answer"]
+    else:
+        # Đã condense: chỉ chạy bước retrieve + combine của chain để không gọi LLM viết lại lần 2
+        docs = qa_chain.retriever.invoke(standalone)
+        answer = qa_chain.combine_docs_chain.invoke(
+            {"input_documents": docs, "question": standalone})[qa_chain.combine_docs_chain.output_key]
+        memory.save_context({"question": query}, {"answer": answer})
+    print("🤖 Bot:", answer)
+    if semantic_cache is not None:
+        semantic_cache.put(standalone, answer, time.perf_counter() - start)
+    return answer
+
+
+def end_chat():
+    print("👋 Kết thúc chat.")
+    print_query_cache_stats()
+    print_latency_stats()
+    print_pool_stats()
+    if semantic_cache is not None:
+        semantic_cache.print_stats()
+
+
 # Vòng lặp chat
 print("💬 Chat với Java RAG Bot (gõ 'exit' để thoát)\n")
 while True:
     query = input("❓Bạn: ")
     if query.lower() in ["exit", "quit"]:
-        print("👋 Kết thúc chat.")
+        end_chat()
         break
     # exit khi nhấn 'Esc'
     if keyboard.is_pressed('esc'):
-        print("👋 Kết thúc chat.")
+        end_chat()
         break
 
-    result = qa_chain.invoke({"question": query})
-    print("🤖 Bot:", result["answer"])
+    if STREAM_OUTPUT:
+        answer_streaming(query)
+    else:
+        answer_with_chain(query)
 
 
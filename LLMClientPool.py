@@ -0,0 +1,450 @@
+# LLMClientPool: lớp gọi Gemini dùng chung cho cả process, chịu được giới hạn quota
+#
+#   llm = get_llm(temperature=0.7)      # thay cho GoogleGenerativeAI(...), dùng như 1 LLM của langchain
+#   llm.invoke(prompt) / llm.stream(prompt)
+#
+# - Nhiều API key (GOOGLE_API_KEYS="k1,k2,..."), mỗi key có token bucket cho requests/phút (LLM_RPM)
+#   và tokens/phút (LLM_TPM, ước lượng ~4 ký tự / token). Request đi vào key còn quota sớm nhất.
+# - Giới hạn số request đang chạy đồng thời cho cả process (LLM_MAX_CONCURRENCY).
+# - Lỗi tạm thời (429 / 503 / timeout) được thử lại với backoff lũy thừa + jitter; key bị 429
+#   được cho nghỉ KEY_COOLDOWN_SECONDS.
+# - Circuit breaker: lỗi liên tiếp quá ngưỡng thì fail-fast (LLMUnavailableError) trong 1 khoảng,
+#   sau đó cho 1 request thăm dò đi qua.
+#
+# - response_schema="question" | "evaluation" | ... (TolerantJson.SCHEMAS): Gemini trả JSON đúng schema
+#   (response_mime_type="application/json"), mỗi (key, temperature, schema) có 1 client riêng.
+#
+# LLM_BACKEND=fake: gọi FakeLLMServer.py (FAKE_LLM_URL) thay vì Gemini, dùng để load test offline.
+import os
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+if TYPE_CHECKING:  # langchain_core chỉ import khi cần PooledLLM (xem _define_pooled_llm)
+    from langchain_core.language_models.llms import LLM
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+DEFAULT_RPM = float(os.environ.get("LLM_RPM", "10"))
+DEFAULT_TPM = float(os.environ.get("LLM_TPM", "250000"))
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+DEFAULT_MAX_RETRIES = 5
+BASE_DELAY_SECONDS = 1.0
+MAX_DELAY_SECONDS = 30.0
+KEY_COOLDOWN_SECONDS = 20.0
+EXPECTED_OUTPUT_TOKENS = 512  # giữ chỗ trong bucket tokens/phút trước khi biết độ dài output
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text or "") // 4)
+
+
+# =======================
+# 1. Lỗi
+# =======================
+
+class LLMUnavailableError(RuntimeError):
+    """Không gọi được LLM (circuit breaker đang mở / hết lượt thử lại), retry_after: số giây nên chờ"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitError(RuntimeError):
+    """429 từ backend (FakeLLMServer), lỗi của Gemini được nhận diện theo tên / nội dung"""
+
+
+class TransientLLMError(RuntimeError):
+    """5xx / timeout từ backend (FakeLLMServer)"""
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    if isinstance(error, RateLimitError):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in ("resourceexhausted", "resource_exhausted", "429", "quota", "rate limit"))
+
+
+def is_retryable_error(error: Exception) -> bool:
+    if isinstance(error, (RateLimitError, TransientLLMError, TimeoutError, ConnectionError)):
+        return True
+    if is_rate_limit_error(error):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in ("serviceunavailable", "deadlineexceeded", "internalservererror",
+                                             "503", "500", "504", "timeout", "temporarily"))
+
+
+# =======================
+# 2. Token bucket + circuit breaker
+# =======================
+
+class TokenBucket:
+    """rate_per_minute đơn vị / phút, tích lũy tối đa capacity (mặc định = 1 phút quota)"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Số giây phải chờ để lấy được amount (0 nếu lấy được ngay)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Cộng / trừ sau khi biết số token thật (có thể âm -> các request sau phải chờ)"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class CircuitBreaker:
+    """closed -> (failure_threshold lỗi liên tiếp) -> open -> (reset_seconds) -> half_open -> closed / open"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                remaining = self.opened_at + self.reset_seconds - time.monotonic()
+                if remaining > 0:
+                    raise LLMUnavailableError(f"LLM tạm ngừng sau {self.failures} lỗi liên tiếp", remaining)
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    raise LLMUnavailableError("LLM đang được thăm dò lại", 1.0)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Request thăm dò kết thúc mà không có kết quả (bị hủy, chỉ gặp 429): cho request khác thăm dò"""
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+# =======================
+# 3. Pool
+# =======================
+
+@dataclass
+class PoolStats:
+    requests: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retries: int = 0
+    rate_limited: int = 0  # số lần backend trả 429
+    throttle_wait_seconds: float = 0.0  # thời gian chờ bucket phía client
+    rejected_by_breaker: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class _KeySlot:
+    def __init__(self, index: int, key: str, rpm: float, tpm: float):
+        self.index = index
+        self.key = key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.rate_limited = 0
+
+
+def _gemini_factory(key: str, model: str, temperature: float, response_schema: Optional[str] = None):
+    # Pool tự thử lại nên tắt retry bên trong client
+    if response_schema is None:
+        from langchain_google_genai import GoogleGenerativeAI
+
+        return GoogleGenerativeAI(model=model, google_api_key=key, temperature=temperature, max_retries=1)
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from TolerantJson import SCHEMAS
+
+    return ChatGoogleGenerativeAI(model=model, google_api_key=key, temperature=temperature, max_retries=1,
+                                  response_mime_type="application/json",
+                                  response_schema=SCHEMAS[response_schema])
+
+
+class LLMClientPool:
+    def __init__(self, keys: List[str], model: str = DEFAULT_MODEL, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_retries: int = DEFAULT_MAX_RETRIES,
+                 client_factory: Callable[[str, str, float], Any] = _gemini_factory,
+                 breaker: Optional[CircuitBreaker] = None):
+        if not keys:
+            raise ValueError("Không có API key nào (đặt GOOGLE_API_KEYS hoặc GOOGLE_API_KEY trong .env)")
+        self.model = model
+        self.max_retries = max_retries
+        self.client_factory = client_factory
+        self.slots = [_KeySlot(i, key, rpm, tpm) for i, key in enumerate(keys)]
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = PoolStats()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._clients: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def _client(self, slot: _KeySlot, temperature: float, response_schema: Optional[str] = None):
+        key = (slot.index, temperature, response_schema)
+        with self._lock:
+            if key not in self._clients:
+                # client_factory cũ (3 tham số) vẫn dùng được khi không có schema
+                extra = {"response_schema": response_schema} if response_schema else {}
+                self._clients[key] = self.client_factory(slot.key, self.model, temperature, **extra)
+            return self._clients[key]
+
+    def _acquire_slot(self, tokens: int) -> _KeySlot:
+        """Chờ đến khi có key còn quota (requests + tokens), trừ quota và trả về key đó"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                best, best_wait = None, None
+                for slot in self.slots:
+                    wait = max(slot.cooldown_until - now, slot.requests.wait_time(1), slot.tokens.wait_time(tokens))
+                    if best_wait is None or wait < best_wait:
+                        best, best_wait = slot, wait
+                if best_wait <= 0:
+                    best.requests.consume(1)
+                    best.tokens.consume(tokens)
+                    best.calls += 1
+                    return best
+                self.stats.throttle_wait_seconds += best_wait
+            time.sleep(best_wait)
+
+    @staticmethod
+    def backoff_delay(attempt: int) -> float:
+        """Full jitter: ngẫu nhiên trong [0, min(MAX, BASE * 2^attempt)]"""
+        return random.uniform(0, min(MAX_DELAY_SECONDS, BASE_DELAY_SECONDS * (2 ** attempt)))
+
+    def _on_error(self, slot: _KeySlot, error: Exception, attempt: int) -> float:
+        """Ghi nhận lỗi của 1 lần thử, trả về số giây chờ trước lần thử tiếp (raise nếu không thử lại)"""
+        if is_rate_limit_error(error):
+            with self._lock:
+                self.stats.rate_limited += 1
+                slot.rate_limited += 1
+                slot.cooldown_until = time.monotonic() + KEY_COOLDOWN_SECONDS
+        if not is_retryable_error(error) or attempt >= self.max_retries:
+            self._give_up(error)
+            if is_retryable_error(error):
+                raise LLMUnavailableError(f"Gọi LLM thất bại sau {attempt + 1} lần: {error}",
+                                          BASE_DELAY_SECONDS * (2 ** attempt)) from error
+            raise error
+        with self._lock:
+            self.stats.retries += 1
+        return self.backoff_delay(attempt)
+
+    def _give_up(self, error: Exception):
+        """Request thất bại hẳn: breaker chỉ tính 1 lỗi / request, sau khi hết lượt thử.
+
+        Lỗi 429 không tính (cooldown của key đã xử lý): 1 request tự retry không được mở breaker cho cả process.
+        """
+        with self._lock:
+            self.stats.failed += 1
+        if is_rate_limit_error(error):
+            self.breaker.release_probe()
+        else:
+            self.breaker.record_failure()
+
+    def _begin(self):
+        with self._lock:
+            self.stats.requests += 1
+        try:
+            self.breaker.before_call()
+        except LLMUnavailableError:
+            with self._lock:
+                self.stats.rejected_by_breaker += 1
+                self.stats.failed += 1
+            raise
+
+    def invoke(self, prompt: str, temperature: float = 0.7, response_schema: Optional[str] = None) -> str:
+        self._begin()
+        reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+        try:
+            with self._semaphore:
+                for attempt in range(self.max_retries + 1):
+                    slot = self._acquire_slot(reserved)
+                    try:
+                        result = self._client(slot, temperature, response_schema).invoke(prompt)
+                        text = getattr(result, "content", result)
+                    except Exception as e:
+                        delay = self._on_error(slot, e, attempt)
+                        time.sleep(delay)
+                        continue
+                    self._on_success(slot, prompt, text, reserved)
+                    return text
+        finally:
+            # Kết thúc mà chưa ghi nhận kết quả (vd KeyboardInterrupt): không giữ lượt thăm dò mãi
+            self.breaker.release_probe()
+
+    def stream(self, prompt: str, temperature: float = 0.7, response_schema: Optional[str] = None) -> Iterator[str]:
+        """Như invoke nhưng yield từng đoạn text; chỉ thử lại khi chưa nhận được đoạn nào"""
+        self._begin()
+        reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+        try:
+            with self._semaphore:
+                for attempt in range(self.max_retries + 1):
+                    slot = self._acquire_slot(reserved)
+                    parts = []
+                    try:
+                        for chunk in self._client(slot, temperature, response_schema).stream(prompt):
+                            text = getattr(chunk, "content", chunk)
+                            parts.append(text)
+                            yield text
+                    except Exception as e:
+                        if parts:
+                            self._give_up(e)
+                            raise
+                        delay = self._on_error(slot, e, attempt)
+                        time.sleep(delay)
+                        continue
+                    self._on_success(slot, prompt, "".join(parts), reserved)
+                    return
+        finally:
+            # Consumer đóng generator giữa chừng (GeneratorExit): trả lại lượt thăm dò của half-open
+            self.breaker.release_probe()
+
+    def _on_success(self, slot: _KeySlot, prompt: str, text: str, reserved: int):
+        self.breaker.record_success()
+        with self._lock:
+            self.stats.succeeded += 1
+            slot.tokens.adjust(estimate_tokens(prompt) + estimate_tokens(text) - reserved)
+
+    def prewarm(self, temperature: float = 0.7, response_schemas: Iterable[Optional[str]] = (None,)):
+        """Tạo sẵn client cho mọi key (import langchain_google_genai...) để lần gọi đầu không phải chờ"""
+        for slot in self.slots:
+            for schema in response_schemas:
+                self._client(slot, temperature, schema)
+
+    def key_stats(self) -> List[dict]:
+        # Không in key, chỉ 4 ký tự cuối
+        return [{"key": f"...{slot.key[-4:]}", "calls": slot.calls, "rate_limited": slot.rate_limited}
+                for slot in self.slots]
+
+    def print_stats(self):
+        s = self.stats
+        print(f"🔑 LLM pool ({len(self.slots)} key): {s.succeeded}/{s.requests} request thành công, "
+              f"{s.retries} lần thử lại, {s.rate_limited} lần 429, chờ quota {s.throttle_wait_seconds:.1f}s, "
+              f"breaker mở {self.breaker.times_opened} lần")
+
+
+# =======================
+# 4. LLM cho langchain
+# =======================
+
+_pooled_llm_class = None
+_define_lock = threading.Lock()
+
+
+def _define_pooled_llm():
+    """Định nghĩa PooledLLM ở lần dùng đầu: langchain_core.language_models mất ~0.8s để import"""
+    global _pooled_llm_class
+    with _define_lock:
+        if _pooled_llm_class is None:
+            _pooled_llm_class = _pooled_llm()
+        return _pooled_llm_class
+
+
+def _pooled_llm():
+    from langchain_core.language_models.llms import LLM
+    from langchain_core.outputs import GenerationChunk
+
+    class PooledLLM(LLM):
+        """LLM của langchain đi qua LLMClientPool (dùng được trong chain, .invoke, .stream)"""
+
+        pool: Any
+        temperature: float = 0.7
+
+        @property
+        def _llm_type(self) -> str:
+            return "pooled-gemini"
+
+        @property
+        def _identifying_params(self) -> Dict[str, Any]:
+            return {"model": self.pool.model, "temperature": self.temperature}
+
+        def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+            return self.pool.invoke(prompt, self.temperature, kwargs.get("response_schema"))
+
+        def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                    **kwargs: Any) -> Iterator[GenerationChunk]:
+            for text in self.pool.stream(prompt, self.temperature, kwargs.get("response_schema")):
+                chunk = GenerationChunk(text=text)
+                if run_manager is not None:
+                    run_manager.on_llm_new_token(text, chunk=chunk)
+                yield chunk
+
+    return PooledLLM
+
+
+def __getattr__(name):
+    # from LLMClientPool import PooledLLM vẫn dùng được
+    if name == "PooledLLM":
+        return _define_pooled_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_default_pool: Optional[LLMClientPool] = None
+_default_lock = threading.Lock()
+
+
+def get_pool() -> LLMClientPool:
+    """Pool mặc định dùng chung cho cả process (LLM_BACKEND=fake -> FakeLLMServer)"""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            if os.environ.get("LLM_BACKEND", "gemini") == "fake":
+                from FakeLLMServer import fake_client_factory, fake_keys
+
+                _default_pool = LLMClientPool(fake_keys(), client_factory=fake_client_factory)
+            else:
+                from GetApikey import loadapis
+
+                _default_pool = LLMClientPool(loadapis())
+        return _default_pool
+
+
+def get_llm(temperature: float = 0.7) -> "LLM":
+    """PooledLLM (subclass LLM của langchain) dùng pool mặc định"""
+    return _define_pooled_llm()(pool=get_pool(), temperature=temperature)
+
+
+def print_pool_stats():
+    if _default_pool is not None:
+        _default_pool.print_stats()
@@ -1,15 +1,29 @@
 # AdaptiveInterviewer: AI Interviewer với State Machine thông minh
+import copy
 import datetime
-
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from GetApikey import loadapi
+import logging
+import math
+import os
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from EmbeddingRegistry import get_embeddings, load_faiss, warmup
+from FaissIndexFactory import set_search_params
+from InterviewTracing import record_span, span
+from LLMClientPool import LLMUnavailableError, estimate_tokens, get_llm, get_pool
+from LLMStreaming import latency_stats, print_latency_stats, print_token, stream_json_field
+from QuestionBank import QuestionBank
+from RetrievalContextIndex import RetrievalContextIndex
+from TolerantJson import SCHEMAS, JsonRepairError, extract_json
 
 from dataclasses import dataclass
 from typing import List, Dict, Optional
 from enum import Enum
 
+# Output thô của LLM / memory / lịch sử chỉ in ở mức DEBUG (LOG_LEVEL=DEBUG)
+logger = logging.getLogger("interviewer")
+
 
 # =======================
 # 1. Enums & Data Classes
@@ -72,6 +86,51 @@ class InterviewConfig:
     MAX_TOTAL_QUESTIONS = 8
     MAX_UPPER_LEVEL = 2  # max level có thể tăng lên từ ban đầu
 
+    # Hồ sơ thí sinh
+    CANDIDATE_CSV_PATH = "danhsach_thisinh.csv"
+
+    # Knowledge base & retrieval
+    KNOWLEDGE_DB_PATH = "vector_db2chunk_nltk"
+    RETRIEVAL_K = 5
+    # Tham số search cho index xấp xỉ (FaissIndexFactory), bỏ qua với index flat
+    INDEX_NPROBE = 16  # IVF: số cụm được quét
+    INDEX_EF_SEARCH = 64  # HNSW: độ rộng tìm kiếm
+    # Retrieval 2 tầng (CascadeRetriever): store của model nhỏ lấy CASCADE_FETCH_K ứng viên, e5 của
+    # KNOWLEDGE_DB_PATH xếp lại; store nhỏ phải build từ cùng bộ chunk. Để trống = chỉ dùng e5
+    CASCADE_RECALL_DB = os.environ.get("CASCADE_RECALL_DB", "")
+    CASCADE_FETCH_K = int(os.environ.get("CASCADE_FETCH_K", "50"))
+    # Gộp BM25 (LexicalIndex, build cạnh KNOWLEDGE_DB_PATH) với dense bằng RRF; query chỉ gồm định danh
+    # đi thẳng BM25, không embed. HYBRID_RETRIEVAL=0 (mặc định) để chỉ dùng dense
+    HYBRID_RETRIEVAL = os.environ.get("HYBRID_RETRIEVAL", "0") == "1"
+    HYBRID_FETCH_K = int(os.environ.get("HYBRID_FETCH_K", "20"))
+
+    # Ngân hàng câu hỏi sinh sẵn (QuestionBank.py), QUESTION_BANK=0 để luôn sinh trực tiếp
+    QUESTION_BANK_PATH = "question_bank.json"
+    USE_QUESTION_BANK = os.environ.get("QUESTION_BANK", "1") == "1"
+
+    # Sinh trước câu hỏi cho các nhánh harder/same/easier trong lúc thí sinh trả lời (SpeculativePrefetch)
+    SPECULATIVE_PREFETCH = os.environ.get("SPECULATIVE_PREFETCH", "0") == "1"
+
+    # In câu hỏi ra terminal theo từng token (LLMStreaming), STREAM_OUTPUT=0 để chờ cả câu như cũ
+    STREAM_OUTPUT = os.environ.get("STREAM_OUTPUT", "1") == "1"
+
+    # Load hồ sơ thí sinh, FAISS, context index, ngân hàng câu hỏi, LLM client và model song song ở
+    # background; câu hỏi đầu tiên chỉ chờ đúng những thứ nó cần. FAST_START=0: load tuần tự trong __init__
+    FAST_START = os.environ.get("FAST_START", "1") == "1"
+
+    # Gửi kèm response_schema (TolerantJson.SCHEMAS) để Gemini trả JSON đúng dạng, LLM_JSON_SCHEMA=0 để tắt
+    JSON_SCHEMA_OUTPUT = os.environ.get("LLM_JSON_SCHEMA", "1") == "1"
+
+    # Các chủ đề được tính sẵn context (RetrievalContextIndex) khi build index
+    TOPICS = [
+        "Kiểu dữ liệu trong Java",
+        "Biến và hằng trong Java",
+        "Quy tắc đặt tên trong Java",
+        "Toán tử trong Java",
+        "Chuỗi String trong Java",
+        "Nhập dữ liệu từ bàn phím trong Java",
+    ]
+
     # Difficulty progression mapping
     DIFFICULTY_MAP = {
         Level.YEU: [QuestionDifficulty.VERY_EASY, QuestionDifficulty.EASY],
@@ -81,6 +140,15 @@ class InterviewConfig:
         Level.XUAT_SAC: [QuestionDifficulty.VERY_HARD]
     }
 
+    # Mô tả độ khó đưa vào prompt sinh câu hỏi
+    DIFFICULTY_DESCRIPTIONS = {
+        QuestionDifficulty.VERY_EASY: "rất cơ bản, định nghĩa đơn giản",
+        QuestionDifficulty.EASY: "cơ bản, ví dụ thực tế",
+        QuestionDifficulty.MEDIUM: "trung cấp, ứng dụng thực tế",
+        QuestionDifficulty.HARD: "nâng cao, phân tích sâu",
+        QuestionDifficulty.VERY_HARD: "rất khó, tổng hợp kiến thức"
+    }
+
 
 # =======================
 # 3. Utility Functions
@@ -118,118 +186,161 @@ def get_next_difficulty(current: QuestionDifficulty, action: str) -> QuestionDif
         return current
 
 
-import json, re
+# =======================
+# 4. Core Interviewer Class
+# =======================
+
+# Import chủ yếu giữ GIL nên 2 thread là đủ; thành phần được submit theo thứ tự câu hỏi đầu tiên cần
+_startup_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup")
 
-def _clean_and_parse_json_response(raw_text: str, expected_keys: list[str] = None) -> dict:
-    """Parse JSON từ LLM, xử lý cả khi trong string có code block markdown."""
-    if not raw_text:
-        return {}
 
-    text = raw_text.strip()
+class _Component:
+    """Thuộc tính load ở background (FAST_START): đọc thì chờ load xong, gán thì thay giá trị luôn"""
 
-    # Bóc ra phần giữa { ... }
-    first_brace = text.find('{')
-    last_brace = text.rfind('}')
-    if first_brace == -1 or last_brace == -1 or last_brace <= first_brace:
-        return {}
+    def __set_name__(self, owner, name):
+        self.name = name
 
-    candidate = text[first_brace:last_brace + 1]
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return obj._components[self.name].result()
 
-    # Loại bỏ code fences kiểu ```java ... ```
-    candidate = re.sub(r"```[a-zA-Z]*", "", candidate)  # bỏ ```java
-    candidate = candidate.replace("```", "")            # bỏ ```
+    def __set__(self, obj, value):
+        future = Future()
+        future.set_result(value)
+        # Dict mới: gán trên 1 session (copy.copy) không ảnh hưởng interviewer gốc
+        obj._components = {**obj.__dict__.get("_components", {}), self.name: future}
 
-    # Chuẩn hóa xuống dòng trong chuỗi thành \n
-    def _escape_newlines_in_strings(match):
-        inner = match.group(0)
-        return inner.replace("\n", "\\n")
-    candidate = re.sub(r'\".*?\"', _escape_newlines_in_strings, candidate, flags=re.S)
 
-    try:
-        parsed = json.loads(candidate)
-        if expected_keys:
-            parsed = {k: v for k, v in parsed.items() if k in expected_keys}
-        return parsed
-    except Exception as e:
-        print(f"⚠️ JSON parse error after cleaning: {e}")
-        return {}
+def _load_candidate_store():
+    from CandidateStore import CandidateStore  # pandas, ~0.4s import
 
+    return CandidateStore.from_csv(InterviewConfig.CANDIDATE_CSV_PATH)
 
 
-import re, json
+def _load_knowledge_db():
+    db = load_faiss(InterviewConfig.KNOWLEDGE_DB_PATH, lazy=True, query_cache=True)
+    set_search_params(db.index, InterviewConfig.INDEX_NPROBE, InterviewConfig.INDEX_EF_SEARCH)
+    return db
 
-def _clean_and_parse_single_question(raw_text: str) -> str:
-    """
-    Input: raw_text từ LLM (có thể kèm ```json``` hoặc lộn xộn)
-    Output: 1 string câu hỏi sạch hoặc "" nếu không parse được
-    """
-    if not raw_text:
-        return ""
 
-    text = raw_text.strip()
+def _load_cascade(interviewer: "AdaptiveInterviewer"):
+    if not InterviewConfig.CASCADE_RECALL_DB:
+        return None
+    from CascadeRetriever import load_cascade  # langchain_core.retrievers
 
-    # 1) Nếu có code fence ```json ... ```
-    code_fence_match = re.search(r"```(?:json)?\s*(.*?)\s*```", text, flags=re.S | re.I)
-    if code_fence_match:
-        text = code_fence_match.group(1).strip()
+    # Rerank bằng knowledge_db đã load (chờ component, không load + set_search_params lại)
+    return load_cascade(InterviewConfig.CASCADE_RECALL_DB, InterviewConfig.KNOWLEDGE_DB_PATH,
+                        k=InterviewConfig.RETRIEVAL_K, fetch_k=InterviewConfig.CASCADE_FETCH_K,
+                        rerank_db=interviewer.knowledge_db)
 
-    # 2) Thử parse JSON object
-    first_brace = text.find('{')
-    last_brace = text.rfind('}')
-    if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-        candidate = text[first_brace:last_brace+1]
-        try:
-            parsed = json.loads(candidate)
-            if isinstance(parsed, dict) and "question" in parsed:
-                return _sanitize_question(parsed["question"])
-        except Exception:
-            pass
 
-    # 3) Nếu thất bại, thử tìm chuỗi trong ngoặc kép
-    quoted = re.findall(r'"([^"]{10,})"', text, flags=re.S)  # chuỗi dài ≥10 ký tự
-    if quoted:
-        return _sanitize_question(quoted[0])
+def _load_hybrid(interviewer: "AdaptiveInterviewer"):
+    if not InterviewConfig.HYBRID_RETRIEVAL:
+        return None
+    from LexicalIndex import load_hybrid  # langchain_core.retrievers
 
-    # 4) Fallback: lấy dòng dài nhất làm câu hỏi
-    lines = [ln.strip() for ln in text.splitlines() if len(ln.strip()) > 20]
-    if lines:
-        return _sanitize_question(max(lines, key=len))
+    return load_hybrid(InterviewConfig.KNOWLEDGE_DB_PATH, interviewer.knowledge_db, k=InterviewConfig.RETRIEVAL_K,
+                       fetch_k=InterviewConfig.HYBRID_FETCH_K)
 
-    return ""
 
+def _load_question_bank():
+    if not InterviewConfig.USE_QUESTION_BANK:
+        return None
+    return QuestionBank.load(InterviewConfig.QUESTION_BANK_PATH, InterviewConfig.KNOWLEDGE_DB_PATH)
 
-def _sanitize_question(q: str) -> str:
-    """Làm sạch 1 câu hỏi: bỏ backticks, quotes, số thứ tự..."""
-    s = str(q).strip()
-    s = re.sub(r'^[`\"]+|[`\"]+$', '', s).strip()
-    s = re.sub(r'^\s*"\s*', '', s)
-    s = re.sub(r'^\s*\(?\d+\)?[\).\s:-]+\s*', '', s)
-    s = s.rstrip(",;}]")
-    return s.strip()
 
+def _load_llm():
+    llm = get_llm(temperature=0.7)
+    if InterviewConfig.FAST_START:
+        # Tạo sẵn client (import langchain_google_genai) cho các lượt gọi có / không có schema
+        get_pool().prewarm(0.7, [None, "question", "evaluation"] if InterviewConfig.JSON_SCHEMA_OUTPUT else [None])
+    return llm
 
-# =======================
-# 4. Core Interviewer Class
-# =======================
 
 class AdaptiveInterviewer:
+    # Hồ sơ thí sinh: tra cứu chính xác theo (Tên, Lớp), không cần embedding
+    candidate_store = _Component()
+    # FAISS dùng chung instance embeddings (model load ở background riêng)
+    knowledge_db = _Component()
+    # Model nhỏ recall + e5 rerank (None nếu không bật CASCADE_RECALL_DB)
+    cascade = _Component()
+    # BM25 + dense (None nếu không bật HYBRID_RETRIEVAL hoặc store chưa có index BM25)
+    hybrid = _Component()
+    # Context tính sẵn cho (topic, độ khó), fallback về FAISS khi không có
+    context_index = _Component()
+    # Câu hỏi sinh sẵn theo (topic, độ khó), hết thì mới gọi LLM
+    question_bank = _Component()
+    # Gemini qua pool dùng chung (LLMClientPool): nhiều key, giới hạn quota, retry + circuit breaker
+    llm = _Component()
+
     def __init__(self):
         # Load components
-        self.api_key = loadapi()
-        self.embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large-instruct")
-        self.cv_db = FAISS.load_local("vector_db_csv", self.embeddings, allow_dangerous_deserialization=True)
-        self.knowledge_db = FAISS.load_local("vector_db2chunk_nltk", self.embeddings,
-                                             allow_dangerous_deserialization=True)
-        self.retriever = self.knowledge_db.as_retriever(search_kwargs={"k": 5})
-        self.llm = GoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=self.api_key,
-            temperature=0.7
-        )
+        # Query embedding đi qua cache LRU + đĩa (QueryEmbeddingCache), model load ở background
+        self._started_at = time.perf_counter()
+        self.startup_seconds: Dict[str, float] = {}  # thời điểm (tính từ __init__) từng thành phần sẵn sàng
+        self.embeddings = get_embeddings(lazy=True, query_cache=True)
+        self._model_future = warmup()
+        self._model_future.add_done_callback(
+            lambda f: f.exception() is None and
+            self.startup_seconds.setdefault("model", time.perf_counter() - self._started_at))
+        # Thứ tự = thứ tự câu hỏi đầu tiên cần; knowledge_db chỉ cần khi context index không có sẵn
+        loaders = {
+            "candidate_store": _load_candidate_store,
+            "llm": _load_llm,
+            "question_bank": _load_question_bank,
+            "context_index": lambda: RetrievalContextIndex(InterviewConfig.KNOWLEDGE_DB_PATH,
+                                                           k=InterviewConfig.RETRIEVAL_K),
+            "knowledge_db": _load_knowledge_db,
+            "cascade": lambda: _load_cascade(self),
+            "hybrid": lambda: _load_hybrid(self),
+        }
+        # Gán dần: loader sau (cascade, hybrid) có thể chờ component đã start trước đó (knowledge_db)
+        self._components = {}
+        for name, loader in loaders.items():
+            self._components[name] = self._start_component(name, loader)
         # === New: conversation memory (simple list) ===
         self.memory: list[dict] = []
+        self.session_id: Optional[str] = None  # gắn vào các span (InterviewTracing)
         self.max_memory_turns = 6   # chỉ giữ 6 lượt gần nhất
 
+    def _start_component(self, name: str, loader) -> Future:
+        def run():
+            value = loader()
+            self.startup_seconds[name] = time.perf_counter() - self._started_at
+            return value
+
+        if InterviewConfig.FAST_START:
+            return _startup_executor.submit(run)
+        future = Future()
+        future.set_result(run())
+        return future
+
+    def wait_until_ready(self, include_model: bool = False) -> Dict[str, float]:
+        """Chờ mọi thành phần load xong (include_model: cả embedding model), trả về startup_seconds"""
+        for future in self._components.values():
+            future.result()
+        if include_model:
+            self._model_future.result()
+        return dict(self.startup_seconds)
+
+    @property
+    def retriever(self):
+        if self.hybrid is not None:
+            return self.hybrid.as_retriever(search_kwargs={"k": InterviewConfig.RETRIEVAL_K,
+                                                           "fetch_k": InterviewConfig.HYBRID_FETCH_K})
+        if self.cascade is not None:
+            return self.cascade.as_retriever(search_kwargs={"k": InterviewConfig.RETRIEVAL_K,
+                                                            "fetch_k": InterviewConfig.CASCADE_FETCH_K})
+        return self.knowledge_db.as_retriever(search_kwargs={"k": InterviewConfig.RETRIEVAL_K})
+
+    def new_session(self, session_id: Optional[str] = None) -> "AdaptiveInterviewer":
+        """Tạo interviewer cho 1 phiên mới: dùng chung model, FAISS, LLM nhưng memory riêng"""
+        session = copy.copy(self)
+        session.memory = []
+        session.session_id = session_id or uuid.uuid4().hex
+        return session
+
     # ============ Memory Helpers ============
     def add_to_memory(self, role: str, content: str):
         """Thêm một đoạn hội thoại vào memory."""
@@ -242,27 +353,100 @@ class AdaptiveInterviewer:
             return ""
         return "\n".join([f"{m['role']}: {m['content']}" for m in self.memory])
 
+    def retrieve_context(self, query: str) -> str:
+        """Lấy tài liệu tham khảo: ưu tiên context index tính sẵn, nếu không có thì gọi retriever.
+
+        Context index được build bằng FAISS thuần nên bỏ qua khi bật cascade hoặc hybrid.
+        """
+        if self.hybrid is None and self.cascade is None:
+            with span("context_index", self.session_id) as s:
+                chunks = self.context_index.lookup(query)
+                s.set(hit=chunks is not None)
+            if chunks is not None:
+                return "\n\n".join(c["page_content"] for c in chunks)
+        if self.hybrid is not None:
+            # Nhánh dense đi qua cascade nếu có bật
+            with span("hybrid_search", self.session_id, k=InterviewConfig.RETRIEVAL_K) as s:
+                knowledge_context, info = self.hybrid.search_with_info(query, dense=self.cascade)
+                s.set(**info)
+            return "\n\n".join(doc.page_content for doc in knowledge_context)
+        if self.cascade is not None:
+            with span("cascade_search", self.session_id, k=InterviewConfig.RETRIEVAL_K,
+                      fetch_k=InterviewConfig.CASCADE_FETCH_K):
+                knowledge_context = self.cascade.search(query)
+            return "\n\n".join(doc.page_content for doc in knowledge_context)
+        # Giống self.retriever.invoke(query) nhưng đo riêng embedding và FAISS search
+        with span("embedding", self.session_id):
+            vector = self.knowledge_db.embeddings.embed_query(query)
+        with span("faiss_search", self.session_id, k=InterviewConfig.RETRIEVAL_K):
+            knowledge_context = self.knowledge_db.similarity_search_by_vector(vector, k=InterviewConfig.RETRIEVAL_K)
+        return "\n\n".join([doc.page_content for doc in knowledge_context])
+
     def load_candidate_profile(self, candidate_name: str) -> tuple[str, Level]:
         """Load hồ sơ và phân loại level"""
-        profile_docs = self.cv_db.similarity_search(candidate_name, k=1)
-        if not profile_docs:
-            raise ValueError(f"Không tìm thấy hồ sơ cho {candidate_name}")
+        # candidate_name dạng "Tên,Lớp" (hoặc chỉ "Tên" nếu không trùng), raise ValueError nếu không có
+        with span("profile_lookup", self.session_id):
+            record = self.candidate_store.find(candidate_name)
+        profile_content = record.profile_text
 
-        profile_content = profile_docs[0].page_content
-
-        # Extract điểm 40% từ profile (giả sử có format chuẩn)
-        score_match = re.search(r'Điểm 40%[:\s]+([0-9.]+)', profile_content)
-        if score_match:
-            score_40 = float(score_match.group(1))
-            level = classify_level_from_score(score_40)
+        if not math.isnan(record.score_40):
+            level = classify_level_from_score(record.score_40)
         else:
             # Fallback: dùng LLM để classify
             level = self._classify_level_with_llm(profile_content)
 
         return profile_content, level
 
+    # ============ LLM Helpers (có span) ============
+    def _call_llm(self, kind: str, prompt: str, on_token=None, field: str = "question",
+                  schema: Optional[str] = None) -> str:
+        """Gọi LLM (stream field nếu có on_token), ghi span llm_call kèm số token ước lượng.
+
+        schema: tên trong TolerantJson.SCHEMAS, gửi cho LLM làm response_schema (JSON_SCHEMA_OUTPUT).
+        """
+        llm_kwargs = {"response_schema": schema} if schema and InterviewConfig.JSON_SCHEMA_OUTPUT else {}
+        with span("llm_call", self.session_id, kind=kind, streamed=on_token is not None,
+                  prompt_tokens=estimate_tokens(prompt), schema=bool(llm_kwargs)) as s:
+            if on_token is not None:
+                streamed = stream_json_field(self.llm, prompt, field, on_token, **llm_kwargs)
+                result = streamed.text
+                s.set(ttft_ms=round(streamed.ttft_seconds * 1000, 1) if streamed.ttft_seconds is not None else None)
+            else:
+                result = self.llm.invoke(prompt, **llm_kwargs)
+            s.set(response_tokens=estimate_tokens(result))
+        logger.debug("LLM output (%s): %s", kind, result)
+        return result
+
+    def _parse_llm_json(self, kind: str, result: str, schema: str) -> dict:
+        """Đọc JSON theo TolerantJson.SCHEMAS[schema], {} nếu không đọc được (có log cảnh báo)"""
+        with span("json_parse", self.session_id, kind=kind) as s:
+            parsed = extract_json(result, schema)
+            s.set(ok=bool(parsed))
+        if not parsed:
+            logger.warning("Không đọc được JSON (%s) từ output LLM: %r", kind, (result or "")[:300])
+        return parsed
+
+    def _ask_json(self, kind: str, prompt: str, schema: str, on_token=None, field: str = "question") -> tuple[dict, str]:
+        """Gọi LLM + đọc JSON, hỏi lại 1 lần (không stream) nếu không đọc được; vẫn lỗi thì raise JsonRepairError.
+
+        Không tự điền giá trị mặc định (điểm 5.0, câu hỏi mẫu): thí sinh sẽ bị chấm / hỏi sai mà không ai biết.
+        Trả về (JSON đã đọc, raw output của lần gọi cuối).
+        """
+        def usable(parsed: dict) -> bool:
+            return bool(parsed) and all(parsed.get(key) != "" for key in SCHEMAS[schema]["required"])
+
+        result = self._call_llm(kind, prompt, on_token, field=field, schema=schema)
+        parsed = self._parse_llm_json(kind, result, schema)
+        if not usable(parsed):
+            result = self._call_llm(kind, prompt, schema=schema)
+            parsed = self._parse_llm_json(kind, result, schema)
+        if not usable(parsed):
+            raise JsonRepairError(f"LLM không trả về JSON hợp lệ ({kind}) sau 2 lần gọi")
+        return parsed, result
+
     def _classify_level_with_llm(self, profile: str) -> Level:
         """Fallback method để classify level bằng LLM"""
+        started_at = time.perf_counter()
         classify_prompt = f"""
         Bạn là một Interviewer AI và đang chuẩn bị phỏng vấn bài thi vấn đáp của 1 thí sinh .
         Phân loại trình độ thí sinh theo điểm 40%: Yếu (<5), Trung bình (5-6.5), Khá (6.5-8), Giỏi (8-9), Xuất sắc (9-10).
@@ -271,9 +455,9 @@ class AdaptiveInterviewer:
 
         Trả về JSON: {{"level": "yeu|trung_binh|kha|gioi|xuat_sac"}}
         """
-        result = self.llm.invoke(classify_prompt)
-        parsed = _clean_and_parse_json_response(result, ["level"])
-        level_str = parsed.get("level", "trung_binh")
+        record_span("prompt_build", started_at, self.session_id, kind="classify")
+        parsed, _ = self._ask_json("classify", classify_prompt, "level")
+        level_str = parsed["level"]
 
         # Convert to enum
         level_mapping = {
@@ -285,24 +469,30 @@ class AdaptiveInterviewer:
         }
         return level_mapping.get(level_str, Level.TRUNG_BINH)
 
-    def generate_question(self, topic: str, difficulty: QuestionDifficulty, context: str = "") -> str:
-        """Generate câu hỏi theo topic và độ khó"""
-        knowledge_context = self.retriever.invoke(f"{topic} {difficulty.value}")
-        knowledge_text = "\n\n".join([doc.page_content for doc in knowledge_context])
+    def generate_question(self, topic: str, difficulty: QuestionDifficulty, context: str = "",
+                          on_token=None) -> str:
+        """Generate câu hỏi theo topic và độ khó (on_token: nhận từng đoạn câu hỏi khi stream)"""
         history_text = self.build_history_prompt()  # Lấy lịch sử hội thoại
-        difficulty_descriptions = {
-            QuestionDifficulty.VERY_EASY: "rất cơ bản, định nghĩa đơn giản",
-            QuestionDifficulty.EASY: "cơ bản, ví dụ thực tế",
-            QuestionDifficulty.MEDIUM: "trung cấp, ứng dụng thực tế",
-            QuestionDifficulty.HARD: "nâng cao, phân tích sâu",
-            QuestionDifficulty.VERY_HARD: "rất khó, tổng hợp kiến thức"
-        }
+        question, _, result = self.generate_question_text(topic, difficulty, context, history_text, on_token)
+        self.add_to_memory("interviewer", question)
+         # Thêm câu hỏi vào memory
+        logger.debug("memory: %s", self.memory)
+        return question
 
+    def generate_question_text(self, topic: str, difficulty: QuestionDifficulty, context: str,
+                               history_text: str, on_token=None) -> tuple[str, str, str]:
+        """Sinh câu hỏi nhưng không đụng vào memory (dùng được cho sinh trước / song song).
+
+        on_token khác None: stream output, on_token nhận dần phần text của field "question".
+        Trả về (câu hỏi, prompt, raw output của LLM).
+        """
+        knowledge_text = self.retrieve_context(f"{topic} {difficulty.value}")
+        started_at = time.perf_counter()
         generate_prompt = f"""
         Bạn là một Interviewer AI.
          Đây là lịch sử hội thoại gần đây, :
         {history_text}
-        Tạo 1 câu hỏi phỏng vấn Java về chủ đề "{topic}" với độ khó "{difficulty_descriptions[difficulty]}".
+        Tạo 1 câu hỏi phỏng vấn Java về chủ đề "{topic}" với độ khó "{InterviewConfig.DIFFICULTY_DESCRIPTIONS[difficulty]}".
 
         {context if context else ""}
 
@@ -318,19 +508,14 @@ class AdaptiveInterviewer:
         - KHÔNG kèm lời chào, giải thích, hay code fence (```).
         """
 
-        result = self.llm.invoke(generate_prompt)
-        print(result)
-        parsed = _clean_and_parse_json_response(result, ["question"])
-        print(parsed)
-        self.add_to_memory("interviewer", parsed.get("question", "Hãy giải thích về Java?"))
-         # Thêm câu hỏi vào memory
-        print(self.memory)
-        return parsed.get("question", "Hãy giải thích về Java?")
+        record_span("prompt_build", started_at, self.session_id, kind="question")
+        parsed, result = self._ask_json("question", generate_prompt, "question", on_token)
+        return parsed["question"], generate_prompt, result
 
     def evaluate_answer(self, question: str, answer: str, topic: str) -> tuple[float, str]:
         """Đánh giá câu trả lời và trả về (score, analysis)"""
-        knowledge_context = self.retriever.invoke(topic)
-        knowledge_text = "\n\n".join([doc.page_content for doc in knowledge_context])
+        knowledge_text = self.retrieve_context(topic)
+        started_at = time.perf_counter()
         history_text = self.build_history_prompt()
         eval_prompt = f"""
         Đây là lịch sử hội thoại gần đây:
@@ -350,16 +535,16 @@ class AdaptiveInterviewer:
             "analysis": "<nhận xét ngắn gọn>"
         }}
         """
-        print(history_text)
-        result = self.llm.invoke(eval_prompt)
-        parsed = _clean_and_parse_json_response(result, ["score", "analysis"])
+        record_span("prompt_build", started_at, self.session_id, kind="evaluate")
+        logger.debug("history: %s", history_text)
+        parsed, _ = self._ask_json("evaluate", eval_prompt, "evaluation")
 
-        score = float(parsed.get("score", 5.0))
+        score = float(parsed["score"])
         analysis = parsed.get("analysis", "Không có nhận xét")
         # === Cập nhật memory ===
         self.add_to_memory("student", answer)
         self.add_to_memory("interviewer", f"📊 Điểm: {score}/10 - {analysis}")
-        print("current memory:", self.memory)
+        logger.debug("current memory: %s", self.memory)
         return score, analysis
 
     def decide_next_action(self, score: float, state: InterviewState) -> str:
@@ -416,16 +601,12 @@ class AdaptiveInterviewer:
             scores = [attempt.score for attempt in state.history]
             state.final_score = sum(scores) / len(scores) if scores else 0.0
 
-    def run_interview(self, candidate_name: str, topic: str) -> Dict:
-        """Main interview loop"""
-        print(f"🎯 Bắt đầu phỏng vấn: {candidate_name} - Chủ đề: {topic}")
-
-        # 1. Load candidate profile & classify
+    def start_interview(self, candidate_name: str, topic: str) -> InterviewState:
+        """Load hồ sơ, phân loại level và khởi tạo state cho buổi phỏng vấn"""
         profile, level = self.load_candidate_profile(candidate_name)
         initial_difficulty = get_initial_difficulty(level)
 
-        # 2. Initialize state
-        state = InterviewState(
+        return InterviewState(
             candidate_name=candidate_name,
             profile=profile,
             level=level,
@@ -440,31 +621,93 @@ class AdaptiveInterviewer:
             upper_level_reached=0
         )
 
-        print(f"📋 Hồ sơ: {profile}")
-        print(f"📊 Level: {level.value} - Độ khó ban đầu: {initial_difficulty.value}")
+    @staticmethod
+    def question_context_hint(state: InterviewState) -> str:
+        return f"Đã hỏi {state.total_questions_asked} câu. " \
+               f"Attempts ở level hiện tại: {state.attempts_at_current_level}"
+
+    def draw_bank_question(self, state: InterviewState) -> Optional[str]:
+        """Lấy câu hỏi chưa hỏi trong phiên từ ngân hàng câu hỏi, None nếu đã hết"""
+        if self.question_bank is None:
+            return None
+        asked = {attempt.question for attempt in state.history}
+        return self.question_bank.draw(state.topic, state.current_difficulty.value, asked)
+
+    def next_question(self, state: InterviewState, on_token=None) -> str:
+        """Câu hỏi tiếp theo theo độ khó hiện tại: ưu tiên ngân hàng câu hỏi, hết thì sinh bằng LLM.
+
+        on_token chỉ được gọi khi câu hỏi được sinh (stream) bằng LLM.
+        """
+        question = self.draw_bank_question(state)
+        if question is not None:
+            self.add_to_memory("interviewer", question)
+            return question
+        return self.generate_question(state.topic, state.current_difficulty, self.question_context_hint(state),
+                                      on_token)
+
+    def submit_answer(self, state: InterviewState, question: str, answer: str) -> tuple[float, str]:
+        """Chấm câu trả lời và cập nhật state, trả về (score, analysis)"""
+        score, analysis = self.evaluate_answer(question, answer, state.topic)
+        with span("state_update", self.session_id):
+            self.update_state_after_question(state, question, answer, score, analysis)
+        return score, analysis
+
+    def run_interview(self, candidate_name: str, topic: str) -> Dict:
+        """Main interview loop"""
+        print(f"🎯 Bắt đầu phỏng vấn: {candidate_name} - Chủ đề: {topic}")
+        self.session_id = uuid.uuid4().hex
+
+        # 1-2. Load candidate profile, classify & initialize state
+        state = self.start_interview(candidate_name, topic)
+
+        print(f"📋 Hồ sơ: {state.profile}")
+        print(f"📊 Level: {state.level.value} - Độ khó ban đầu: {state.current_difficulty.value}")
         print("\n" + "=" * 50)
 
+        # Opt-in: sinh trước câu hỏi kế tiếp trong lúc chờ thí sinh trả lời
+        prefetcher = None
+        prefetched = None
+        if InterviewConfig.SPECULATIVE_PREFETCH:
+            from SpeculativePrefetch import QuestionPrefetcher
+            prefetcher = QuestionPrefetcher(self)
+
         # 3. Main interview loop
         while not state.is_finished:
             try:
-                # Generate question
-                context_hint = f"Đã hỏi {state.total_questions_asked} câu. " \
-                               f"Attempts ở level hiện tại: {state.attempts_at_current_level}"
-                question = self.generate_question(topic, state.current_difficulty, context_hint)
-
-                # Ask question
+                # Ask question: in tiêu đề trước, câu hỏi sinh bằng LLM hiện ra theo từng token
                 print(f"\n🤖 Câu hỏi #{state.total_questions_asked + 1} (Độ khó: {state.current_difficulty.value}):")
-                print(f"   {question}")
+                streamed = []
+
+                def show_token(text):
+                    if not streamed:
+                        print("   ", end="")
+                    streamed.append(text)
+                    print_token(text)
+
+                # Generate question (dùng câu đã sinh trước nếu đúng nhánh)
+                question = prefetched or self.next_question(
+                    state, show_token if InterviewConfig.STREAM_OUTPUT else None)
+                prefetched = None
+                if streamed:
+                    print()
+                    if "".join(streamed).strip() != question.strip():
+                        # Output bị cắt / parse lại khác đoạn đã stream
+                        print(f"   {question}")
+                else:
+                    print(f"   {question}")
+
+                if prefetcher is not None:
+                    prefetcher.start(state)
 
                 # Get answer
                 answer = input("👩‍🎓 Thí sinh trả lời: ").strip()
 
-                # Evaluate
-                score, analysis = self.evaluate_answer(question, answer, topic)
+                # Evaluate & update state
+                score, analysis = self.submit_answer(state, question, answer)
                 print(f"📊 Điểm: {score}/10 - {analysis}")
 
-                # Update state
-                self.update_state_after_question(state, question, answer, score, analysis)
+                if prefetcher is not None:
+                    prefetched = prefetcher.commit(state) if not state.is_finished else prefetcher.cancel()
 
                 # Show state info
                 if not state.is_finished:
@@ -478,19 +721,34 @@ class AdaptiveInterviewer:
                 scores = [attempt.score for attempt in state.history]
                 state.final_score = sum(scores) / len(scores) if scores else 0.0
                 break
+            except LLMUnavailableError as e:
+                # Hết quota / LLM lỗi liên tục: chờ thay vì lặp lại ngay
+                print(f"⏳ LLM tạm thời không dùng được, thử lại sau {e.retry_after:.0f}s: {e}")
+                time.sleep(e.retry_after)
+                continue
             except Exception as e:
                 print(f"❌ Lỗi: {e}")
                 # Continue with a simple fallback question
                 continue
 
         # 4. Generate summary
-        return self.generate_summary(state)
+        summary = self.generate_summary(state)
+        if prefetcher is not None:
+            prefetcher.shutdown()
+            prefetcher.print_stats()
+            summary["interview_stats"]["prefetch"] = prefetcher.stats.to_dict()
+        if InterviewConfig.STREAM_OUTPUT and latency_stats():
+            # Time-to-first-token + tổng thời gian của các câu hỏi sinh bằng stream
+            print_latency_stats()
+            summary["interview_stats"]["llm_latency"] = latency_stats()
+        return summary
 
-    def generate_summary(self, state: InterviewState) -> Dict:
-        """Generate final interview summary"""
-        print("\n" + "=" * 50)
-        print("📝 TỔNG KẾT PHỎNG VẤN")
-        print("=" * 50)
+    def generate_summary(self, state: InterviewState, verbose: bool = True) -> Dict:
+        """Generate final interview summary (verbose=False: không in ra terminal, vd BatchInterviewRunner)"""
+        if verbose:
+            print("\n" + "=" * 50)
+            print("📝 TỔNG KẾT PHỎNG VẤN")
+            print("=" * 50)
 
         summary = {
             "candidate_info": {
@@ -519,12 +777,14 @@ class AdaptiveInterviewer:
             }
             summary["question_history"].append(q_info)
 
-            print(f"\nCâu {i} ({attempt.difficulty.value}):")
-            print(f"Q: {attempt.question}")
-            print(f"A: {attempt.answer}")
-            print(f"Score: {attempt.score}/10 - {attempt.analysis}")
+            if verbose:
+                print(f"\nCâu {i} ({attempt.difficulty.value}):")
+                print(f"Q: {attempt.question}")
+                print(f"A: {attempt.answer}")
+                print(f"Score: {attempt.score}/10 - {attempt.analysis}")
 
-        print(f"\n🏆 ĐIỂM TỔNG KẾT: {state.final_score:.1f}/10")
+        if verbose:
+            print(f"\n🏆 ĐIỂM TỔNG KẾT: {state.final_score:.1f}/10")
 
         return summary
 
@@ -534,12 +794,17 @@ class AdaptiveInterviewer:
 # =======================
 
 if __name__ == "__main__":
-    from pymongo import MongoClient
+    from InterviewTracing import get_tracer, start_metrics_server
+    from LLMClientPool import print_pool_stats
+    from QueryEmbeddingCache import print_query_cache_stats
+    from ResultWriter import ResultWriter, mongo_collection
+
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING"))
+    if os.environ.get("METRICS_PORT"):
+        start_metrics_server(int(os.environ["METRICS_PORT"]))
 
-    # Kết nối MongoDB
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client["interviewer_ai"]
-    collection = db["interview_results"]
+    # Kết nối MongoDB: ghi nền theo lô, journal cục bộ giữ kết quả khi Mongo lỗi (ResultWriter)
+    writer = ResultWriter(mongo_collection())
     interviewer = AdaptiveInterviewer()
 
     # Test cases
@@ -551,12 +816,13 @@ if __name__ == "__main__":
     for candidate, topic in test_cases[:1]:  # Chỉ test 1 case đầu tiên
         result = interviewer.run_interview(candidate, topic)
 
-        # Save results
-        with open(f"InterviewScripts/interview_result_{candidate.replace(',', '_')}.json", "w", encoding="utf-8") as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        # Save results: file JSON trong InterviewScripts/ + MongoDB, đều ghi ở thread nền
+        writer.submit(result)
+        print(f"✅ Kết quả đã đưa vào hàng đợi lưu (journal: {writer.journal.path})")
+        logger.debug("memory: %s", interviewer.memory)
+        print_query_cache_stats()
+        print_pool_stats()
+        get_tracer().print_summary()
+        break
 
-        collection.insert_one(result)
-         # Lưu vào MongoDB
-        print(f"✅ Kết quả đã lưu vào file JSON")
-        print("memory",interviewer.memory)
-        break
\ No newline at end of file
+    writer.close()
\ No newline at end of file
@@ -0,0 +1,203 @@
+# LLMStreaming: stream output của Gemini thay vì chờ llm.invoke trả về toàn bộ
+#
+#   result = stream_text(llm, prompt, on_token=print_token)         # text thường (chat RAG)
+#   result = stream_json_field(llm, prompt, "question", on_token)   # prompt trả về JSON
+#
+# Với prompt trả JSON ({"question": "..."}), JsonFieldStreamer giải mã dần giá trị của 1 field
+# ngay khi token tới, nên câu hỏi hiện ra trước khi JSON đóng ngoặc. result.text vẫn là toàn bộ
+# output để parse lại như cũ (TolerantJson.extract_json).
+# Tham số thêm (vd response_schema=...) được chuyển nguyên cho llm.stream.
+# Mỗi lần gọi ghi lại time-to-first-token (TTFT) và tổng thời gian, xem print_latency_stats().
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+OnToken = Callable[[str], None]
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_HEX_DIGITS = re.compile(r"[0-9a-fA-F]{0,4}")
+_LOW_SURROGATE = re.compile(r"\\u[dD][c-fC-F][0-9a-fA-F]{2}")
+
+
+# =======================
+# 1. Giải mã dần 1 field JSON
+# =======================
+
+class JsonFieldStreamer:
+    """Nhận từng đoạn output JSON, trả về phần text mới của field (đã bỏ escape)"""
+
+    def __init__(self, field: str):
+        self.field = field
+        self._key = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self._buffer = ""
+        self._pos = 0
+        self._state = "search"  # search -> value -> done
+        self._value: List[str] = []
+
+    @property
+    def value(self) -> str:
+        return "".join(self._value)
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if self._state == "search":
+            match = self._key.search(self._buffer)
+            if match is None:
+                return ""
+            self._pos = match.end()
+            self._state = "value"
+        if self._state != "value":
+            return ""
+
+        out = []
+        buf, i = self._buffer, self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self._state = "done"
+                i += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            # Escape: chờ đủ ký tự nếu bị cắt giữa 2 chunk
+            if i + 1 >= len(buf):
+                break
+            esc = buf[i + 1]
+            if esc != "u":
+                out.append(_ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            digits = _HEX_DIGITS.match(buf, i + 2).group()
+            if len(digits) < 4 and i + 2 + len(digits) < len(buf):
+                # \u không theo sau bởi 4 hex ("\user", đường dẫn Windows): giữ nguyên như TolerantJson
+                out.append("\\u")
+                i += 2
+                continue
+            if len(digits) < 4:
+                break
+            code = int(digits, 16)
+            if 0xD800 <= code < 0xDC00:
+                # Cặp surrogate (emoji...) cần thêm \uXXXX thứ 2
+                if _LOW_SURROGATE.match(buf, i + 6):
+                    low = int(buf[i + 8:i + 12], 16)
+                    out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                    i += 12
+                    continue
+                if i + 12 > len(buf):
+                    break
+                out.append("\ufffd")  # nửa cặp surrogate lẻ
+                i += 6
+            else:
+                out.append(chr(code))
+                i += 6
+        self._pos = i
+        text = "".join(out)
+        self._value.append(text)
+        return text
+
+
+# =======================
+# 2. Stream + đo độ trễ
+# =======================
+
+@dataclass
+class StreamResult:
+    text: str  # toàn bộ output
+    ttft_seconds: Optional[float]  # token đầu tiên từ LLM
+    total_seconds: float
+    field_text: Optional[str] = None  # giá trị field đã stream (stream_json_field)
+    first_field_seconds: Optional[float] = None  # ký tự đầu tiên của field hiện ra
+
+
+_latency_lock = threading.Lock()
+_latency_log: List[Dict] = []
+
+
+def record_latency(kind: str, result: StreamResult):
+    with _latency_lock:
+        _latency_log.append({"kind": kind, "ttft_seconds": result.ttft_seconds,
+                             "first_field_seconds": result.first_field_seconds,
+                             "total_seconds": result.total_seconds})
+
+
+def latency_stats() -> Dict[str, dict]:
+    """p50/p95 TTFT + tổng thời gian theo loại prompt"""
+    with _latency_lock:
+        log = list(_latency_log)
+    stats = {}
+    for kind in sorted({e["kind"] for e in log}):
+        entries = [e for e in log if e["kind"] == kind]
+        ttft = [e["ttft_seconds"] for e in entries if e["ttft_seconds"] is not None]
+        total = [e["total_seconds"] for e in entries]
+        stats[kind] = {
+            "calls": len(entries),
+            "ttft_p50": float(np.percentile(ttft, 50)) if ttft else None,
+            "ttft_p95": float(np.percentile(ttft, 95)) if ttft else None,
+            "total_p50": float(np.percentile(total, 50)),
+            "total_p95": float(np.percentile(total, 95)),
+        }
+    return stats
+
+
+def print_latency_stats():
+    for kind, s in latency_stats().items():
+        ttft = f"{s['ttft_p50']:.2f}s (p95 {s['ttft_p95']:.2f}s)" if s["ttft_p50"] is not None else "N/A"
+        print(f"⏱️ {kind}: {s['calls']} lượt, TTFT {ttft}, tổng {s['total_p50']:.2f}s (p95 {s['total_p95']:.2f}s)")
+
+
+def stream_text(llm, prompt: str, on_token: Optional[OnToken] = None, kind: str = "chat",
+                **llm_kwargs) -> StreamResult:
+    """llm.stream(prompt), gọi on_token với từng đoạn text"""
+    start = time.perf_counter()
+    ttft = None
+    parts = []
+    for chunk in llm.stream(prompt, **llm_kwargs):
+        text = getattr(chunk, "content", chunk)
+        if not text:
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        parts.append(text)
+        if on_token is not None:
+            on_token(text)
+    result = StreamResult("".join(parts), ttft, time.perf_counter() - start)
+    record_latency(kind, result)
+    return result
+
+
+def stream_json_field(llm, prompt: str, field: str, on_token: Optional[OnToken] = None,
+                      kind: Optional[str] = None, **llm_kwargs) -> StreamResult:
+    """Stream prompt trả về JSON, on_token chỉ nhận phần text của field"""
+    start = time.perf_counter()
+    streamer = JsonFieldStreamer(field)
+    first_field = None
+
+    def feed(text: str):
+        nonlocal first_field
+        delta = streamer.feed(text)
+        if delta:
+            if first_field is None:
+                first_field = time.perf_counter() - start
+            if on_token is not None:
+                on_token(delta)
+
+    result = stream_text(llm, prompt, feed, kind=kind or field, **llm_kwargs)
+    result.field_text = streamer.value if streamer.done else None
+    result.first_field_seconds = first_field
+    with _latency_lock:
+        _latency_log[-1]["first_field_seconds"] = first_field
+    return result
+
+
+def print_token(text: str):
+    print(text, end="", flush=True)
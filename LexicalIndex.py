@@ -0,0 +1,421 @@
+# LexicalIndex: inverted index BM25 cho tiếng Việt nằm cạnh FAISS store + retrieval hybrid (BM25 + dense)
+#
+#   python LexicalIndex.py --build vector_db2chunk_nltk           # build cho store có sẵn (BuildIndexes /
+#                                                                 # NLTK.py / IncrementalIngest tự build khi ingest)
+#   python LexicalIndex.py --eval vector_db2chunk_nltk            # dense / BM25 / hybrid trên bộ query có nhãn
+#   python LexicalIndex.py --search vector_db2chunk_nltk "Integer"
+#   HYBRID_RETRIEVAL=1 python LLMInterviewer2_fixed.py
+#
+# Tách từ: chuẩn hóa NFC + chữ thường, mỗi âm tiết là 1 term (bỏ vài hư từ), thêm cặp âm tiết liền nhau
+# ("bàn phím", "dữ liệu") vì từ tiếng Việt thường gồm nhiều âm tiết. Định danh giữ nguyên cả cụm
+# ("system.in", "max_priority") và thêm từng phần: tách theo "." trước (giữ "max_priority" của
+# "thread.max_priority"), rồi theo "_". fold=True bỏ dấu (đ -> d) để "ban phim" khớp "bàn phím".
+#
+# File trong thư mục store:
+#   lexical_index.json      phiên bản, cấu hình tách từ, BM25 (k1, b), danh sách term, fingerprint của index.faiss
+#   lexical_postings.npz    postings (vị trí chunk trong FAISS + tần suất) theo term, độ dài từng chunk
+#
+# Hybrid: gộp top fetch_k của dense và BM25 bằng reciprocal rank fusion. Query chỉ gồm định danh / cụm trong
+# ngoặc kép (vd `Integer`, "nextInt()", MAX_PRIORITY) đi đường tắt BM25, không embed nếu có chunk chứa đủ term.
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+LEXICAL_MANIFEST_FILE = "lexical_index.json"
+LEXICAL_POSTINGS_FILE = "lexical_postings.npz"
+FORMAT_VERSION = 2  # 2: thêm từng đoạn (theo ".") của định danh làm term
+
+DEFAULT_K1 = 1.5
+DEFAULT_B = 0.75
+DEFAULT_K = 5
+DEFAULT_FETCH_K = 20
+DEFAULT_RRF_K = 60  # hằng số của reciprocal rank fusion
+
+# Hư từ xuất hiện ở gần như mọi chunk: không làm term đơn (vẫn nằm trong cặp âm tiết)
+STOPWORDS = frozenset("""
+và là của các những có được cho với trong một này đó thì để khi như cũng đã sẽ bị ra vào lại nên mà
+hay hoặc theo tại về nếu vì do trên dưới rồi thế nào gì
+""".split())
+
+_WORD_RE = re.compile(r"\w+(?:[.]\w+)*")
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*(?:\(\))?$")
+
+
+# =======================
+# 1. Tách từ
+# =======================
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: "bàn phím" -> "ban phim", "đặt" -> "dat" (kể cả "Ð" lẫn trong PDF)"""
+    text = unicodedata.normalize("NFD", text)
+    text = text.translate(str.maketrans({"đ": "d", "Đ": "D", "ð": "d", "Ð": "D"}))
+    return unicodedata.normalize("NFC", "".join(ch for ch in text if unicodedata.category(ch) != "Mn"))
+
+
+def tokenize(text: str, fold: bool = False, bigrams: bool = True) -> List[str]:
+    """Term của 1 đoạn text (có lặp, để đếm tần suất)"""
+    text = unicodedata.normalize("NFC", text).lower()
+    if fold:
+        text = fold_diacritics(text)
+    words = _WORD_RE.findall(text)
+    terms = []
+    for word in words:
+        if word not in STOPWORDS:
+            terms.append(word)
+        segments = word.split(".") if "." in word else [word]
+        for segment in segments:
+            if len(segments) > 1 and segment and segment not in STOPWORDS:
+                terms.append(segment)
+            if "_" in segment:
+                terms.extend(part for part in segment.split("_") if part and part not in STOPWORDS)
+    if bigrams:
+        terms.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return terms
+
+
+def is_exact_term_query(query: str, max_terms: int = 3) -> bool:
+    """Query chỉ gồm định danh (Integer, nextInt(), MAX_PRIORITY) hoặc nằm trong ngoặc kép / backtick"""
+    query = query.strip()
+    if len(query) > 2 and query[0] == query[-1] and query[0] in "\"'`":
+        return True
+    parts = query.strip("`").split()
+    return 0 < len(parts) <= max_terms and all(_IDENTIFIER_RE.match(p.strip("`")) for p in parts)
+
+
+# =======================
+# 2. Inverted index BM25
+# =======================
+
+class LexicalIndex:
+    """Postings dạng CSR: term -> (vị trí chunk, tần suất), chấm điểm BM25 bằng numpy"""
+
+    def __init__(self, terms: Dict[str, int], offsets: np.ndarray, postings: np.ndarray, tfs: np.ndarray,
+                 doc_lengths: np.ndarray, settings: dict):
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.settings = settings
+        self.k1 = settings.get("k1", DEFAULT_K1)
+        self.b = settings.get("b", DEFAULT_B)
+        self.avgdl = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        # Phần mẫu của BM25 không phụ thuộc term: tính 1 lần
+        self._norm = self.k1 * (1 - self.b + self.b * doc_lengths / max(self.avgdl, 1e-9))
+
+    @property
+    def count(self) -> int:
+        return len(self.doc_lengths)
+
+    def tokenize(self, text: str) -> List[str]:
+        return tokenize(text, fold=self.settings.get("fold", False), bigrams=self.settings.get("bigrams", True))
+
+    @classmethod
+    def build(cls, texts: Sequence[str], fold: bool = False, bigrams: bool = True, k1: float = DEFAULT_K1,
+              b: float = DEFAULT_B) -> "LexicalIndex":
+        settings = {"fold": fold, "bigrams": bigrams, "k1": k1, "b": b}
+        per_term: Dict[str, Dict[int, int]] = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+        for position, text in enumerate(texts):
+            terms = tokenize(text, fold, bigrams)
+            doc_lengths[position] = len(terms)
+            for term in terms:
+                counts = per_term.setdefault(term, {})
+                counts[position] = counts.get(position, 0) + 1
+
+        vocabulary = sorted(per_term)
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        for i, term in enumerate(vocabulary):
+            offsets[i + 1] = offsets[i] + len(per_term[term])
+        postings = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.float32)
+        for i, term in enumerate(vocabulary):
+            counts = per_term[term]
+            postings[offsets[i]:offsets[i + 1]] = list(counts)
+            tfs[offsets[i]:offsets[i + 1]] = list(counts.values())
+        return cls({term: i for i, term in enumerate(vocabulary)}, offsets, postings, tfs, doc_lengths, settings)
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        i = self.terms.get(term)
+        if i is None:
+            return self.postings[:0], self.tfs[:0]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.postings[start:end], self.tfs[start:end]
+
+    def scores(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(điểm BM25, số term đơn của query có trong chunk) cho mọi chunk"""
+        scores = np.zeros(self.count, dtype=np.float32)
+        matched = np.zeros(self.count, dtype=np.int32)
+        for term in dict.fromkeys(self.tokenize(query)):
+            docs, tf = self._postings(term)
+            if not len(docs):
+                continue
+            idf = math.log(1 + (self.count - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + self._norm[docs])
+            if " " not in term:
+                matched[docs] += 1
+        return scores, matched
+
+    def search(self, query: str, k: int = DEFAULT_K, require_all: bool = False) -> List[Tuple[int, float]]:
+        """Top k (vị trí chunk trong FAISS, điểm BM25); require_all: chỉ chunk chứa mọi term đơn của query"""
+        scores, matched = self.scores(query)
+        if require_all:
+            needed = len({t for t in self.tokenize(query) if " " not in t})
+            scores = np.where(matched >= needed, scores, 0)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(p), float(scores[p])) for p in order]
+
+    # ---------- Lưu / load ----------
+
+    def save(self, folder: str, source_fingerprint: Optional[str] = None) -> dict:
+        vocabulary = sorted(self.terms, key=self.terms.get)
+        postings_path = os.path.join(folder, LEXICAL_POSTINGS_FILE)
+        tmp_path = postings_path + ".tmp.npz"
+        np.savez(tmp_path, offsets=self.offsets, postings=self.postings, tfs=self.tfs,
+                 doc_lengths=self.doc_lengths)
+        os.replace(tmp_path, postings_path)
+        manifest = {
+            "format": FORMAT_VERSION,
+            "count": self.count,
+            "settings": self.settings,
+            "source_fingerprint": source_fingerprint,
+            "terms": vocabulary,
+        }
+        manifest_path = os.path.join(folder, LEXICAL_MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(manifest_path + ".tmp", manifest_path)
+        return manifest
+
+    @classmethod
+    def load(cls, folder: str) -> "LexicalIndex":
+        with open(os.path.join(folder, LEXICAL_MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        with np.load(os.path.join(folder, LEXICAL_POSTINGS_FILE)) as data:
+            arrays = {name: data[name] for name in ("offsets", "postings", "tfs", "doc_lengths")}
+        terms = {term: i for i, term in enumerate(manifest["terms"])}
+        return cls(terms, arrays["offsets"], arrays["postings"], arrays["tfs"], arrays["doc_lengths"],
+                   manifest["settings"])
+
+
+def read_manifest(folder: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(folder, LEXICAL_MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def has_lexical_index(folder: str, check_fresh: bool = True) -> bool:
+    """Có index BM25 và (check_fresh) vẫn khớp với index.faiss / index.pkl hiện tại"""
+    from RetrievalContextIndex import index_fingerprint
+
+    manifest = read_manifest(folder)
+    if manifest is None or manifest.get("format") != FORMAT_VERSION:
+        return False
+    return not check_fresh or manifest.get("source_fingerprint") == index_fingerprint(folder)
+
+
+def write_lexical_index(db, folder: str, fold: bool = False, bigrams: bool = True) -> LexicalIndex:
+    """Build index BM25 từ 1 FAISS store đã load (và đã save_local vào folder), vị trí chunk = vị trí trong FAISS"""
+    from RetrievalContextIndex import index_fingerprint
+
+    start = time.perf_counter()
+    texts = []
+    for position in range(db.index.ntotal):
+        doc = db.docstore.search(db.index_to_docstore_id[position])
+        texts.append(doc.page_content if isinstance(doc, Document) else "")
+    lexical = LexicalIndex.build(texts, fold=fold, bigrams=bigrams)
+    lexical.save(folder, index_fingerprint(folder))
+    print(f"🔤 Index BM25: {lexical.count} chunk, {len(lexical.terms)} term "
+          f"({time.perf_counter() - start:.1f}s) -> {folder}")
+    return lexical
+
+
+def load_lexical_index(folder: str) -> Optional[LexicalIndex]:
+    """Index BM25 của store, None nếu chưa build hoặc đã cũ so với index.faiss"""
+    if not has_lexical_index(folder):
+        return None
+    return LexicalIndex.load(folder)
+
+
+# =======================
+# 3. Hybrid BM25 + dense
+# =======================
+
+class HybridRetriever:
+    """Gộp kết quả dense (FAISS store hoặc CascadeRetriever) và BM25 bằng reciprocal rank fusion"""
+
+    def __init__(self, db, lexical: LexicalIndex, k: int = DEFAULT_K, fetch_k: int = DEFAULT_FETCH_K,
+                 rrf_k: int = DEFAULT_RRF_K, fast_path: bool = True):
+        if lexical.count != db.index.ntotal:
+            raise ValueError(f"Index BM25 ({lexical.count} chunk) không khớp FAISS ({db.index.ntotal} vector)")
+        self.db = db
+        self.lexical = lexical
+        self.k = k
+        self.fetch_k = fetch_k
+        self.rrf_k = rrf_k
+        self.fast_path = fast_path
+        self.stats = {"fast_path": 0, "hybrid": 0}
+
+    def _document(self, position: int) -> Document:
+        return self.db.docstore.search(self.db.index_to_docstore_id[position])
+
+    def lexical_search(self, query: str, k: Optional[int] = None, require_all: bool = False) -> List[Document]:
+        return [self._document(p) for p, _ in self.lexical.search(query, k or self.k, require_all)]
+
+    def fuse(self, rankings: List[List[Document]], k: int) -> List[Document]:
+        """Reciprocal rank fusion: điểm = tổng 1 / (rrf_k + hạng), chunk khớp theo nội dung"""
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Document] = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking, start=1):
+                scores[doc.page_content] = scores.get(doc.page_content, 0.0) + 1 / (self.rrf_k + rank)
+                docs.setdefault(doc.page_content, doc)
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [docs[text] for text in best]
+
+    def search_with_info(self, query: str, k: Optional[int] = None, fetch_k: Optional[int] = None,
+                         dense=None) -> Tuple[List[Document], dict]:
+        """dense: thay cho self.db ở nhánh dense (vd CascadeRetriever), cần similarity_search(query, k)"""
+        k = k or self.k
+        fetch_k = max(fetch_k or self.fetch_k, k)
+        if self.fast_path and is_exact_term_query(query):
+            docs = self.lexical_search(query.strip("\"'`"), k, require_all=True)
+            if docs:
+                self.stats["fast_path"] += 1
+                return docs, {"fast_path": True, "lexical": len(docs)}
+        lexical_docs = self.lexical_search(query, fetch_k)
+        dense_docs = (dense or self.db).similarity_search(query, k=fetch_k)
+        self.stats["hybrid"] += 1
+        return self.fuse([dense_docs, lexical_docs], k), {"fast_path": False, "lexical": len(lexical_docs)}
+
+    def search(self, query: str, k: Optional[int] = None, fetch_k: Optional[int] = None,
+               dense=None) -> List[Document]:
+        return self.search_with_info(query, k, fetch_k, dense)[0]
+
+    def similarity_search(self, query: str, k: int = DEFAULT_K, **kwargs) -> List[Document]:
+        """Cùng chữ ký với FAISS.similarity_search (fetch_k truyền qua kwargs)"""
+        return self.search(query, k, kwargs.get("fetch_k"))
+
+    def as_retriever(self, search_kwargs: Optional[dict] = None, **kwargs) -> "HybridLangchainRetriever":
+        """Giống FAISS.as_retriever: search_kwargs={"k": 5, "fetch_k": 20}"""
+        search_kwargs = search_kwargs or {}
+        return HybridLangchainRetriever(hybrid=self, k=search_kwargs.get("k", self.k),
+                                        fetch_k=search_kwargs.get("fetch_k", self.fetch_k), **kwargs)
+
+
+class HybridLangchainRetriever(BaseRetriever):
+    """Retriever langchain (invoke / batch / chain) bọc HybridRetriever"""
+
+    hybrid: Any
+    k: int = DEFAULT_K
+    fetch_k: int = DEFAULT_FETCH_K
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.hybrid.search(query, self.k, self.fetch_k)
+
+
+def load_hybrid(folder: str, db=None, k: int = DEFAULT_K, fetch_k: int = DEFAULT_FETCH_K,
+                query_cache: bool = True) -> Optional[HybridRetriever]:
+    """Hybrid cho store folder (db: store đã load sẵn), None nếu store chưa có index BM25 còn mới"""
+    lexical = load_lexical_index(folder)
+    if lexical is None:
+        print(f"⚠️ {folder} chưa có index BM25 (python LexicalIndex.py --build {folder}), chỉ dùng dense")
+        return None
+    if db is None:
+        from EmbeddingRegistry import load_faiss
+        db = load_faiss(folder, lazy=True, query_cache=query_cache)
+    return HybridRetriever(db, lexical, k=k, fetch_k=fetch_k)
+
+
+# =======================
+# 4. So sánh dense / BM25 / hybrid
+# =======================
+
+def evaluate(hybrid: HybridRetriever, queries: List[dict], k: int = DEFAULT_K, repeats: int = 3) -> dict:
+    from RetrievalBenchmark import first_relevant_rank, percentiles_ms, score_ranks
+
+    modes = {
+        "dense": lambda q: hybrid.db.similarity_search(q, k=k),
+        "bm25": lambda q: hybrid.lexical_search(q, k),
+        "hybrid": lambda q: hybrid.search(q, k),
+    }
+    modes["dense"](queries[0]["query"])  # load model (không tính vào độ trễ)
+    report = {"k": k, "queries": len(queries), "fast_path_queries": [q["query"] for q in queries
+                                                                     if is_exact_term_query(q["query"])]}
+    for name, run in modes.items():
+        ranks = [first_relevant_rank([d.page_content for d in run(q["query"])], q["relevant"]) for q in queries]
+        latencies = []
+        for _ in range(repeats):
+            for q in queries:
+                start = time.perf_counter()
+                run(q["query"])
+                latencies.append(time.perf_counter() - start)
+        report[name] = {**score_ranks(ranks, k), "latency": percentiles_ms(latencies)}
+    return report
+
+
+def print_evaluation(report: dict):
+    k = report["k"]
+    print(f"\n📊 {report['queries']} query, k={k} ({len(report['fast_path_queries'])} query đi đường tắt BM25)")
+    print(f"{'':<10}{f'recall@{k}':>10}{f'MRR@{k}':>9}{'p50':>10}{'p95':>10}")
+    for name in ("dense", "bm25", "hybrid"):
+        r = report[name]
+        print(f"{name:<10}{r[f'recall@{k}']:>10.3f}{r[f'mrr@{k}']:>9.3f}"
+              f"{r['latency']['p50_ms']:>8.1f}ms{r['latency']['p95_ms']:>8.1f}ms")
+
+
+def _load_store(folder: str):
+    from EmbeddingRegistry import load_faiss
+
+    return load_faiss(folder, lazy=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from RetrievalBenchmark import QUERIES_FILE, load_queries
+
+    parser = argparse.ArgumentParser(description="Index BM25 tiếng Việt cạnh FAISS store + retrieval hybrid")
+    parser.add_argument("--build", nargs="+", default=[], metavar="FOLDER")
+    parser.add_argument("--fold", action="store_true", help="Bỏ dấu khi build (query cũng được bỏ dấu)")
+    parser.add_argument("--no-bigrams", action="store_true")
+    parser.add_argument("--eval", default=None, metavar="FOLDER")
+    parser.add_argument("--search", nargs=2, default=None, metavar=("FOLDER", "QUERY"), help="Chỉ BM25")
+    parser.add_argument("--queries", default=QUERIES_FILE)
+    parser.add_argument("-k", type=int, default=DEFAULT_K)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Ghi báo cáo --eval ra JSON")
+    args = parser.parse_args()
+
+    for folder in args.build:
+        write_lexical_index(_load_store(folder), folder, fold=args.fold, bigrams=not args.no_bigrams)
+    if args.search:
+        folder, query = args.search
+        hybrid = load_hybrid(folder, _load_store(folder), k=args.k)
+        if hybrid is not None:
+            for i, doc in enumerate(hybrid.lexical_search(query, args.k), start=1):
+                print(f"{i}. {doc.page_content[:160]!r}")
+    if args.eval:
+        hybrid = load_hybrid(args.eval, _load_store(args.eval), k=args.k)
+        if hybrid is not None:
+            report = evaluate(hybrid, load_queries(args.queries), args.k, args.repeats)
+            print_evaluation(report)
+            if args.output:
+                with open(args.output, "w", encoding="utf-8") as f:
+                    json.dump(report, f, ensure_ascii=False, indent=2)
+                print(f"💾 Đã ghi {args.output}")
@@ -0,0 +1,284 @@
+# MmapVectorStore: định dạng store đọc bằng mmap, không dùng pickle
+#
+# FAISS.load_local đọc toàn bộ index.faiss vào RAM riêng của process và unpickle cả index.pkl,
+# nên thời gian khởi động + RSS tăng theo corpus và mỗi worker giữ 1 bản riêng.
+# Định dạng này nằm cạnh index.faiss / index.pkl trong cùng thư mục:
+#
+#   mmap_store.json     phiên bản, số vector, số chiều, fingerprint của index.faiss/index.pkl gốc
+#   vectors.npy         vector float32 (index flat), np.load(mmap_mode="r") -> dùng chung qua page cache
+#   chunks.bin          các bản ghi JSON {"page_content", "metadata"} nối liền nhau
+#   chunks.idx.npy      offset (int64, n+1 phần tử) của từng bản ghi trong chunks.bin
+#   ids.npy             docstore id của từng vị trí (bytes độ dài cố định)
+#
+# Index không phải flat (IVF / HNSW / PQ, xem FaissIndexFactory.py) được đọc thẳng từ
+# index.faiss với IO_FLAG_MMAP | IO_FLAG_READ_ONLY.
+# Chunk chỉ được đọc + decode khi search trả về vị trí của nó.
+#
+#   python MmapVectorStore.py vector_db2chunk_nltk      # chuyển store có sẵn (đọc index.pkl 1 lần)
+import json
+import mmap
+import os
+import threading
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Iterator, List, Optional, Union
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+
+MMAP_MANIFEST_FILE = "mmap_store.json"
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.idx.npy"
+IDS_FILE = "ids.npy"
+FORMAT_VERSION = 1
+DOC_CACHE_SIZE = 1024
+
+
+# =======================
+# 1. Index flat trên vector mmap
+# =======================
+
+class MmapFlatIndex:
+    """Thay cho faiss.IndexFlatL2 (read-only): search brute-force L2 trên vector mmap"""
+
+    is_trained = True
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+        self.ntotal, self.d = vectors.shape
+
+    def search(self, x: np.ndarray, k: int):
+        import faiss
+
+        # Cùng kết quả với IndexFlatL2.search: khoảng cách L2 bình phương, -1 nếu thiếu
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        if self.ntotal == 0:
+            return (np.full((len(x), k), np.inf, dtype=np.float32), np.full((len(x), k), -1, dtype=np.int64))
+        return faiss.knn(x, self.vectors, k, faiss.METRIC_L2)
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return np.array(self.vectors[i], dtype=np.float32)
+
+    def reconstruct_n(self, i0: int, n: int) -> np.ndarray:
+        return np.array(self.vectors[i0:i0 + n], dtype=np.float32)
+
+    def add(self, *args, **kwargs):
+        raise TypeError("Store mmap chỉ đọc, hãy ingest vào index.faiss rồi chuyển lại (MmapVectorStore.py)")
+
+    remove_ids = add
+
+
+# =======================
+# 2. Docstore + mapping lazy
+# =======================
+
+class ChunkId(str):
+    """docstore id kèm vị trí trong chunks.bin, để CompactDocstore đọc thẳng không cần tra id"""
+
+    position: int
+
+    def __new__(cls, value: str, position: int):
+        obj = super().__new__(cls, value)
+        obj.position = position
+        return obj
+
+
+class LazyIndexToDocstoreId(Mapping):
+    """index_to_docstore_id của langchain FAISS, đọc id từ ids.npy khi cần"""
+
+    def __init__(self, ids: np.ndarray):
+        self._ids = ids
+
+    def __getitem__(self, position: int) -> ChunkId:
+        position = int(position)
+        if not 0 <= position < len(self._ids):
+            raise KeyError(position)
+        return ChunkId(self._ids[position].decode("utf-8"), position)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self._ids)))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class CompactDocstore(Docstore):
+    """Docstore chỉ đọc trên chunks.bin (mmap), decode từng bản ghi khi được hỏi tới.
+
+    Không kế thừa AddableMixin nên FAISS.add_* báo lỗi thay vì ghi vào store.
+    """
+
+    def __init__(self, folder: str, ids: np.ndarray):
+        self._ids = ids
+        self._offsets = np.load(os.path.join(folder, OFFSETS_FILE), mmap_mode="r")
+        self._file = open(os.path.join(folder, CHUNKS_FILE), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._positions: Optional[dict] = None
+        self._positions_lock = threading.Lock()
+        self.document = lru_cache(maxsize=DOC_CACHE_SIZE)(self._read)
+
+    def _read(self, position: int):
+        from langchain_core.documents import Document
+
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = json.loads(bytes(self._data[start:end]).decode("utf-8"))
+        return Document(id=self._ids[position].decode("utf-8"), page_content=record["page_content"],
+                        metadata=record["metadata"])
+
+    def _position_of(self, doc_id: str) -> Optional[int]:
+        position = getattr(doc_id, "position", None)
+        if position is not None:
+            return position
+        # Tra theo id thường (vd FAISS.get_by_ids): dựng dict id -> vị trí 1 lần
+        with self._positions_lock:
+            if self._positions is None:
+                self._positions = {raw.decode("utf-8"): i for i, raw in enumerate(self._ids)}
+        return self._positions.get(doc_id)
+
+    def search(self, search: str) -> Union[str, object]:
+        position = self._position_of(search)
+        if position is None:
+            return f"ID {search} not found."
+        return self.document(position)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+# =======================
+# 3. Ghi / đọc định dạng mmap
+# =======================
+
+def read_manifest(folder: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(folder, MMAP_MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def has_mmap_store(folder: str, check_fresh: bool = True) -> bool:
+    """Có định dạng mmap và (check_fresh) vẫn khớp với index.faiss / index.pkl hiện tại"""
+    from RetrievalContextIndex import index_fingerprint
+
+    manifest = read_manifest(folder)
+    if manifest is None or manifest.get("format") != FORMAT_VERSION:
+        return False
+    return not check_fresh or manifest.get("source_fingerprint") == index_fingerprint(folder)
+
+
+def store_files(folder: str) -> List[str]:
+    """Các file của định dạng mmap (gồm index.faiss nếu index không phải flat)"""
+    manifest = read_manifest(folder) or {}
+    return [MMAP_MANIFEST_FILE, CHUNKS_FILE, OFFSETS_FILE, IDS_FILE, manifest.get("index", VECTORS_FILE)]
+
+
+def _is_flat(index) -> bool:
+    import faiss
+
+    if isinstance(index, MmapFlatIndex):
+        return True
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+
+
+def _atomic_save_npy(path: str, array: np.ndarray):
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def write_mmap_store(db, folder: str) -> dict:
+    """Ghi định dạng mmap từ 1 FAISS store đã load (và đã save_local vào folder)"""
+    from RetrievalContextIndex import index_fingerprint
+
+    n = db.index.ntotal
+    ids: List[str] = []
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    chunks_path = os.path.join(folder, CHUNKS_FILE)
+    with open(chunks_path + ".tmp", "wb") as f:
+        for position in range(n):
+            doc_id = db.index_to_docstore_id[position]
+            doc = db.docstore.search(doc_id)
+            record = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata},
+                                ensure_ascii=False, default=str).encode("utf-8")
+            f.write(record)
+            offsets[position + 1] = offsets[position] + len(record)
+            ids.append(str(doc_id))
+    os.replace(chunks_path + ".tmp", chunks_path)
+    _atomic_save_npy(os.path.join(folder, OFFSETS_FILE), offsets)
+    width = max((len(i.encode("utf-8")) for i in ids), default=1)
+    _atomic_save_npy(os.path.join(folder, IDS_FILE), np.array([i.encode("utf-8") for i in ids], dtype=f"S{width}"))
+
+    flat = _is_flat(db.index)
+    if flat:
+        _atomic_save_npy(os.path.join(folder, VECTORS_FILE), db.index.reconstruct_n(0, n))
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "count": n,
+        "dimension": db.index.d,
+        "index": VECTORS_FILE if flat else "index.faiss",
+        "source_fingerprint": index_fingerprint(folder),
+    }
+    with open(os.path.join(folder, MMAP_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"🗜️ Store mmap: {n} chunk, {offsets[-1] / (1024 * 1024):.1f} MB text -> {folder}")
+    return manifest
+
+
+def load_mmap_store(folder: str, embeddings):
+    """FAISS store (langchain) với vector mmap chỉ đọc + docstore lazy, không unpickle"""
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    manifest = read_manifest(folder)
+    if manifest["index"] == VECTORS_FILE:
+        index = MmapFlatIndex(np.load(os.path.join(folder, VECTORS_FILE), mmap_mode="r"))
+    else:
+        index = faiss.read_index(os.path.join(folder, manifest["index"]),
+                                 faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    ids = np.load(os.path.join(folder, IDS_FILE), mmap_mode="r")
+    return FAISS(embeddings, index, CompactDocstore(folder, ids), LazyIndexToDocstoreId(ids))
+
+
+def convert(folder: str, embeddings=None) -> dict:
+    """Chuyển store pickle có sẵn sang định dạng mmap (đọc index.pkl 1 lần duy nhất)"""
+    from langchain_community.vectorstores import FAISS
+
+    from EmbeddingRegistry import get_embeddings
+
+    db = FAISS.load_local(folder, embeddings or get_embeddings(lazy=True), allow_dangerous_deserialization=True)
+    return write_mmap_store(db, folder)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from EmbeddingRegistry import current_rss_mb, get_embeddings
+
+    folders = sys.argv[1:] or ["vector_db2chunk_nltk"]
+    for folder in folders:
+        convert(folder)
+
+        # So sánh thời gian load + RSS giữa 2 định dạng
+        embeddings = get_embeddings(lazy=True)
+        rss0 = current_rss_mb()
+        t0 = time.perf_counter()
+        db = load_mmap_store(folder, embeddings)
+        t1 = time.perf_counter()
+        rss1 = current_rss_mb()
+        from langchain_community.vectorstores import FAISS
+        FAISS.load_local(folder, embeddings, allow_dangerous_deserialization=True)
+        t2 = time.perf_counter()
+        rss2 = current_rss_mb()
+        if rss0 is not None:
+            print(f"📦 {folder}: mmap load {(t1 - t0) * 1000:.1f} ms (+{rss1 - rss0:.1f} MB), "
+                  f"pickle load {(t2 - t1) * 1000:.1f} ms (+{rss2 - rss1:.1f} MB)")
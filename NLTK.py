@@ -11,71 +11,85 @@ try:
 except:
     pass
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import NLTKTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+from EmbeddingEngine import BatchEmbedder, detect_device
+from EmbeddingRegistry import get_embeddings, warmup
+from StreamingIngest import stream_build
 
-from langchain.schema import Document
+# Load model ở background trong lúc đọc trang PDF đầu tiên + chia chunk
+# Tự chọn device (cuda nếu có GPU), USE_GPU=0 để ép chạy CPU
+device = detect_device() if os.environ.get("USE_GPU", "1") == "1" else "cpu"
+embedding_kwargs = dict(
+    model_name="intfloat/multilingual-e5-large-instruct",
+    model_kwargs={"device": device},
+    encode_kwargs={"normalize_embeddings": True},
+)
+warmup(**embedding_kwargs)
 
-# Load PDF
-loader = PyPDFLoader("Chương 2 Biến, hằng và kiểu dữ liệu.pdf")
-pages = loader.load()
+# INCREMENTAL=1: chỉ embed chunk mới/thay đổi, cập nhật index có sẵn (xem IncrementalIngest.py)
+if os.environ.get("INCREMENTAL", "0") == "1":
+    from IncrementalIngest import ingest, refresh_context_index
 
-# Gộp toàn bộ text thành 1 Document duy nhất
-full_text = "\n".join([p.page_content for p in pages])
-full_doc = [Document(page_content=full_text)]
+    result = ingest("vector_db2chunk_nltk", ["Chương 2 Biến, hằng và kiểu dữ liệu.pdf"], "nltk", **embedding_kwargs)
+    if result["added"] or result["removed"]:
+        refresh_context_index("vector_db2chunk_nltk")
+    raise SystemExit(0)
 
 # ======================
-# 3. Chia nhỏ văn bản bằng NLTK
+# 2-5. Stream PDF -> tách câu NLTK -> chunk -> embed theo batch -> append vào FAISS
 # ======================
-text_splitter= NLTKTextSplitter(
+# Không ghép cả cuốn sách thành 1 chuỗi: mỗi lúc chỉ giữ 1 trang + 1 batch chunk,
+# chunk giữ metadata source / page / page_end (xem StreamingIngest.py)
+embeddings = get_embeddings(**embedding_kwargs)
+# Embed theo batch sắp theo độ dài, EMBED_WORKERS=N (hoặc auto) để chạy nhiều process CPU
+embedder = BatchEmbedder(embedding_kwargs["model_name"], device=device, embeddings=embeddings)
+
+vectorstore, n_chunks = stream_build(
+    ["Chương 2 Biến, hằng và kiểu dữ liệu.pdf"],
+    embeddings,
+    embedder,
     chunk_size=1600,       # độ dài tối đa mỗi chunk (số ký tự)
     chunk_overlap=400,     # số ký tự overlap giữa 2 chunk
-    separator="\n\n"       # ký tự tách đoạn (mặc định theo NLTK sentence tokenizer)
+    separator="\n\n",      # ký tự nối các câu trong 1 chunk
 )
-splitted_docs = []
+embedder.close()  # dừng worker process (EMBED_WORKERS > 1), pool dùng chung cho mọi batch ở trên
+print(f"✂️ Sau khi chia chunk: {n_chunks} đoạn")
 
-for doc in full_doc:
-    chunks = text_splitter.split_text(doc.page_content)
-    for chunk in chunks:
-        splitted_docs.append(
-            {
-                "page_content": chunk,
-                "metadata": doc.metadata,  # giữ metadata (trang số, v.v.)
-            }
-        )
+# INDEX_TYPE=ivf / hnsw / pq / ivfpq (vd "ivf:nlist=256"): đổi sang index xấp xỉ cho corpus lớn
+index_type = os.environ.get("INDEX_TYPE", "flat")
+if index_type != "flat":
+    from FaissIndexFactory import convert_store, print_recall, recall_check, store_vectors
 
-print(f"✂️ Sau khi chia chunk: {len(splitted_docs)} đoạn")
-
-# ======================
-# 4. Khởi tạo Embeddings
-# ======================
-device = "cuda" if os.environ.get("USE_GPU", "1") == "1" else "cpu"
-embeddings = HuggingFaceEmbeddings(
-    model_name="intfloat/multilingual-e5-large-instruct",
-    model_kwargs={"device": device},
-    encode_kwargs={"normalize_embeddings": True},
-)
-
-# ======================
-# 5. Tạo vector store từ text
-# ======================
-vectorstore = FAISS.from_texts(
-    [d["page_content"] for d in splitted_docs],
-    embeddings,
-    metadatas=[d["metadata"] for d in splitted_docs],
-)
+    flat_vectors = store_vectors(vectorstore)
+    convert_store(vectorstore, index_type)
+    print_recall(recall_check(flat_vectors, vectorstore.index))
 
 # Save to disk (create folder if not exists)
 save_path = "vector_db2chunk_nltk"
 os.makedirs(save_path, exist_ok=True)
 vectorstore.save_local(save_path)
+# Bản mmap (vectors.npy + chunks.bin) để server/worker load nhanh, không unpickle (MmapVectorStore.py)
+from MmapVectorStore import write_mmap_store
+write_mmap_store(vectorstore, save_path)
+# Index BM25 cạnh FAISS cho retrieval hybrid / tra cứu định danh không cần embed (LexicalIndex.py)
+from LexicalIndex import write_lexical_index
+write_lexical_index(vectorstore, save_path)
+
+# ======================
+# 6. Tính sẵn context cho mọi (topic, độ khó) của interviewer
+# ======================
+from LLMInterviewer2_fixed import InterviewConfig, QuestionDifficulty
+from RetrievalContextIndex import build_context_index, build_queries
+
+build_context_index(
+    vectorstore, save_path,
+    build_queries(InterviewConfig.TOPICS, [d.value for d in QuestionDifficulty]),
+    k=InterviewConfig.RETRIEVAL_K,
+)
 
 
 
 # # ======================
-# # 6. Truy vấn thử
+# # 7. Truy vấn thử
 # # ======================
 # query = "Đặt tên trong java"
 # retriever = vectorstore.as_retriever()
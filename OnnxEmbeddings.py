@@ -0,0 +1,331 @@
+# OnnxEmbeddings: chạy e5-large (hoặc model sentence-transformers khác) bằng ONNX Runtime trên CPU,
+# có bản int8 (dynamic quantization), thay cho HuggingFaceEmbeddings (PyTorch)
+#
+#   python OnnxEmbeddings.py --export                       # -> onnx_models/<model>/model.onnx + model.int8.onnx
+#   python OnnxEmbeddings.py --parity --sample 512          # độ lệch cosine, recall@k, throughput so với torch
+#   EMBEDDING_BACKEND=onnx-int8 python LLMInterviewer2_fixed.py
+#
+# EMBEDDING_BACKEND (đọc trong EmbeddingRegistry): torch (mặc định) | onnx (fp32) | onnx-int8. Interviewer,
+# LLM.py, các script build index và worker của EmbeddingEngine đều lấy model qua registry nên chỉ cần
+# đặt biến môi trường; model chưa export (vd store recall MiniLM của cascade) vẫn chạy torch.
+# ONNX_MODEL_DIR: thư mục chứa model đã export (mặc định onnx_models).
+#
+# Export lấy đúng pipeline của SentenceTransformer (transformer + pooling + normalize) nên vector của
+# bản fp32 gần như trùng torch; bản int8 lệch nhẹ, xem --parity trước khi dùng. Index đã build bằng
+# torch vẫn dùng được với query embed bằng ONNX (parity đo cả trường hợp này).
+import datetime
+import json
+import os
+import tempfile
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from EmbeddingEngine import DEFAULT_BATCH_SIZE, length_sorted_batches
+
+DEFAULT_ONNX_DIR = os.environ.get("ONNX_MODEL_DIR", "onnx_models")
+EXPORT_INFO = "export_info.json"
+FP32_FILE = "model.onnx"
+FP32_DATA_FILE = "model.onnx.data"
+INT8_FILE = "model.int8.onnx"
+
+
+def onnx_dir(model_name: str, root: str = DEFAULT_ONNX_DIR) -> str:
+    return os.path.join(root, model_name.replace("/", "__"))
+
+
+def read_export_info(model_dir: str) -> dict:
+    path = os.path.join(model_dir, EXPORT_INFO)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Chưa export ONNX vào {model_dir} (python OnnxEmbeddings.py --export --model ...)")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def has_export(model_name: str, quantized: bool = True, root: str = DEFAULT_ONNX_DIR) -> bool:
+    """Model đã export ONNX (đúng bản int8 / fp32) chưa"""
+    try:
+        info = read_export_info(onnx_dir(model_name, root))
+    except FileNotFoundError:
+        return False
+    return ("int8" if quantized else "fp32") in info["files"]
+
+
+# =======================
+# 1. Export + quantize
+# =======================
+
+def export_onnx(model_name: str, output_dir: Optional[str] = None, quantize: bool = True, opset: int = 17) -> dict:
+    """Export transformer của SentenceTransformer ra ONNX (trục batch / sequence động), tùy chọn bản int8"""
+    import onnx
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    output_dir = output_dir or onnx_dir(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    auto_model = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+    pooling = next((m for m in st if type(m).__name__ == "Pooling"), None)
+    pooling_mode = pooling.get_pooling_mode_str() if pooling is not None else "mean"
+    if pooling_mode not in ("mean", "cls"):
+        raise ValueError(f"Pooling {pooling_mode} chưa được hỗ trợ (chỉ mean / cls)")
+
+    dummy = tokenizer(["Kiểu dữ liệu trong Java", "Biến và hằng"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = auto_model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    start = time.perf_counter()
+    # e5-large > 2GB: torch ghi trọng số thành nhiều file rời (tên tùy ý) -> export vào thư mục tạm
+    # rồi gom lại thành 1 file .data trong output_dir, không đụng tới file khác của output_dir
+    with tempfile.TemporaryDirectory(prefix="onnx_export_") as tmp:
+        tmp_path = os.path.join(tmp, FP32_FILE)
+        with torch.no_grad():
+            torch.onnx.export(_Encoder(), tuple(dummy[name] for name in input_names), tmp_path,
+                              input_names=input_names, output_names=["last_hidden_state"],
+                              dynamic_axes=dynamic_axes, opset_version=opset, do_constant_folding=True)
+        model = onnx.load(tmp_path)
+        # onnx ghi nối vào file .data có sẵn: xóa bản export cũ trước
+        for name in (FP32_FILE, FP32_DATA_FILE):
+            if os.path.exists(os.path.join(output_dir, name)):
+                os.remove(os.path.join(output_dir, name))
+        onnx.save_model(model, fp32_path, save_as_external_data=True, all_tensors_to_one_file=True,
+                        location=FP32_DATA_FILE, size_threshold=1024)
+    tokenizer.save_pretrained(output_dir)
+    print(f"📦 Export {model_name} -> {fp32_path} trong {time.perf_counter() - start:.0f}s")
+
+    files = {"fp32": FP32_FILE}
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        start = time.perf_counter()
+        quantize_dynamic(fp32_path, os.path.join(output_dir, INT8_FILE), weight_type=QuantType.QInt8)
+        files["int8"] = INT8_FILE
+        print(f"🗜️ Quantize int8 -> {INT8_FILE} trong {time.perf_counter() - start:.0f}s")
+
+    info = {
+        "model_name": model_name,
+        "pooling": pooling_mode,
+        "normalize": any(type(m).__name__ == "Normalize" for m in st),
+        "max_seq_length": st.max_seq_length,
+        "input_names": input_names,
+        "dimension": st.get_sentence_embedding_dimension(),
+        "files": files,
+        "opset": opset,
+        "exported_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(output_dir, EXPORT_INFO), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    for variant, name in files.items():
+        print(f"   {variant}: {_file_size_mb(output_dir, name):.0f} MB")
+    return info
+
+
+def _file_size_mb(model_dir: str, name: str) -> float:
+    paths = [os.path.join(model_dir, name)]
+    if name == FP32_FILE:
+        paths.append(os.path.join(model_dir, FP32_DATA_FILE))
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p)) / (1024 * 1024)
+
+
+# =======================
+# 2. Embeddings
+# =======================
+
+class OnnxEmbeddings(Embeddings):
+    """Embeddings của langchain chạy model đã export, cùng pooling / normalize với SentenceTransformer"""
+
+    def __init__(self, model_dir: str, quantized: bool = True, batch_size: int = DEFAULT_BATCH_SIZE,
+                 num_threads: Optional[int] = None, device: str = "cpu", normalize: bool = False):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.info = read_export_info(model_dir)
+        variant = "int8" if quantized else "fp32"
+        if variant not in self.info["files"]:
+            raise FileNotFoundError(f"{model_dir} chưa có bản {variant} (export lại không có --no-int8)")
+        self.model_name = self.info["model_name"]
+        self.variant = variant
+        self.batch_size = batch_size
+        self.normalize = normalize or self.info["normalize"]
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        providers = ["CPUExecutionProvider"]
+        if device == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = ort.InferenceSession(os.path.join(model_dir, self.info["files"][variant]), options,
+                                            providers=providers)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.info["max_seq_length"],
+                                return_tensors="np")
+        feed = {name: tokens[name].astype(np.int64) for name in self.info["input_names"]}
+        hidden = self.session.run(None, feed)[0]
+        if self.info["pooling"] == "cls":
+            return hidden[:, 0]
+        mask = feed["attention_mask"][..., None].astype(hidden.dtype)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(self, texts: Sequence[str], batch_size: Optional[int] = None, normalize_embeddings: bool = False,
+               convert_to_numpy: bool = True, show_progress_bar: bool = False) -> np.ndarray:
+        """Cùng chữ ký với SentenceTransformer.encode (dùng được trong worker của EmbeddingEngine)"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.info["dimension"]), dtype=np.float32)
+        out = np.empty((len(texts), self.info["dimension"]), dtype=np.float32)
+        for idx in length_sorted_batches(texts, batch_size or self.batch_size):
+            out[idx] = self._encode_batch([texts[i] for i in idx])
+        if self.normalize or normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+def load_onnx_embeddings(model_name: str, quantized: bool = True, **kwargs) -> OnnxEmbeddings:
+    return OnnxEmbeddings(onnx_dir(model_name), quantized=quantized, **kwargs)
+
+
+# =======================
+# 3. Parity + throughput so với torch
+# =======================
+
+def _cosines(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return (a * b).sum(axis=1)
+
+
+def _top_k(queries: np.ndarray, docs: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ docs.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def _overlap(a: np.ndarray, b: np.ndarray) -> float:
+    """Trung bình |top-k(a) ∩ top-k(b)| / k"""
+    return float(np.mean([len(set(x) & set(y)) / len(x) for x, y in zip(a, b)]))
+
+
+def _timed(embeddings, texts: List[str], queries: List[str]) -> tuple:
+    start = time.perf_counter()
+    docs = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    doc_seconds = time.perf_counter() - start
+    query_vectors, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(q))
+        latencies.append(time.perf_counter() - start)
+    throughput = {"docs_per_sec": len(texts) / doc_seconds if doc_seconds > 0 else 0.0,
+                  "query_p50_ms": float(np.percentile(latencies, 50)) * 1000,
+                  "query_p95_ms": float(np.percentile(latencies, 95)) * 1000}
+    return docs, np.asarray(query_vectors, dtype=np.float32), throughput
+
+
+def parity_check(model_name: str, store: str, queries_path: str, sample: int = 512, k: int = 5,
+                 num_threads: Optional[int] = None) -> dict:
+    """So sánh torch với ONNX fp32 / int8 trên `sample` chunk của store + bộ query benchmark"""
+    from langchain_community.vectorstores import FAISS
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    from RetrievalBenchmark import first_relevant_rank, load_queries, score_ranks
+
+    torch_embeddings = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": "cpu"})
+    db = FAISS.load_local(store, torch_embeddings, allow_dangerous_deserialization=True)
+    ids = list(db.index_to_docstore_id.values())
+    texts = [db.docstore.search(doc_id).page_content for doc_id in (ids[:sample] if sample else ids)]
+    labeled = load_queries(queries_path)
+    queries = [q["query"] for q in labeled]
+
+    def labeled_recall(query_vectors: np.ndarray, doc_vectors: np.ndarray) -> dict:
+        top = _top_k(query_vectors, doc_vectors, k)
+        ranks = [first_relevant_rank([texts[i] for i in row], q["relevant"]) for row, q in zip(top, labeled)]
+        return score_ranks(ranks, k)
+
+    print(f"🧪 Parity trên {len(texts)} chunk của {store}, {len(queries)} query, k={k}")
+    torch_docs, torch_queries, torch_speed = _timed(torch_embeddings, texts, queries)
+    torch_top = _top_k(torch_queries, torch_docs, k)
+    report = {"model_name": model_name, "store": store, "chunks": len(texts), "queries": len(queries), "k": k,
+              "torch": {**torch_speed, **labeled_recall(torch_queries, torch_docs)}}
+
+    info = read_export_info(onnx_dir(model_name))
+    for variant in info["files"]:
+        onnx_embeddings = load_onnx_embeddings(model_name, quantized=variant == "int8", num_threads=num_threads)
+        docs, query_vectors, speed = _timed(onnx_embeddings, texts, queries)
+        doc_cos, query_cos = _cosines(torch_docs, docs), _cosines(torch_queries, query_vectors)
+        report[variant] = {
+            **speed,
+            **labeled_recall(query_vectors, docs),
+            "size_mb": _file_size_mb(onnx_dir(model_name), info["files"][variant]),
+            "doc_cosine_mean": float(doc_cos.mean()),
+            "doc_cosine_min": float(doc_cos.min()),
+            "query_cosine_mean": float(query_cos.mean()),
+            "query_cosine_min": float(query_cos.min()),
+            # top-k giống torch tới đâu: cả query + chunk đều ONNX / query ONNX trên index build bằng torch
+            f"overlap@{k}": _overlap(_top_k(query_vectors, docs, k), torch_top),
+            f"overlap@{k}_torch_index": _overlap(_top_k(query_vectors, torch_docs, k), torch_top),
+        }
+    return report
+
+
+def print_parity(report: dict):
+    k = report["k"]
+    print(f"\n{'':<10}{'chunk/s':>9}{'query p50':>11}{f'recall@{k}':>10}{'cos mean':>10}{'cos min':>9}"
+          f"{f'overlap@{k}':>11}{'(torch idx)':>12}")
+    for variant in ("torch", "fp32", "int8"):
+        r = report.get(variant)
+        if r is None:
+            continue
+        cos_mean = f"{r['doc_cosine_mean']:.4f}" if "doc_cosine_mean" in r else "-"
+        cos_min = f"{min(r['doc_cosine_min'], r['query_cosine_min']):.4f}" if "doc_cosine_min" in r else "-"
+        overlap = f"{r[f'overlap@{k}']:.3f}" if f"overlap@{k}" in r else "-"
+        overlap_torch = f"{r[f'overlap@{k}_torch_index']:.3f}" if f"overlap@{k}_torch_index" in r else "-"
+        print(f"{variant:<10}{r['docs_per_sec']:>9.1f}{r['query_p50_ms']:>9.1f}ms{r[f'recall@{k}']:>10.3f}"
+              f"{cos_mean:>10}{cos_min:>9}{overlap:>11}{overlap_torch:>12}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from EmbeddingRegistry import DEFAULT_MODEL
+
+    parser = argparse.ArgumentParser(description="Export e5 sang ONNX (int8) và so sánh với torch")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--export", action="store_true")
+    parser.add_argument("--no-int8", action="store_true", help="Chỉ export bản fp32")
+    parser.add_argument("--parity", action="store_true")
+    parser.add_argument("--store", default="vector_db2chunk_nltk")
+    parser.add_argument("--queries", default="benchmark_queries.json")
+    parser.add_argument("--sample", type=int, default=512, help="Số chunk dùng để so sánh (0 = cả store)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None, help="intra_op_num_threads của ONNX Runtime")
+    parser.add_argument("--output", default=None, help="Ghi báo cáo parity JSON")
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx(args.model, quantize=not args.no_int8)
+    if args.parity:
+        report = parity_check(args.model, args.store, args.queries, args.sample, args.k, args.threads)
+        print_parity(report)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"💾 Đã ghi {args.output}")
@@ -1,20 +1,10 @@
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+# Tạo vector DBs với các model khác (halong, AITeam, ...) để so sánh với e5-large
+#
+# PDF chỉ được đọc + chia chunk 1 lần, sau đó build index cho từng model (xem BuildIndexes.py).
+# LOW_MEMORY=1: load từng model và giải phóng trước khi load model sau.
 import os
 
-# Load PDF
-loader = PyPDFLoader("Chương 2 Biến, hằng và kiểu dữ liệu.pdf")
-documents = loader.load()
-
-# Split text
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-    length_function=len,
-)
-docs = text_splitter.split_documents(documents)
+from BuildIndexes import build_all
 
 # Danh sách vector store và model tương ứng
 vector_stores = [
@@ -23,32 +13,12 @@ vector_stores = [
     {"model_name": "AITeamVN/Vietnamese_Embedding", "folder": "vector_db_aiteam"}
 ]
 
-
-
-# Tạo và lưu vector store cho từng model
-for model_info in models:
-    model_name = model_info["name"]
-    save_path = model_info["folder"]
-
-    print(f"Processing model: {model_name}")
-
-    # Khởi tạo embedding
-    embeddings = HuggingFaceEmbeddings(
-        model_name=model_name,
-        model_kwargs={'device': 'cuda'},  # Dùng GPU nếu có, thay bằng 'cpu' nếu không
-        encode_kwargs={'normalize_embeddings': True}  # Normalize cho cosine similarity
-    )
-
-    # Tạo vector store với FAISS
-    db = FAISS.from_documents(docs, embeddings)
-
-    # Tạo thư mục lưu nếu chưa có
-    os.makedirs(save_path, exist_ok=True)
-
-    # Lưu vector store
-    db.save_local(save_path)
-    print(f"Vector store for {model_name} saved to {save_path}")
-
+# Tạo và lưu vector store cho từng model (cùng cách chia chunk 1000/200 như trước)
+build_all(
+    vector_stores,
+    sources=["Chương 2 Biến, hằng và kiểu dữ liệu.pdf"],
+    chunker="recursive",
+    low_memory=os.environ.get("LOW_MEMORY", "0") == "1",
+)
 
 print("All vector stores have been created and saved successfully!")
-
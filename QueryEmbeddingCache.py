@@ -0,0 +1,150 @@
+# QueryEmbeddingCache: cache embedding của câu query (LRU trong RAM + SQLite trên đĩa)
+#
+# Các query như f"{topic} {difficulty.value}" hay topic lặp lại với mọi thí sinh,
+# cache giúp bỏ qua 1 lần forward e5-large trên CPU cho mỗi lần lặp lại.
+# Tầng đĩa giữ lại qua các lần khởi động -> ngày thi mới bắt đầu với cache "ấm".
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_PATH = os.environ.get("QUERY_CACHE_PATH", "query_embeddings_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_SIZE", "10000"))
+
+
+def normalize_query(text: str) -> str:
+    """Chuẩn hóa query làm key: Unicode NFC, bỏ khoảng trắng thừa"""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class QueryEmbeddingCache:
+    """Cache 2 tầng: OrderedDict LRU có giới hạn + SQLite (tùy chọn), key = (model, text đã chuẩn hóa)"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, disk_path: Optional[str] = DEFAULT_CACHE_PATH):
+        self.max_entries = max_entries
+        self.disk_path = disk_path or None
+        self._memory: "OrderedDict[tuple, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if self.disk_path:
+            self._conn = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, text))"
+            )
+            self._conn.commit()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: tuple, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = (model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT vector FROM query_embeddings WHERE model = ? AND text = ?", key
+                ).fetchone()
+                if row is not None:
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, vector: List[float]):
+        key = (model, text)
+        with self._lock:
+            self._remember(key, vector)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, text, vector) VALUES (?, ?, ?)",
+                    (model, text, array("f", vector).tobytes()),
+                )
+                self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM query_embeddings")
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "disk_path": self.disk_path,
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Bọc 1 Embeddings: embed_query đi qua cache, embed_documents giữ nguyên"""
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: QueryEmbeddingCache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(self.model_name, key)
+        if vector is None:
+            vector = self.embeddings.embed_query(key)
+            self.cache.put(self.model_name, key, vector)
+        return vector
+
+
+_default_cache: Optional[QueryEmbeddingCache] = None
+_default_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """Cache mặc định dùng chung cho cả process (QUERY_CACHE_PATH="" để tắt tầng đĩa)"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = QueryEmbeddingCache()
+        return _default_cache
+
+
+def print_query_cache_stats():
+    s = get_query_cache().stats()
+    print(f"⚡ Query cache: {s['hits']} hit ({s['disk_hits']} từ đĩa), {s['misses']} miss, "
+          f"hit rate {s['hit_rate']:.0%}, {s['memory_entries']}/{s['max_entries']} trong RAM")
@@ -0,0 +1,203 @@
+# QuestionBank: ngân hàng câu hỏi sinh sẵn cho mỗi (topic, độ khó)
+#
+# Job offline sinh câu hỏi bằng Gemini, mỗi lần bám vào 1 chunk của knowledge_db, rồi loại
+# câu trùng ý bằng embedding (cosine >= threshold với câu đã có trong cùng topic).
+# Lúc phỏng vấn, AdaptiveInterviewer.next_question lấy câu từ ngân hàng trước (bỏ các câu
+# đã hỏi trong phiên), hết câu mới gọi LLM như cũ.
+#
+#   python QuestionBank.py                         # đủ PER_LEVEL câu cho mọi topic x độ khó
+#   python QuestionBank.py --per-level 20 --topic "Toán tử trong Java"
+#
+# Giống context_index.json, ngân hàng lưu fingerprint của knowledge_db và tự bỏ qua khi
+# index được build lại (chạy lại job để sinh bổ sung).
+import argparse
+import datetime
+import json
+import os
+import random
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from TolerantJson import extract_json
+
+DEFAULT_PER_LEVEL = 10
+DEFAULT_THRESHOLD = 0.92  # cosine (e5 đã normalize) từ mức này trở lên coi là trùng ý
+CHUNKS_PER_LEVEL = 4
+QUESTIONS_PER_CALL = 4
+
+
+# =======================
+# 1. Tra cứu lúc phỏng vấn
+# =======================
+
+class QuestionBank:
+    """entries[topic][difficulty] = [{"question", "source"}, ...]"""
+
+    def __init__(self, entries: Optional[Dict[str, Dict[str, List[dict]]]] = None,
+                 meta: Optional[dict] = None, seed: Optional[int] = None):
+        self.entries = entries or {}
+        self.meta = meta or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, folder: Optional[str] = None) -> "QuestionBank":
+        """Đọc ngân hàng, trả về ngân hàng rỗng nếu không có file hoặc knowledge_db đã đổi"""
+        from RetrievalContextIndex import index_fingerprint
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if folder is not None and data.get("fingerprint") != index_fingerprint(folder):
+            print(f"⚠️ {path} được sinh từ knowledge_db cũ, bỏ qua (chạy lại QuestionBank.py)")
+            return cls()
+        entries = data.pop("entries", {})
+        return cls(entries, data)
+
+    def questions(self, topic: str, difficulty: str) -> List[str]:
+        return [e["question"] for e in self.entries.get(topic, {}).get(difficulty, [])]
+
+    def available(self, topic: str, difficulty: str, exclude: Iterable[str] = ()) -> int:
+        exclude = set(exclude)
+        return sum(1 for q in self.questions(topic, difficulty) if q not in exclude)
+
+    def draw(self, topic: str, difficulty: str, exclude: Iterable[str] = ()) -> Optional[str]:
+        """Chọn ngẫu nhiên 1 câu chưa có trong exclude, None nếu hết"""
+        exclude = set(exclude)
+        remaining = [q for q in self.questions(topic, difficulty) if q not in exclude]
+        if not remaining:
+            return None
+        with self._lock:
+            return self._random.choice(remaining)
+
+    def __len__(self):
+        return sum(len(items) for levels in self.entries.values() for items in levels.values())
+
+    def save(self, path: str):
+        data = {**self.meta, "entries": self.entries}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+
+# =======================
+# 2. Job sinh câu hỏi offline
+# =======================
+
+def _generate_from_chunk(llm, topic: str, difficulty_description: str, chunk_text: str, n: int) -> List[str]:
+    prompt = f"""
+        Bạn là một Interviewer AI đang soạn ngân hàng câu hỏi.
+        Tạo {n} câu hỏi phỏng vấn Java khác nhau về chủ đề "{topic}" với độ khó "{difficulty_description}".
+
+        Tài liệu tham khảo:
+        {chunk_text}
+
+        Yêu cầu:
+        - Mỗi câu hỏi rõ ràng, cụ thể, phải lấy từ tài liệu tham khảo, không hỏi lan man
+        - Các câu hỏi không trùng ý nhau
+        - Tiếng Việt, hạn chế những cụm từ như "theo tài liệu tham khảo" trong câu hỏi
+
+        Trả về **CHỈ** **một object JSON thuần** có dạng: {{"questions": ["câu hỏi 1", "câu hỏi 2"]}}
+        - KHÔNG kèm lời chào, giải thích, hay code fence (```).
+        """
+    parsed = extract_json(llm.invoke(prompt, response_schema="questions"), "questions")
+    return [q for q in parsed.get("questions", []) if q]
+
+
+class _Deduplicator:
+    """Giữ vector (đã normalize) các câu hỏi của 1 topic, loại câu mới quá giống câu cũ"""
+
+    def __init__(self, embeddings, threshold: float):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add_existing(self, texts: List[str]):
+        if texts:
+            self._append(self._embed(texts))
+
+    def _append(self, vectors: np.ndarray):
+        self.vectors = vectors if self.vectors.size == 0 else np.vstack([self.vectors, vectors])
+
+    def filter(self, texts: List[str]) -> List[str]:
+        """Các câu không trùng ý với câu đã có (và với nhau), theo thứ tự"""
+        if not texts:
+            return []
+        kept = []
+        for text, vector in zip(texts, self._embed(texts)):
+            if self.vectors.size and float(np.max(self.vectors @ vector)) >= self.threshold:
+                continue
+            self._append(vector[None, :])
+            kept.append(text)
+        return kept
+
+
+def build_question_bank(interviewer, path: str, topics: List[str], per_level: int = DEFAULT_PER_LEVEL,
+                        threshold: float = DEFAULT_THRESHOLD) -> QuestionBank:
+    """Sinh bổ sung câu hỏi cho mọi (topic, độ khó) đến khi đủ per_level câu hoặc hết chunk"""
+    from LLMInterviewer2_fixed import InterviewConfig, QuestionDifficulty
+    from RetrievalContextIndex import index_fingerprint
+
+    folder = InterviewConfig.KNOWLEDGE_DB_PATH
+    bank = QuestionBank.load(path, folder)
+    llm_calls = 0
+    duplicates = 0
+
+    for topic in topics:
+        levels = bank.entries.setdefault(topic, {})
+        dedup = _Deduplicator(interviewer.embeddings, threshold)
+        dedup.add_existing([e["question"] for items in levels.values() for e in items])
+
+        for difficulty in QuestionDifficulty:
+            items = levels.setdefault(difficulty.value, [])
+            if len(items) >= per_level:
+                continue
+            docs = interviewer.knowledge_db.similarity_search(f"{topic} {difficulty.value}", k=CHUNKS_PER_LEVEL)
+            # Vòng qua các chunk đến khi đủ câu, mỗi chunk tối đa 2 lượt
+            for doc in docs * 2:
+                if len(items) >= per_level:
+                    break
+                n = min(QUESTIONS_PER_CALL, per_level - len(items) + 1)
+                generated = _generate_from_chunk(interviewer.llm, topic,
+                                                 InterviewConfig.DIFFICULTY_DESCRIPTIONS[difficulty],
+                                                 doc.page_content, n)
+                llm_calls += 1
+                kept = dedup.filter(generated)
+                duplicates += len(generated) - len(kept)
+                source = {"id": getattr(doc, "id", None), "page": doc.metadata.get("page")}
+                items.extend({"question": q, "source": source} for q in kept[:per_level - len(items)])
+            print(f"📚 {topic} / {difficulty.value}: {len(items)} câu")
+
+    bank.meta = {
+        "knowledge_db": folder,
+        "fingerprint": index_fingerprint(folder),
+        "threshold": threshold,
+        "created_at": datetime.datetime.now().isoformat(),
+    }
+    bank.save(path)
+    print(f"✅ Ngân hàng {len(bank)} câu hỏi -> {path} ({llm_calls} lượt gọi LLM, loại {duplicates} câu trùng)")
+    return bank
+
+
+if __name__ == "__main__":
+    from LLMInterviewer2_fixed import AdaptiveInterviewer, InterviewConfig
+
+    parser = argparse.ArgumentParser(description="Sinh ngân hàng câu hỏi cho mọi topic x độ khó")
+    parser.add_argument("--topic", action="append", help="Chỉ sinh cho topic này (lặp lại được)")
+    parser.add_argument("--per-level", type=int, default=DEFAULT_PER_LEVEL)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Ngưỡng cosine coi là trùng")
+    parser.add_argument("--output", default=InterviewConfig.QUESTION_BANK_PATH)
+    args = parser.parse_args()
+
+    build_question_bank(AdaptiveInterviewer(), args.output, args.topic or InterviewConfig.TOPICS,
+                        args.per_level, args.threshold)
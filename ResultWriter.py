@@ -0,0 +1,358 @@
+# ResultWriter: lưu kết quả phỏng vấn kiểu write-behind (không chặn luồng phỏng vấn)
+#
+#   writer = ResultWriter(mongo_collection())
+#   writer.submit(result)      # trả về ngay: ghi journal JSONL cục bộ rồi đưa vào hàng đợi
+#   writer.close()             # chờ ghi hết khi tắt chương trình
+#
+# - Thread nền gom kết quả thành lô và gọi insert_many (ordered=False) thay cho insert_one từng bản
+# - Mỗi kết quả được gắn _id cố định và ghi vào journal TRƯỚC khi gửi MongoDB; id đã ghi thành công
+#   được nối vào file .committed. Mongo lỗi / mất kết nối -> giữ lại, thử lại với backoff.
+# - Khởi động lại (hoặc replay()) gửi lại các kết quả trong journal chưa commit; bản ghi đã có
+#   trong Mongo (trùng _id, mã 11000) được coi là thành công nên replay chạy lại bao nhiêu lần cũng được.
+# - InMemoryCollection: thay cho collection của MongoDB khi test / demo (giả lập mất kết nối được).
+#
+#   python ResultWriter.py --replay          # gửi lại journal vào MongoDB
+#   python ResultWriter.py --demo            # giả lập Mongo sập giữa chừng bằng InMemoryCollection
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+DEFAULT_JOURNAL_PATH = os.path.join("InterviewScripts", "results_journal.jsonl")
+DEFAULT_BATCH_SIZE = 50
+MAX_BACKOFF_SECONDS = 30.0
+DUPLICATE_KEY = 11000
+_EMPTY = object()
+
+
+# =======================
+# 1. Collection giả cho test
+# =======================
+
+class InMemoryBulkWriteError(Exception):
+    """Cùng dạng với pymongo.errors.BulkWriteError: details["writeErrors"] = [{"index", "code", ...}]"""
+
+    def __init__(self, details: dict):
+        super().__init__(f"{len(details['writeErrors'])} lỗi ghi")
+        self.details = details
+
+
+class InMemoryCollection:
+    """Collection tối giản trong process: insert_one / insert_many / find / count_documents theo _id.
+
+    down = True (hoặc fail_next = n) để giả lập Mongo mất kết nối.
+    """
+
+    def __init__(self):
+        self.documents: Dict[str, dict] = {}
+        self.down = False
+        self.fail_next = 0
+        self.insert_calls = 0
+        self._lock = threading.Lock()
+
+    def _check_up(self):
+        if self.down or self.fail_next > 0:
+            self.fail_next = max(0, self.fail_next - 1)
+            raise ConnectionError("InMemoryCollection: giả lập mất kết nối MongoDB")
+
+    def insert_many(self, documents: List[dict], ordered: bool = True):
+        with self._lock:
+            self._check_up()
+            self.insert_calls += 1
+            errors = []
+            for i, doc in enumerate(documents):
+                doc.setdefault("_id", uuid.uuid4().hex)
+                if doc["_id"] in self.documents:
+                    errors.append({"index": i, "code": DUPLICATE_KEY, "errmsg": f"duplicate key {doc['_id']}"})
+                    if ordered:
+                        break
+                    continue
+                self.documents[doc["_id"]] = json.loads(json.dumps(doc, default=str))
+            if errors:
+                raise InMemoryBulkWriteError({"writeErrors": errors, "nInserted": len(documents) - len(errors)})
+
+    def insert_one(self, document: dict):
+        self.insert_many([document])
+
+    def find(self, query: Optional[dict] = None) -> List[dict]:
+        with self._lock:
+            return [d for d in self.documents.values() if all(d.get(k) == v for k, v in (query or {}).items())]
+
+    def count_documents(self, query: Optional[dict] = None) -> int:
+        return len(self.find(query))
+
+
+def mongo_collection(uri: str = "mongodb://localhost:27017/", database: str = "interviewer_ai",
+                     name: str = "interview_results"):
+    from pymongo import MongoClient
+
+    # Timeout ngắn để lúc Mongo sập, thread nền sớm chuyển sang chờ thử lại
+    client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    return client[database][name]
+
+
+def _only_duplicates(error: Exception) -> bool:
+    """insert_many lỗi nhưng chỉ vì các _id đã có (replay lại bản đã ghi) -> coi như thành công"""
+    details = getattr(error, "details", None)
+    write_errors = (details or {}).get("writeErrors")
+    return bool(write_errors) and all(e.get("code") == DUPLICATE_KEY for e in write_errors)
+
+
+# =======================
+# 2. Journal
+# =======================
+
+class ResultJournal:
+    """journal.jsonl: mọi kết quả đã nhận; journal.jsonl.committed: _id đã vào MongoDB"""
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self.committed_path = path + ".committed"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+
+    def append(self, result: dict):
+        line = json.dumps(result, ensure_ascii=False, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def mark_committed(self, ids: Iterable[str]):
+        with self._lock, open(self.committed_path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{i}\n" for i in ids))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _committed_ids(self) -> set:
+        try:
+            with open(self.committed_path, encoding="utf-8") as f:
+                return {line.strip() for line in f if line.strip()}
+        except OSError:
+            return set()
+
+    def pending(self) -> List[dict]:
+        """Các kết quả trong journal chưa commit (dòng cuối bị ghi dở thì bỏ qua)"""
+        committed = self._committed_ids()
+        results, seen = [], set()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        continue
+                    if result.get("_id") not in committed and result.get("_id") not in seen:
+                        seen.add(result.get("_id"))
+                        results.append(result)
+        except OSError:
+            pass
+        return results
+
+    def compact(self):
+        """Xóa journal khi mọi kết quả đã commit (gọi khi không còn ghi song song)"""
+        if not self.pending():
+            with self._lock:
+                for path in (self.path, self.committed_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+
+# =======================
+# 3. Writer
+# =======================
+
+class ResultWriter:
+    def __init__(self, collection, journal_path: str = DEFAULT_JOURNAL_PATH, batch_size: int = DEFAULT_BATCH_SIZE,
+                 result_dir: Optional[str] = "InterviewScripts",
+                 on_error: Optional[Callable[[Exception], None]] = None):
+        self.collection = collection
+        self.journal = ResultJournal(journal_path)
+        self.batch_size = batch_size
+        self.result_dir = result_dir
+        self.on_error = on_error
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue()
+        self._pending: List[dict] = []
+        self._outstanding = 0  # số kết quả chưa vào MongoDB
+        self._done = threading.Condition()
+        self.stats = {"submitted": 0, "written": 0, "batches": 0, "failures": 0, "replayed": 0}
+
+        # Kết quả chưa vào Mongo từ lần chạy trước
+        replay = self.journal.pending()
+        if replay:
+            self._pending.extend(replay)
+            self._outstanding = len(replay)
+            self.stats["replayed"] = len(replay)
+            print(f"♻️ {len(replay)} kết quả trong journal chưa lưu vào MongoDB, sẽ gửi lại")
+
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, result: dict) -> str:
+        """Ghi journal + xếp hàng, trả về _id của kết quả (không chờ MongoDB)"""
+        if self._closed:
+            raise RuntimeError("ResultWriter đã đóng")
+        result.setdefault("_id", uuid.uuid4().hex)
+        self.journal.append(result)
+        with self._done:
+            self._outstanding += 1
+            self.stats["submitted"] += 1
+        self._queue.put(result)
+        return result["_id"]
+
+    # ============ Thread nền ============
+    def _next_item(self, wait: Optional[float]):
+        """Item kế tiếp trong hàng đợi, _EMPTY nếu không có (wait=None: chờ đến khi có)"""
+        try:
+            if wait is None:
+                return self._queue.get()
+            if wait <= 0:
+                return self._queue.get_nowait()
+            return self._queue.get(timeout=wait)
+        except queue.Empty:
+            return _EMPTY
+
+    def _run(self):
+        stop = False
+        delay = 0.0
+        retry_at = 0.0
+        while True:
+            if not self._pending and (stop or self._queue.empty()):
+                if stop:
+                    break
+                wait = None
+            elif stop:
+                wait = 0.0
+            else:
+                # Bình thường: lấy hết những gì đang có rồi ghi; đang lỗi: gom tiếp đến lúc thử lại
+                wait = max(0.0, retry_at - time.monotonic())
+            item = self._next_item(wait)
+            if item is None:
+                stop = True
+                continue
+            if item is not _EMPTY:
+                self._pending.append(item)
+                self._write_file(item)
+                if len(self._pending) < self.batch_size:
+                    continue
+
+            if time.monotonic() < retry_at:
+                if stop:
+                    break  # Đang đóng mà Mongo vẫn lỗi: journal giữ lại để lần sau replay
+                continue
+            if self._flush(first_failure=delay == 0):
+                if delay:
+                    print("✅ MongoDB đã kết nối lại, đang ghi các kết quả tồn")
+                delay = retry_at = 0.0
+            else:
+                if stop:
+                    break
+                delay = min(MAX_BACKOFF_SECONDS, max(0.5, delay * 2))
+                retry_at = time.monotonic() + delay * random.uniform(0.8, 1.2)
+
+    def _flush(self, first_failure: bool = True) -> bool:
+        """Ghi tối đa batch_size kết quả đang chờ, False nếu MongoDB lỗi"""
+        batch = self._pending[:self.batch_size]
+        # insert_many có thể thêm / sửa field của document -> gửi bản sao
+        documents = [dict(result) for result in batch]
+        try:
+            self.collection.insert_many(documents, ordered=False)
+        except Exception as e:
+            if not _only_duplicates(e):
+                self.stats["failures"] += 1
+                if self.on_error is not None:
+                    self.on_error(e)
+                elif first_failure:
+                    print(f"⚠️ Không ghi được MongoDB ({type(e).__name__}: {e}), kết quả vẫn nằm trong journal")
+                return False
+        self.journal.mark_committed(result["_id"] for result in batch)
+        del self._pending[:len(batch)]
+        with self._done:
+            self._outstanding -= len(batch)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+            self._done.notify_all()
+        return True
+
+    def _write_file(self, result: dict):
+        """File JSON từng kết quả như trước (InterviewScripts/interview_result_<tên>.json)"""
+        if not self.result_dir:
+            return
+        name = str(result.get("candidate_info", {}).get("name", result["_id"]))
+        path = os.path.join(self.result_dir, f"interview_result_{name.replace(',', '_')}.json")
+        try:
+            os.makedirs(self.result_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({k: v for k, v in result.items() if k != "_id"}, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"⚠️ Không ghi được {path}: {e}")
+
+    # ============ Điều khiển ============
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Chờ đến khi mọi kết quả đã vào MongoDB, False nếu hết timeout"""
+        with self._done:
+            return self._done.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def close(self, timeout: Optional[float] = 30):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._outstanding == 0:
+            self.journal.compact()
+        else:
+            print(f"⚠️ Còn {self._outstanding} kết quả chưa vào MongoDB, đã lưu trong {self.journal.path}")
+
+
+def replay(collection, journal_path: str = DEFAULT_JOURNAL_PATH, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Gửi lại các kết quả chưa commit trong journal, trả về số kết quả đã gửi"""
+    journal = ResultJournal(journal_path)
+    pending = journal.pending()
+    for i in range(0, len(pending), batch_size):
+        batch = pending[i:i + batch_size]
+        try:
+            collection.insert_many([dict(r) for r in batch], ordered=False)
+        except Exception as e:
+            if not _only_duplicates(e):
+                raise
+        journal.mark_committed(r["_id"] for r in batch)
+    journal.compact()
+    return len(pending)
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Journal kết quả phỏng vấn -> MongoDB")
+    parser.add_argument("--replay", action="store_true", help="Gửi lại journal chưa commit vào MongoDB")
+    parser.add_argument("--demo", action="store_true", help="Giả lập Mongo sập bằng InMemoryCollection")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL_PATH)
+    args = parser.parse_args()
+
+    if args.replay:
+        print(f"✅ Đã gửi lại {replay(mongo_collection(), args.journal)} kết quả")
+    elif args.demo:
+        collection = InMemoryCollection()
+        journal = os.path.join(tempfile.mkdtemp(), "journal.jsonl")
+        writer = ResultWriter(collection, journal, batch_size=10, result_dir=None)
+        for i in range(25):
+            writer.submit({"candidate_info": {"name": f"demo {i}"}, "interview_stats": {"final_score": i % 10}})
+        writer.flush(5)
+        collection.down = True
+        for i in range(25, 40):
+            writer.submit({"candidate_info": {"name": f"demo {i}"}, "interview_stats": {"final_score": i % 10}})
+        time.sleep(1)
+        print(f"💥 Mongo sập: {collection.count_documents()} bản trong Mongo, "
+              f"{len(writer.journal.pending())} bản chờ trong journal")
+        collection.down = False
+        writer.flush(60)
+        writer.close()
+        # Replay lần nữa không tạo bản trùng
+        replay(collection, journal)
+        print(f"✅ Sau khi kết nối lại: {collection.count_documents()} bản, {collection.insert_calls} lần insert_many, "
+              f"stats {writer.stats}")
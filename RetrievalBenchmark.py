@@ -0,0 +1,327 @@
+# RetrievalBenchmark: so sánh các FAISS store (model / chunker / loại index) trên bộ query có nhãn
+#
+#   python RetrievalBenchmark.py                                       # các store mặc định có trên đĩa
+#   python RetrievalBenchmark.py vector_db2chunk_nltk hiieu/halong_embedding:vector_db_halong
+#   python RetrievalBenchmark.py --output bench.json --baseline bench_old.json   # báo regression
+#
+# Bộ query: benchmark_queries.json, mỗi query có danh sách cụm từ "relevant"; 1 chunk được tính
+# là đúng nếu chứa 1 trong các cụm từ đó (không phân biệt hoa thường / khoảng trắng).
+# Mỗi store chạy trong 1 process mới (spawn) để đo cold start và RSS sau khi load không bị
+# ảnh hưởng bởi store trước. Kết quả ghi ra JSON, exit code 1 nếu có regression so với baseline.
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import unicodedata
+from typing import List, Optional
+
+import numpy as np
+
+QUERIES_FILE = "benchmark_queries.json"
+DEFAULT_K = 5
+DEFAULT_REPEATS = 5
+
+# Store đang dùng + các store của BuildIndexes.py (store nào chưa build sẽ bị bỏ qua)
+DEFAULT_STORES = [
+    {"model_name": "intfloat/multilingual-e5-large-instruct", "folder": "vector_db2"},
+    {"model_name": "intfloat/multilingual-e5-large-instruct", "folder": "vector_db2chunk_nltk"},
+    {"model_name": "intfloat/multilingual-e5-large-instruct", "folder": "vector_db_e5_large"},
+    {"model_name": "hiieu/halong_embedding", "folder": "vector_db_halong"},
+    {"model_name": "AITeamVN/Vietnamese_Embedding", "folder": "vector_db_aiteam"},
+    {"model_name": "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", "folder": "vector_db_minilm"},
+]
+
+# Ngưỡng báo regression so với baseline
+RECALL_TOLERANCE = 0.02
+MRR_TOLERANCE = 0.02
+LATENCY_TOLERANCE = 0.25  # p95 chậm hơn 25%
+
+
+# =======================
+# 1. Bộ query & chấm điểm
+# =======================
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFC", text).replace("\xa0", " ")
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def load_queries(path: str = QUERIES_FILE) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        queries = json.load(f)
+    for q in queries:
+        q["relevant"] = [normalize_text(p) for p in q["relevant"]]
+    return queries
+
+
+def is_relevant(text: str, phrases: List[str]) -> bool:
+    text = normalize_text(text)
+    return any(p in text for p in phrases)
+
+
+def first_relevant_rank(texts: List[str], phrases: List[str]) -> Optional[int]:
+    """Thứ hạng (từ 1) của chunk đúng đầu tiên, None nếu không có"""
+    for rank, text in enumerate(texts, start=1):
+        if is_relevant(text, phrases):
+            return rank
+    return None
+
+
+def score_ranks(ranks: List[Optional[int]], k: int) -> dict:
+    """recall@1/3/k (tỉ lệ query có chunk đúng trong top) và MRR@k"""
+    n = max(len(ranks), 1)
+    scores = {}
+    for cutoff in sorted({1, 3, k}):
+        if cutoff <= k:
+            scores[f"recall@{cutoff}"] = sum(1 for r in ranks if r is not None and r <= cutoff) / n
+    scores[f"mrr@{k}"] = sum(1.0 / r for r in ranks if r is not None) / n
+    return scores
+
+
+def percentiles_ms(seconds: List[float]) -> dict:
+    if not seconds:
+        return {}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+# =======================
+# 2. Thông tin store trên đĩa
+# =======================
+
+def folder_size_mb(folder: str, names: Optional[List[str]] = None) -> float:
+    """Dung lượng thư mục, hoặc chỉ các file trong names (1 định dạng store)"""
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if names is None or name in names:
+                total += os.path.getsize(os.path.join(root, name))
+    return total / (1024 * 1024)
+
+
+def read_build_manifest(folder: str) -> Optional[dict]:
+    from BuildIndexes import BUILD_MANIFEST_FILE
+
+    try:
+        with open(os.path.join(folder, BUILD_MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def resolve_store(spec: dict) -> dict:
+    """Bổ sung model / chunker / loại index / thời gian build từ build_manifest.json (nếu có)"""
+    manifest = read_build_manifest(spec["folder"]) or {}
+    store = dict(spec)
+    store.setdefault("model_name", manifest.get("model_name"))
+    # Store cũ (vector_db2*, build trước BuildIndexes) không có manifest và không normalize
+    store["encode_kwargs"] = manifest.get("encode_kwargs", {})
+    store["chunker"] = (manifest.get("chunker") or {}).get("splitter")
+    store["index_type"] = manifest.get("index_type", "flat")
+    store["build_seconds"] = (manifest.get("timings") or {}).get("total_seconds")
+    store["chunks_per_sec"] = manifest.get("chunks_per_sec")
+    if store.get("format", "auto") == "auto":
+        from MmapVectorStore import has_mmap_store
+        store["format"] = "mmap" if has_mmap_store(spec["folder"]) else "pickle"
+    return store
+
+
+# =======================
+# 3. Đo 1 store (chạy trong process riêng)
+# =======================
+
+def _measure(store: dict, queries: List[dict], k: int, repeats: int) -> dict:
+    from EmbeddingRegistry import current_rss_mb, get_embeddings
+
+    rss_start = current_rss_mb()
+    t0 = time.perf_counter()
+    embeddings = get_embeddings(store["model_name"], {"device": store.get("device") or _device()},
+                                store["encode_kwargs"])
+    t1 = time.perf_counter()
+
+    if store["format"] == "mmap":
+        from MmapVectorStore import load_mmap_store
+        db = load_mmap_store(store["folder"], embeddings)
+    else:
+        from langchain_community.vectorstores import FAISS
+        db = FAISS.load_local(store["folder"], embeddings, allow_dangerous_deserialization=True)
+    t2 = time.perf_counter()
+    db.similarity_search(queries[0]["query"], k=k)
+    t3 = time.perf_counter()
+    rss_loaded = current_rss_mb()
+
+    # Chất lượng: embed_query + search, không dùng query cache
+    ranks = []
+    per_query = []
+    latencies = []
+    for q in queries:
+        docs = db.similarity_search(q["query"], k=k)
+        rank = first_relevant_rank([d.page_content for d in docs], q["relevant"])
+        ranks.append(rank)
+        per_query.append({"query": q["query"], "topic": q.get("topic"), "rank": rank})
+
+    # Độ trễ: mỗi query lặp lại `repeats` lần
+    for _ in range(repeats):
+        for q in queries:
+            start = time.perf_counter()
+            db.similarity_search(q["query"], k=k)
+            latencies.append(time.perf_counter() - start)
+
+    return {
+        **score_ranks(ranks, k),
+        "latency": percentiles_ms(latencies),
+        "cold_start": {
+            "model_load_seconds": t1 - t0,
+            "index_load_seconds": t2 - t1,
+            "first_query_seconds": t3 - t2,
+            "total_seconds": t3 - t0,
+        },
+        "rss_mb": {
+            "before_load": rss_start,
+            "after_load": rss_loaded,
+        },
+        "vectors": db.index.ntotal,
+        "dimension": db.index.d,
+        "per_query": per_query,
+    }
+
+
+def _device() -> str:
+    from EmbeddingEngine import detect_device
+    return detect_device()
+
+
+def benchmark_store(store: dict, queries: List[dict], k: int = DEFAULT_K, repeats: int = DEFAULT_REPEATS,
+                    isolated: bool = True) -> dict:
+    """Đo 1 store, isolated=True: chạy trong process mới để cold start / RSS chính xác"""
+    store = resolve_store(store)
+    result = {key: store[key] for key in ("folder", "model_name", "chunker", "index_type", "format",
+                                          "build_seconds", "chunks_per_sec")}
+    if store["format"] == "mmap":
+        from MmapVectorStore import store_files
+        result["disk_mb"] = folder_size_mb(store["folder"], store_files(store["folder"]))
+    else:
+        result["disk_mb"] = folder_size_mb(store["folder"], ["index.faiss", "index.pkl"])
+
+    if isolated:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(1) as pool:
+            result.update(pool.apply(_measure, (store, queries, k, repeats)))
+    else:
+        result.update(_measure(store, queries, k, repeats))
+    return result
+
+
+# =======================
+# 4. Chạy cả bộ + so sánh baseline
+# =======================
+
+def run_benchmark(stores: List[dict], queries_path: str = QUERIES_FILE, k: int = DEFAULT_K,
+                  repeats: int = DEFAULT_REPEATS, isolated: bool = True) -> dict:
+    queries = load_queries(queries_path)
+    results = []
+    for store in stores:
+        if not os.path.exists(os.path.join(store["folder"], "index.faiss")):
+            print(f"⏭️ Bỏ qua {store['folder']} (chưa build)")
+            continue
+        print(f"\n=== {store['folder']} ({store.get('model_name') or 'build_manifest'}) ===")
+        result = benchmark_store(store, queries, k, repeats, isolated)
+        print_result(result, k)
+        results.append(result)
+    return {
+        "created_at": datetime.datetime.now().isoformat(),
+        "queries_file": queries_path,
+        "queries": len(queries),
+        "k": k,
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+def print_result(r: dict, k: int):
+    lat = r["latency"]
+    cold = r["cold_start"]
+    build = f"{r['build_seconds']:.1f}s" if r.get("build_seconds") is not None else "N/A"
+    rss = r["rss_mb"]["after_load"]
+    rss = f"{rss:.0f} MB" if rss is not None else "N/A"
+    print(f"🎯 recall@1 {r['recall@1']:.2f} | recall@{k} {r[f'recall@{k}']:.2f} | MRR@{k} {r[f'mrr@{k}']:.3f}")
+    print(f"⏱️ p50 {lat['p50_ms']:.1f} ms | p95 {lat['p95_ms']:.1f} ms | p99 {lat['p99_ms']:.1f} ms")
+    print(f"🚀 Cold start {cold['total_seconds']:.1f}s (model {cold['model_load_seconds']:.1f}s, "
+          f"index {cold['index_load_seconds']:.2f}s) | RSS {rss}")
+    print(f"💾 {r['disk_mb']:.1f} MB trên đĩa, {r['vectors']} vector | build {build}")
+    missed = [q["query"] for q in r["per_query"] if q["rank"] is None]
+    if missed:
+        print(f"❌ Không tìm thấy trong top {k}: {missed}")
+
+
+def compare(report: dict, baseline: dict) -> List[str]:
+    """Danh sách regression của report so với baseline (so theo folder + định dạng)"""
+    k = report["k"]
+    old_by_store = {(r["folder"], r.get("format", "pickle")): r
+                    for r in baseline.get("results", []) if baseline.get("k") == k}
+    regressions = []
+    for r in report["results"]:
+        old = old_by_store.get((r["folder"], r.get("format", "pickle")))
+        if old is None:
+            continue
+        for metric, tol in ((f"recall@{k}", RECALL_TOLERANCE), (f"mrr@{k}", MRR_TOLERANCE)):
+            if r[metric] < old[metric] - tol:
+                regressions.append(f"{r['folder']}: {metric} {old[metric]:.3f} -> {r[metric]:.3f}")
+        old_p95 = old["latency"].get("p95_ms")
+        new_p95 = r["latency"].get("p95_ms")
+        if old_p95 and new_p95 and new_p95 > old_p95 * (1 + LATENCY_TOLERANCE):
+            regressions.append(f"{r['folder']}: p95 {old_p95:.1f} ms -> {new_p95:.1f} ms")
+    return regressions
+
+
+def _parse_store(spec: str) -> dict:
+    """"folder" hoặc "model_name:folder" """
+    model_name, _, folder = spec.rpartition(":")
+    store = {"folder": folder}
+    if model_name:
+        store["model_name"] = model_name
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval trên các FAISS store")
+    parser.add_argument("stores", nargs="*", help="folder hoặc model_name:folder (mặc định: các store đã biết)")
+    parser.add_argument("--queries", default=QUERIES_FILE)
+    parser.add_argument("-k", type=int, default=DEFAULT_K)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Số lần lặp mỗi query khi đo độ trễ")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="File kết quả cũ để so sánh")
+    parser.add_argument("--in-process", action="store_true", help="Không tách process cho từng store")
+    parser.add_argument("--format", choices=["auto", "pickle", "mmap"], default="auto",
+                        help="Định dạng load store (auto: mmap nếu có, xem MmapVectorStore.py)")
+    args = parser.parse_args()
+
+    stores = [_parse_store(s) for s in args.stores] if args.stores else DEFAULT_STORES
+    for store in stores:
+        store["format"] = args.format
+        if not store.get("model_name") and not read_build_manifest(store["folder"]):
+            store["model_name"] = DEFAULT_STORES[0]["model_name"]
+
+    report = run_benchmark(stores, args.queries, args.k, args.repeats, isolated=not args.in_process)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📄 Đã ghi kết quả vào {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f))
+        if regressions:
+            print("⚠️ Regression so với baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("✅ Không có regression so với baseline")
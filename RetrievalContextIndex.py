@@ -0,0 +1,107 @@
+# RetrievalContextIndex: tính sẵn top-k chunk cho mọi cặp (topic, độ khó)
+#
+# Knowledge base chỉ thay đổi khi NLTK.py build lại vector_db2chunk_nltk, nên kết quả
+# retriever.invoke(f"{topic} {difficulty}") và retriever.invoke(topic) có thể tính 1 lần
+# lúc build index rồi lưu vào context_index.json cạnh index.faiss.
+# Khi index.faiss / index.pkl thay đổi (fingerprint khác), index tự vô hiệu hóa.
+#
+# Build lại cho store có sẵn:  python RetrievalContextIndex.py vector_db2chunk_nltk
+import json
+import os
+import sys
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from QueryEmbeddingCache import normalize_query
+
+CONTEXT_INDEX_FILE = "context_index.json"
+INDEX_FILES = ("index.faiss", "index.pkl")
+
+
+def index_fingerprint(folder: str) -> Optional[str]:
+    """Fingerprint rẻ (size + mtime) của các file index, None nếu thiếu file"""
+    parts = []
+    for name in INDEX_FILES:
+        try:
+            st = os.stat(os.path.join(folder, name))
+        except OSError:
+            return None
+        parts.append(f"{name}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+
+def build_queries(topics: Iterable[str], difficulties: Iterable[str]) -> List[str]:
+    """Các query mà interviewer dùng: topic (khi chấm điểm) và "topic difficulty" (khi sinh câu hỏi)"""
+    difficulties = list(difficulties)
+    queries = []
+    for topic in topics:
+        queries.append(topic)
+        queries.extend(f"{topic} {d}" for d in difficulties)
+    return queries
+
+
+def build_context_index(db, folder: str, queries: Iterable[str], k: int = 5) -> dict:
+    """Chạy retriever cho từng query và lưu kết quả vào folder/context_index.json"""
+    retriever = db.as_retriever(search_kwargs={"k": k})
+    entries = {}
+    for query in queries:
+        key = normalize_query(query)
+        if key in entries:
+            continue
+        docs = retriever.invoke(key)
+        entries[key] = [{"page_content": d.page_content, "metadata": d.metadata} for d in docs]
+
+    data = {"fingerprint": index_fingerprint(folder), "k": k, "entries": entries}
+    path = os.path.join(folder, CONTEXT_INDEX_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    print(f"🗂️ Context index: {len(entries)} query (k={k}) -> {path}")
+    return data
+
+
+class RetrievalContextIndex:
+    """Tra cứu context đã tính sẵn, tự vô hiệu hóa khi file index thay đổi"""
+
+    def __init__(self, folder: str, k: int = 5):
+        self.folder = folder
+        self.k = k
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[dict]] = {}
+        self._fingerprint: Optional[str] = None
+        self._load()
+
+    def _load(self):
+        self._entries, self._fingerprint = {}, None
+        path = os.path.join(self.folder, CONTEXT_INDEX_FILE)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("k") == self.k and data.get("fingerprint") == index_fingerprint(self.folder):
+            self._entries = data.get("entries", {})
+            self._fingerprint = data["fingerprint"]
+
+    def lookup(self, query: str) -> Optional[List[dict]]:
+        """Trả về list {"page_content", "metadata"} hoặc None nếu không có / đã hết hạn"""
+        with self._lock:
+            if self._fingerprint != index_fingerprint(self.folder):
+                # Index đã được build lại: thử đọc context index mới, nếu chưa có thì bỏ
+                self._load()
+            return self._entries.get(normalize_query(query))
+
+    def __len__(self):
+        return len(self._entries)
+
+
+if __name__ == "__main__":
+    from EmbeddingRegistry import load_faiss
+    from LLMInterviewer2_fixed import InterviewConfig, QuestionDifficulty
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else InterviewConfig.KNOWLEDGE_DB_PATH
+    db = load_faiss(folder)
+    build_context_index(db, folder,
+                        build_queries(InterviewConfig.TOPICS, [d.value for d in QuestionDifficulty]),
+                        k=InterviewConfig.RETRIEVAL_K)
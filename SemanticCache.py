@@ -0,0 +1,212 @@
+# SemanticCache: cache câu trả lời của chat RAG (LLM.py) theo ý nghĩa câu hỏi
+#
+# Sinh viên hay hỏi gần như cùng 1 câu ("kiểu dữ liệu trong Java là gì", "Java có những kiểu
+# dữ liệu nào"...). Mỗi câu hỏi được embed bằng e5 (qua QueryEmbeddingCache), nếu cosine với
+# 1 câu đã trả lời >= threshold thì trả lại câu trả lời cũ ngay, bỏ qua retrieve + Gemini.
+#
+#   cache = SemanticResponseCache("vector_db2", embeddings)
+#   hit = cache.lookup(question)            # CacheHit | None
+#   cache.put(question, answer, latency)    # sau khi LLM trả lời
+#
+# - Entry hết hạn sau ttl_seconds, tối đa max_entries (bỏ entry ít dùng nhất - LRU)
+# - Lưu kèm fingerprint của index: build lại vector_db2 thì toàn bộ cache bị xóa
+# - Tầng SQLite giữ cache qua các lần chạy (SEMANTIC_CACHE_PATH="" để chỉ dùng RAM)
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from QueryEmbeddingCache import normalize_query
+from RetrievalContextIndex import index_fingerprint
+
+DEFAULT_CACHE_PATH = os.environ.get("SEMANTIC_CACHE_PATH", "semantic_cache.sqlite3")
+DEFAULT_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+DEFAULT_TTL_SECONDS = float(os.environ.get("SEMANTIC_CACHE_TTL", str(24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_SIZE", "1000"))
+
+
+@dataclass
+class CacheEntry:
+    entry_id: int
+    question: str
+    answer: str
+    vector: np.ndarray  # đã normalize
+    created_at: float
+    latency_seconds: float  # thời gian trả lời lần đầu (= thời gian tiết kiệm mỗi lần hit)
+
+
+@dataclass
+class CacheHit:
+    entry: CacheEntry
+    similarity: float
+
+    @property
+    def answer(self) -> str:
+        return self.entry.answer
+
+
+class SemanticResponseCache:
+    def __init__(self, folder: str, embeddings, threshold: float = DEFAULT_THRESHOLD,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 disk_path: Optional[str] = DEFAULT_CACHE_PATH):
+        self.folder = folder
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.disk_path = disk_path or None
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None  # vector các entry theo thứ tự _entries, dựng lại khi đổi
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._fingerprint = index_fingerprint(folder)
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidations = 0
+        self.latency_saved_seconds = 0.0
+
+        self._conn = None
+        if self.disk_path:
+            self._conn = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS semantic_cache ("
+                " id INTEGER PRIMARY KEY, folder TEXT NOT NULL, fingerprint TEXT, question TEXT NOT NULL,"
+                " answer TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL, latency REAL NOT NULL)"
+            )
+            self._conn.commit()
+            self._load_from_disk()
+
+    # ============ Tầng đĩa ============
+    def _load_from_disk(self):
+        # Entry của index cũ / đã hết hạn bị xóa luôn
+        cutoff = time.time() - self.ttl_seconds
+        self._conn.execute("DELETE FROM semantic_cache WHERE folder = ? AND (fingerprint IS NOT ? OR created_at < ?)",
+                           (self.folder, self._fingerprint, cutoff))
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT id, question, answer, vector, created_at, latency FROM semantic_cache"
+            " WHERE folder = ? ORDER BY created_at DESC LIMIT ?", (self.folder, self.max_entries)
+        ).fetchall()
+        for entry_id, question, answer, blob, created_at, latency in reversed(rows):
+            vector = np.frombuffer(blob, dtype=np.float32)
+            self._entries[entry_id] = CacheEntry(entry_id, question, answer, vector, created_at, latency)
+
+    def _delete_rows(self, entry_ids):
+        if self._conn is not None and entry_ids:
+            self._conn.executemany("DELETE FROM semantic_cache WHERE id = ?", [(i,) for i in entry_ids])
+            self._conn.commit()
+
+    # ============ Tra cứu / ghi ============
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(normalize_query(question)), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _check_fresh(self):
+        """Index thay đổi (build lại / ingest thêm) -> câu trả lời cũ có thể sai, xóa hết"""
+        fingerprint = index_fingerprint(self.folder)
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self.invalidations += 1
+            self._delete_rows(list(self._entries))
+            self._entries.clear()
+            self._matrix = None
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        stale = [i for i, e in self._entries.items() if e.created_at < cutoff]
+        for entry_id in stale:
+            del self._entries[entry_id]
+        if stale:
+            self.expired += len(stale)
+            self._matrix = None
+            self._delete_rows(stale)
+
+    def lookup(self, question: str, vector: Optional[np.ndarray] = None) -> Optional[CacheHit]:
+        """Câu trả lời của câu hỏi gần nhất nếu cosine >= threshold, None nếu không có"""
+        if vector is None:
+            vector = self._embed(question)
+        with self._lock:
+            self._check_fresh()
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix = np.stack([e.vector for e in self._entries.values()])
+            similarities = self._matrix @ vector
+            best = int(np.argmax(similarities))
+            if float(similarities[best]) < self.threshold:
+                self.misses += 1
+                return None
+            entry = list(self._entries.values())[best]
+            self._entries.move_to_end(entry.entry_id)
+            self._matrix = None
+            self.hits += 1
+            self.latency_saved_seconds += entry.latency_seconds
+            return CacheHit(entry, float(similarities[best]))
+
+    def put(self, question: str, answer: str, latency_seconds: float, vector: Optional[np.ndarray] = None):
+        if vector is None:
+            vector = self._embed(question)
+        with self._lock:
+            self._check_fresh()
+            created_at = time.time()
+            if self._conn is not None:
+                # id lấy từ SQLite (bảng dùng chung cho nhiều store)
+                entry_id = self._conn.execute(
+                    "INSERT INTO semantic_cache (folder, fingerprint, question, answer, vector, created_at, latency)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.folder, self._fingerprint, question, answer,
+                     np.asarray(vector, dtype=np.float32).tobytes(), created_at, latency_seconds),
+                ).lastrowid
+                self._conn.commit()
+            else:
+                entry_id = self._next_id
+                self._next_id += 1
+            self._entries[entry_id] = CacheEntry(entry_id, question, answer, vector, created_at, latency_seconds)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            self.evicted += len(evicted)
+            self._matrix = None
+            self._delete_rows(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._delete_rows(list(self._entries))
+            self._entries.clear()
+            self._matrix = None
+
+    # ============ Thống kê ============
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "latency_saved_seconds": self.latency_saved_seconds,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "invalidations": self.invalidations,
+            "threshold": self.threshold,
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"🧠 Semantic cache: {s['hits']} hit, {s['misses']} miss, hit rate {s['hit_rate']:.0%}, "
+              f"tiết kiệm {s['latency_saved_seconds']:.1f}s, {s['entries']}/{s['max_entries']} câu trả lời")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,204 @@
+# SpeculativePrefetch: sinh trước câu hỏi kế tiếp trong lúc thí sinh đang trả lời
+#
+# Sau mỗi câu trả lời, độ khó kế tiếp chỉ có thể là 1 trong 3 nhánh của decide_next_action:
+# get_next_difficulty(current, "harder" | "same" | "easier"). Ngay khi câu hỏi hiện tại được
+# hiển thị, start() giả lập update_state_after_question cho từng nhánh và sinh câu hỏi cho các
+# nhánh còn tiếp tục ở background. Khi đã chấm xong, commit() lấy câu hỏi của đúng nhánh,
+# hủy (hoặc bỏ kết quả) các nhánh còn lại.
+#
+# Đánh đổi: câu hỏi sinh trước chỉ thấy lịch sử hội thoại đến câu hỏi hiện tại, chưa có câu
+# trả lời + nhận xét mới nhất. Token được ước lượng (~4 ký tự / token) vì LLM không trả usage.
+# Nhánh có sẵn câu trong ngân hàng câu hỏi (QuestionBank) không cần sinh trước.
+#
+# Bật trong LLMInterviewer2_fixed.py / InterviewServer.py bằng SPECULATIVE_PREFETCH=1.
+import copy
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from LLMInterviewer2_fixed import AdaptiveInterviewer, InterviewConfig, InterviewState
+
+ACTIONS = ("harder", "same", "easier")
+
+# Điểm đại diện cho từng nhánh của decide_next_action
+_BRANCH_SCORES = {
+    "harder": InterviewConfig.THRESHOLD_HIGH,
+    "same": InterviewConfig.THRESHOLD_LOW,
+    "easier": 0.0,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text or "") // 4)
+
+
+def predict_branches(interviewer: AdaptiveInterviewer, state: InterviewState) -> Dict[tuple, List[str]]:
+    """key (độ khó, context hint) của câu hỏi kế tiếp -> các action dẫn tới nó.
+
+    Nhánh làm buổi phỏng vấn kết thúc không cần câu hỏi nên bị bỏ qua.
+    """
+    branches: Dict[tuple, List[str]] = {}
+    for action in ACTIONS:
+        simulated = copy.deepcopy(state)
+        interviewer.update_state_after_question(simulated, "", "", _BRANCH_SCORES[action], "")
+        if simulated.is_finished:
+            continue
+        branches.setdefault(branch_key(interviewer, simulated), []).append(action)
+    return branches
+
+
+def branch_key(interviewer: AdaptiveInterviewer, state: InterviewState) -> tuple:
+    return state.current_difficulty, interviewer.question_context_hint(state)
+
+
+@dataclass
+class PrefetchStats:
+    rounds: int = 0  # lượt có sinh trước ít nhất 1 nhánh (mẫu số của tỉ lệ hit)
+    hits: int = 0
+    misses: int = 0
+    branches_started: int = 0
+    branches_cancelled: int = 0
+    branches_discarded: int = 0
+    bank_served: int = 0  # nhánh đúng lấy câu từ ngân hàng, không cần sinh trước
+    latency_saved_seconds: float = 0.0
+    extra_tokens: int = 0  # token của các nhánh bị bỏ (ước lượng)
+    used_tokens: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class _Branch:
+    def __init__(self, key: tuple, actions: List[str]):
+        self.key = key
+        self.actions = actions
+        self.future: Optional[Future] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.tokens = 0
+        self.discarded = False
+        self.counted = False
+
+
+class QuestionPrefetcher:
+    """Sinh trước câu hỏi cho các nhánh của 1 phiên phỏng vấn (dùng chung LLM / retriever)"""
+
+    def __init__(self, interviewer: AdaptiveInterviewer, executor: Optional[ThreadPoolExecutor] = None):
+        self.interviewer = interviewer
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=len(ACTIONS), thread_name_prefix="prefetch")
+        self._branches: List[_Branch] = []
+        self._bank_keys: set = set()
+        self._lock = threading.Lock()
+        self.stats = PrefetchStats()
+
+    # ============ Sinh trước ============
+    def start(self, state: InterviewState):
+        """Gọi ngay sau khi hiển thị câu hỏi: bắt đầu sinh câu hỏi cho các nhánh có thể xảy ra"""
+        self.cancel()
+        # Chụp lịch sử tại thời điểm này, các nhánh không ghi vào memory
+        history_text = self.interviewer.build_history_prompt()
+        bank = getattr(self.interviewer, "question_bank", None)
+        asked = {attempt.question for attempt in state.history}
+        branches = []
+        bank_keys = set()
+        for key, actions in predict_branches(self.interviewer, state).items():
+            difficulty, hint = key
+            if bank is not None and bank.available(state.topic, difficulty.value, asked) > 1:
+                # Còn câu trong ngân hàng (trừ câu đang hỏi) -> next_question lấy ngay, không tốn LLM
+                bank_keys.add(key)
+                continue
+            branch = _Branch(key, actions)
+            branch.future = self._executor.submit(self._generate, branch, state.topic, difficulty, hint, history_text)
+            branch.future.add_done_callback(lambda f, b=branch: self._on_done(b, f))
+            branches.append(branch)
+        with self._lock:
+            self._branches = branches
+            self._bank_keys = bank_keys
+            if branches:
+                self.stats.rounds += 1
+            self.stats.branches_started += len(branches)
+
+    def _generate(self, branch: _Branch, topic, difficulty, hint, history_text) -> str:
+        branch.started_at = time.perf_counter()
+        question, prompt, raw = self.interviewer.generate_question_text(topic, difficulty, hint, history_text)
+        branch.finished_at = time.perf_counter()
+        branch.tokens = estimate_tokens(prompt) + estimate_tokens(raw)
+        return question
+
+    def _on_done(self, branch: _Branch, future: Future):
+        # Nhánh bị bỏ trong lúc đang chạy: token vẫn bị tính khi chạy xong
+        with self._lock:
+            self._count_extra(branch)
+
+    def _count_extra(self, branch: _Branch):
+        future = branch.future
+        if branch.discarded and not branch.counted and future.done() and not future.cancelled() \
+                and future.exception() is None:
+            branch.counted = True
+            self.stats.extra_tokens += branch.tokens
+
+    # ============ Chốt nhánh ============
+    def commit(self, state: InterviewState) -> Optional[str]:
+        """Gọi sau update_state_after_question: trả về câu hỏi của nhánh đúng (và ghi vào memory),
+        None nếu không có nhánh khớp / nhánh lỗi (khi đó sinh câu hỏi như bình thường)."""
+        key = branch_key(self.interviewer, state)
+        with self._lock:
+            branches, self._branches = self._branches, []
+            bank_keys, self._bank_keys = self._bank_keys, set()
+        hit = next((b for b in branches if b.key == key), None)
+        self._discard([b for b in branches if b is not hit])
+
+        if hit is None and key in bank_keys:
+            self.stats.bank_served += 1
+            return None
+        if not branches:
+            # Không có nhánh nào được sinh trước (chưa gọi speculate): không tính là miss
+            return None
+        if hit is None:
+            self.stats.misses += 1
+            return None
+
+        commit_at = time.perf_counter()
+        try:
+            question = hit.future.result()
+        except Exception as e:
+            print(f"⚠️ Nhánh sinh trước bị lỗi, sinh lại câu hỏi: {e}")
+            self.stats.misses += 1
+            return None
+        waited = time.perf_counter() - commit_at
+
+        self.stats.hits += 1
+        self.stats.used_tokens += hit.tokens
+        # Thời gian sinh câu hỏi mà thí sinh không phải chờ
+        self.stats.latency_saved_seconds += max(0.0, (hit.finished_at - hit.started_at) - waited)
+        self.interviewer.add_to_memory("interviewer", question)
+        return question
+
+    def _discard(self, branches: List[_Branch]):
+        for branch in branches:
+            if branch.future.cancel():
+                self.stats.branches_cancelled += 1
+                continue
+            with self._lock:
+                branch.discarded = True
+                self.stats.branches_discarded += 1
+                self._count_extra(branch)
+
+    def cancel(self) -> None:
+        """Bỏ mọi nhánh đang chờ (vd phỏng vấn kết thúc)"""
+        with self._lock:
+            branches, self._branches = self._branches, []
+        self._discard(branches)
+
+    def shutdown(self):
+        self.cancel()
+        if self._own_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def print_stats(self):
+        s = self.stats
+        print(f"⚡ Prefetch: {s.hits}/{s.rounds} lượt dùng câu sinh trước, tiết kiệm {s.latency_saved_seconds:.1f}s, "
+              f"tốn thêm ~{s.extra_tokens} token ({s.branches_discarded} nhánh bỏ, {s.branches_cancelled} nhánh hủy)")
@@ -0,0 +1,164 @@
+# StartupBenchmark: đo thời gian khởi động của interviewer, FAST_START=1 (load song song ở background)
+# so với FAST_START=0 (load tuần tự trong __init__)
+#
+#   python StartupBenchmark.py                        # 3 lần mỗi chế độ, LLM stub (không gọi Gemini)
+#   python StartupBenchmark.py --runs 5 --llm gemini  # câu hỏi đầu tiên sinh bằng Gemini thật
+#   python StartupBenchmark.py --import-profile       # thêm top module import chậm nhất (-X importtime)
+#
+# Mỗi lần đo chạy trong 1 process mới (import "lạnh"). Số đo, tính từ đầu process con:
+#   import           import LLMInterviewer2_fixed
+#   init             AdaptiveInterviewer() trả về
+#   first_question   start_interview + next_question xong (câu hỏi đầu tiên đã có)
+#   ready            mọi thành phần load xong; model: embedding model load xong (nếu load được)
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+DEFAULT_CANDIDATE = "Nguyễn Văn An,QTKD1"
+
+
+# =======================
+# 1. Đo trong process con
+# =======================
+
+class _StubClient:
+    """Client cho LLMClientPool trả JSON giả đúng dạng (FakeLLMServer.fake_response), không cần key / mạng"""
+
+    def __init__(self):
+        import random
+
+        self.random = random.Random(0)
+
+    def invoke(self, prompt: str) -> str:
+        from FakeLLMServer import fake_response
+
+        return fake_response(prompt, self.random)
+
+    def stream(self, prompt: str):
+        yield self.invoke(prompt)
+
+
+def measure_startup(candidate: str, topic: str, llm: str = "stub", wait_model: bool = False) -> dict:
+    start = time.perf_counter()
+    import LLMInterviewer2_fixed as interviewer_module
+    import LLMClientPool
+
+    result = {"fast_start": interviewer_module.InterviewConfig.FAST_START,
+              "import": time.perf_counter() - start}
+    if llm == "stub":
+        # Pool 1 key, client stub: vẫn đi qua PooledLLM (và import langchain_core như khi chạy thật)
+        LLMClientPool._default_pool = LLMClientPool.LLMClientPool(
+            ["stub-key"], rpm=1e9, client_factory=lambda *args, **kwargs: _StubClient())
+
+    interviewer = interviewer_module.AdaptiveInterviewer()
+    result["init"] = time.perf_counter() - start
+    state = interviewer.start_interview(candidate, topic or interviewer_module.InterviewConfig.TOPICS[0])
+    result["profile"] = time.perf_counter() - start
+    question = interviewer.next_question(state)
+    result["first_question"] = time.perf_counter() - start
+    result["question"] = question
+
+    try:
+        components = interviewer.wait_until_ready(include_model=wait_model)
+    except Exception as e:
+        components = dict(interviewer.startup_seconds)
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["ready"] = time.perf_counter() - start
+    result["components"] = {name: seconds + result["import"] for name, seconds in components.items()}
+    return result
+
+
+# =======================
+# 2. Chạy + tổng hợp
+# =======================
+
+def run_child(fast_start: bool, args) -> dict:
+    env = dict(os.environ, FAST_START="1" if fast_start else "0", INTERVIEW_TRACE="0")
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--candidate", args.candidate,
+               "--llm", args.llm]
+    if args.topic:
+        command += ["--topic", args.topic]
+    if args.wait_model:
+        command.append("--wait-model")
+    completed = subprocess.run(command, env=env, capture_output=True, text=True, encoding="utf-8")
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f"Process đo bị lỗi (exit {completed.returncode}):\n{completed.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def summarize(runs: List[dict]) -> dict:
+    keys = ("import", "init", "profile", "first_question", "ready")
+    summary = {key: float(np.median([r[key] for r in runs])) for key in keys}
+    names = sorted({name for r in runs for name in r["components"]})
+    summary["components"] = {name: float(np.median([r["components"][name] for r in runs if name in r["components"]]))
+                             for name in names}
+    summary["errors"] = sorted({r["error"] for r in runs if "error" in r})
+    return summary
+
+
+def import_profile(top: int = 10) -> List[tuple]:
+    """Các module import chậm nhất (thời gian cộng dồn, giây) khi import LLMInterviewer2_fixed"""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import LLMInterviewer2_fixed"],
+                               capture_output=True, text=True, encoding="utf-8", cwd=os.path.dirname(
+                                   os.path.abspath(__file__)))
+    rows = []
+    for line in completed.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((parts[2].rstrip(), int(parts[1]) / 1e6))
+    return sorted(rows, key=lambda row: -row[1])[:top]
+
+
+def print_report(report: dict):
+    print(f"\n📊 Khởi động interviewer (trung vị {report['runs']} lần, LLM {report['llm']})")
+    print(f"{'':<18}{'FAST_START=0':>14}{'FAST_START=1':>14}")
+    slow, fast = report["sequential"], report["fast"]
+    for key in ("import", "init", "profile", "first_question", "ready"):
+        print(f"{key:<18}{slow[key]:>13.2f}s{fast[key]:>13.2f}s")
+    print("Thành phần sẵn sàng (FAST_START=1):")
+    for name, seconds in sorted(fast["components"].items(), key=lambda item: item[1]):
+        print(f"   {name:<16}{seconds:>8.2f}s")
+    for error in set(slow["errors"] + fast["errors"]):
+        print(f"⚠️ {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo import time và time-to-first-question của interviewer")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--candidate", default=DEFAULT_CANDIDATE)
+    parser.add_argument("--topic", default=None, help="Mặc định InterviewConfig.TOPICS[0]")
+    parser.add_argument("--llm", choices=("stub", "gemini"), default="stub")
+    parser.add_argument("--wait-model", action="store_true", help="ready tính cả lúc embedding model load xong")
+    parser.add_argument("--import-profile", action="store_true")
+    parser.add_argument("--output", default=None, help="Ghi báo cáo JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_startup(args.candidate, args.topic, args.llm, args.wait_model), ensure_ascii=False))
+        sys.exit(0)
+
+    report = {"runs": args.runs, "llm": args.llm}
+    for name, fast_start in (("sequential", False), ("fast", True)):
+        runs = []
+        for i in range(args.runs):
+            runs.append(run_child(fast_start, args))
+            print(f"⏱️ FAST_START={int(fast_start)} lần {i + 1}: câu hỏi đầu tiên sau {runs[-1]['first_question']:.2f}s")
+        report[name] = summarize(runs)
+    print_report(report)
+    if args.import_profile:
+        report["import_profile"] = import_profile()
+        print("🐢 Import chậm nhất:")
+        for module, seconds in report["import_profile"]:
+            print(f"   {seconds:6.3f}s  {module.strip()}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Đã ghi {args.output}")
@@ -0,0 +1,151 @@
+# StreamingIngest: pipeline PDF -> chunk -> embed -> FAISS dạng generator, bộ nhớ có giới hạn
+#
+#   trang PDF -> làm sạch -> tách câu (NLTK) -> gộp câu thành chunk -> batch embed -> append vào index
+#
+# Mỗi lúc chỉ giữ 1 trang, vài câu đang gộp dở và 1 batch chunk trong RAM, không ghép cả
+# cuốn sách thành 1 chuỗi như NLTK.py trước đây. Chunk giữ metadata source, page (trang bắt đầu)
+# và page_end (trang kết thúc, khi chunk vắt qua 2 trang).
+#
+# Cách gộp câu giống NLTKTextSplitter(chunk_size, chunk_overlap, separator) của langchain.
+import os
+import re
+import time
+import unicodedata
+from collections import deque
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_CHUNK_SIZE = 1600
+DEFAULT_CHUNK_OVERLAP = 400
+DEFAULT_SEPARATOR = "\n\n"
+DEFAULT_EMBED_BATCH = 64
+
+
+# =======================
+# 1. Các bước của pipeline
+# =======================
+
+def iter_pages(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """Đọc lần lượt từng trang (page index bắt đầu từ 0, giống PyPDFLoader)"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(pdf_path)
+    for page_number, page in enumerate(reader.pages):
+        yield page_number, page.extract_text() or ""
+
+
+def clean_text(text: str) -> str:
+    """Chuẩn hóa Unicode, bỏ khoảng trắng đặc biệt và dòng trống thừa"""
+    text = unicodedata.normalize("NFC", text).replace("\xa0", " ")
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def iter_sentences(pages: Iterable[Tuple[int, str]], language: str = "english") -> Iterator[Tuple[str, int]]:
+    """Tách câu từng trang bằng nltk.sent_tokenize, trả về (câu, số trang)"""
+    from nltk.tokenize import sent_tokenize
+
+    for page_number, text in pages:
+        text = clean_text(text)
+        if not text:
+            continue
+        for sentence in sent_tokenize(text, language=language):
+            yield sentence, page_number
+
+
+def iter_chunks(sentences: Iterable[Tuple[str, int]], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, separator: str = DEFAULT_SEPARATOR,
+                source: Optional[str] = None) -> Iterator[dict]:
+    """Gộp câu thành chunk (cùng thuật toán TextSplitter._merge_splits), chỉ giữ các câu của chunk hiện tại"""
+    sep_len = len(separator)
+    current: deque = deque()  # (câu, trang)
+    total = 0
+    chunk_index = 0
+
+    def emit():
+        nonlocal chunk_index
+        text = separator.join(s for s, _ in current).strip()
+        if not text:
+            return None
+        metadata = {"page": current[0][1], "page_end": current[-1][1], "chunk_index": chunk_index}
+        if source is not None:
+            metadata["source"] = source
+        chunk_index += 1
+        return {"page_content": text, "metadata": metadata}
+
+    for sentence, page in sentences:
+        length = len(sentence)
+        if total + length + (sep_len if current else 0) > chunk_size and current:
+            chunk = emit()
+            if chunk is not None:
+                yield chunk
+            # Giữ lại phần đuôi làm overlap cho chunk sau
+            while total > chunk_overlap or (total + length + (sep_len if current else 0) > chunk_size and total > 0):
+                total -= len(current[0][0]) + (sep_len if len(current) > 1 else 0)
+                current.popleft()
+        current.append((sentence, page))
+        total += length + (sep_len if len(current) > 1 else 0)
+
+    if current:
+        chunk = emit()
+        if chunk is not None:
+            yield chunk
+
+
+def iter_pdf_chunks(pdf_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, separator: str = DEFAULT_SEPARATOR) -> Iterator[dict]:
+    """PDF -> chunk (dict page_content + metadata) dạng generator"""
+    return iter_chunks(iter_sentences(iter_pages(pdf_path)), chunk_size, chunk_overlap, separator,
+                       source=os.path.normpath(pdf_path))
+
+
+def batched(iterable: Iterable, n: int) -> Iterator[List]:
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+# =======================
+# 2. Embed + append vào index
+# =======================
+
+def stream_build(pdf_paths: Iterable[str], embeddings, embedder=None, embed_batch: int = DEFAULT_EMBED_BATCH,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+                 separator: str = DEFAULT_SEPARATOR, db=None):
+    """Build (hoặc append vào db có sẵn) FAISS store từ các PDF, mỗi lần chỉ embed 1 batch chunk.
+
+    embedder: BatchEmbedder (EmbeddingEngine), None thì dùng embeddings.embed_documents. Pool worker
+    của embedder dùng lại cho mọi batch; người gọi đóng nó (close / with) sau khi build xong.
+    Trả về (db, số chunk).
+    """
+    from langchain_community.vectorstores import FAISS
+
+    def all_chunks():
+        for path in pdf_paths:
+            yield from iter_pdf_chunks(path, chunk_size, chunk_overlap, separator)
+
+    start = time.perf_counter()
+    n_chunks = 0
+    for batch in batched(all_chunks(), embed_batch):
+        texts = [c["page_content"] for c in batch]
+        metadatas = [c["metadata"] for c in batch]
+        if embedder is not None:
+            vectors = embedder.embed(texts, verbose=False).tolist()
+        else:
+            vectors = embeddings.embed_documents(texts)
+
+        if db is None:
+            db = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+        else:
+            db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+
+        n_chunks += len(batch)
+        elapsed = time.perf_counter() - start
+        print(f"\r⏳ {n_chunks} chunk đã index (trang {metadatas[-1]['page_end'] + 1}, "
+              f"{n_chunks / elapsed:.1f} chunk/s)", end="", flush=True)
+    print()
+    return db, n_chunks
@@ -1,5 +1,6 @@
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
+from EmbeddingEngine import detect_device
 import torch
 import gc
 
@@ -25,7 +26,7 @@ for store_info in vector_stores:
     # Load embeddings cho model
     embeddings = HuggingFaceEmbeddings(
         model_name=model_name,
-        model_kwargs={'device': 'cuda'},  # Thay bằng 'cpu' nếu GPU lỗi
+        model_kwargs={'device': detect_device()},  # cuda nếu có GPU, không thì cpu
         encode_kwargs={'normalize_embeddings': True}
     )
 
@@ -0,0 +1,549 @@
+# TolerantJson: đọc JSON "gần đúng" từ output của LLM trong 1 lượt duyệt, tuyến tính theo độ dài
+#
+#   parsed = extract_json(raw_text, "evaluation")     # {"score": 7.0, "analysis": "..."} hoặc {}
+#
+#   parser = TolerantJsonParser()                      # dùng với stream
+#   for chunk in llm.stream(prompt):
+#       parser.feed(chunk)
+#       if parser.done: break                          # object đã đóng, phần sau bỏ qua
+#   value = parser.result()
+#
+# Thay cho chuỗi regex cũ (bóc code fence, re.sub(r'\".*?\"', ..., flags=re.S) ...). Sửa được:
+# lời dẫn / code fence quanh object, xuống dòng và tab thô trong string, dấu " không escape trong
+# câu hỏi có code, escape sai (\d, \', \u không đủ 4 hex như "\user"), dấu phẩy thừa, string nháy
+# đơn, True/False/None, key không có nháy, "score": 8/10, output bị cắt giữa chừng.
+#
+# SCHEMAS: schema cho từng loại payload, vừa gửi cho Gemini (response_schema, chế độ JSON có ràng
+# buộc, xem LLMClientPool) vừa dùng để kiểm tra / ép kiểu sau khi parse (coerce).
+#
+#   python TolerantJson.py --bench json_corpus.jsonl    # so với cách parse cũ: tỉ lệ đọc được, µs/lần
+#   python TolerantJson.py --fuzz 2000                  # output lỗi sinh ngẫu nhiên, chia chunk ngẫu nhiên
+#
+# JSON_CORPUS_PATH=json_corpus.jsonl: output thật phải sửa mới đọc được / không đọc được được ghi
+# thêm vào corpus để bổ sung cho benchmark.
+import json
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Optional
+
+CORPUS_PATH = os.environ.get("JSON_CORPUS_PATH")
+
+SCHEMAS = {
+    "question": {
+        "type": "object",
+        "properties": {"question": {"type": "string"}},
+        "required": ["question"],
+    },
+    "evaluation": {
+        "type": "object",
+        "properties": {
+            "score": {"type": "number", "minimum": 0, "maximum": 10},
+            "analysis": {"type": "string"},
+        },
+        # analysis có thể thiếu: {"score": 8} vẫn giữ được điểm
+        "required": ["score"],
+    },
+    "level": {
+        "type": "object",
+        "properties": {"level": {"type": "string", "enum": ["yeu", "trung_binh", "kha", "gioi", "xuat_sac"]}},
+        "required": ["level"],
+    },
+    "questions": {
+        "type": "object",
+        "properties": {"questions": {"type": "array", "items": {"type": "string"}}},
+        "required": ["questions"],
+    },
+}
+
+# Trạng thái của parser
+_OUTSIDE, _VALUE, _STRING, _ESCAPE, _UNICODE, _QUOTE, _QUOTE_COMMA, _DONE = range(8)
+_VALID_ESCAPES = set('"\\/bfnrt')
+_HEX = set("0123456789abcdefABCDEF")
+_CONTROL = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_LITERALS = {"True": "true", "False": "false", "None": "null", "true": "true", "false": "false", "null": "null"}
+_FRACTION = re.compile(r"^(-?\d+(?:\.\d+)?)/\d+(?:\.\d+)?$")
+_NUMBER = re.compile(r"-?\d+(?:[.,]\d+)?")
+_CLOSERS = {"{": "}", "[": "]"}
+_STRING_SPECIAL_DQ = re.compile(r'[\\"\x00-\x1f]')
+_STRING_SPECIAL_SQ = re.compile(r"[\\'\"\x00-\x1f]")
+
+
+class JsonRepairError(ValueError):
+    pass
+
+
+# =======================
+# 1. Parser 1 lượt
+# =======================
+
+class TolerantJsonParser:
+    """Chuyển output của LLM thành JSON hợp lệ trong lúc đọc từng ký tự (chỉ giữ object đầu tiên)"""
+
+    def __init__(self):
+        self._out = []
+        self._stack = []
+        self._state = _OUTSIDE
+        self._quote = '"'
+        self._word = []
+        self._pending = []  # khoảng trắng sau dấu nháy chưa rõ là đóng string hay nằm trong string
+        self._hex = []  # chữ số hex đã đọc sau \u
+        self.repaired = False  # True nếu phải sửa gì đó ngoài việc bỏ lời dẫn quanh object
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def feed(self, chunk: str):
+        pos, end = 0, len(chunk)
+        while pos < end and self._state != _DONE:
+            if self._state == _STRING:
+                # Chép nguyên đoạn ký tự thường trong string, chỉ xét từng ký tự ở \ " ' và ký tự điều khiển
+                special = (_STRING_SPECIAL_DQ if self._quote == '"' else _STRING_SPECIAL_SQ).search(chunk, pos)
+                stop = special.start() if special else end
+                if stop > pos:
+                    self._out.append(chunk[pos:stop])
+                    pos = stop
+                    continue
+            elif self._state == _OUTSIDE:
+                start = chunk.find("{", pos)
+                pos = end if start == -1 else start
+                if pos == end:
+                    break
+            self._step(chunk[pos])
+            pos += 1
+
+    def _emit_string_char(self, ch: str):
+        if ch in _CONTROL:
+            self._out.append(_CONTROL[ch])
+            self.repaired = True
+        elif ch < " ":
+            self._out.append(f"\\u{ord(ch):04x}")
+            self.repaired = True
+        elif ch == '"':
+            # Chỉ gặp trong string nháy đơn
+            self._out.append('\\"')
+        else:
+            self._out.append(ch)
+
+    def _flush_word(self, next_ch: str):
+        """Kết thúc 1 token không có nháy (số, true/false/null, key thiếu nháy)"""
+        word = "".join(self._word)
+        self._word = []
+        if next_ch == ":":
+            self._out.append(json.dumps(word, ensure_ascii=False))
+            self.repaired = True
+        elif word in _LITERALS:
+            self._out.append(_LITERALS[word])
+            self.repaired |= word != _LITERALS[word]
+        elif _FRACTION.match(word):
+            self._out.append(_FRACTION.match(word).group(1))
+            self.repaired = True
+        else:
+            self._out.append(word)
+
+    def _flush_unicode(self):
+        """\\u không theo sau bởi 4 hex (đường dẫn Windows, "\\user"): giữ nguyên dấu \\ như escape sai khác"""
+        self._out.append("\\\\u" + "".join(self._hex))
+        self._hex = []
+        self._state = _STRING
+        self.repaired = True
+
+    def _close_string(self):
+        self._out.append('"')
+        self._state = _VALUE
+
+    def _literal_quote(self):
+        """Dấu nháy vừa gặp nằm trong string: ghi lại nó cùng khoảng trắng đang chờ"""
+        self._out.append('\\"' if self._quote == '"' else "'")
+        for ch in self._pending:
+            self._emit_string_char(ch)
+        self._pending = []
+        self._state = _STRING
+        self.repaired = True
+
+    def _step(self, ch: str):
+        state = self._state
+        if state == _STRING:
+            if ch == "\\":
+                self._state = _ESCAPE
+            elif ch == self._quote:
+                self._state = _QUOTE
+            else:
+                self._emit_string_char(ch)
+            return
+        if state == _ESCAPE:
+            self._state = _STRING
+            if ch == "u":
+                self._state = _UNICODE
+            elif ch in _VALID_ESCAPES and not (ch == '"' and self._quote == "'"):
+                self._out.append("\\" + ch)
+            elif ch in ("'", '"'):
+                self._emit_string_char(ch)
+            else:
+                # \d, \s ... trong regex / code: giữ nguyên dấu \
+                self._out.append("\\\\")
+                self._emit_string_char(ch)
+                self.repaired = True
+            return
+        if state == _UNICODE:
+            if ch not in _HEX:
+                self._flush_unicode()
+                self._step(ch)
+                return
+            self._hex.append(ch)
+            if len(self._hex) == 4:
+                self._out.append("\\u" + "".join(self._hex))
+                self._hex = []
+                self._state = _STRING
+            return
+        if state == _QUOTE:
+            # Dấu nháy đóng string chỉ khi theo sau là : } ] hoặc , + phần tử tiếp theo
+            if ch.isspace():
+                self._pending.append(ch)
+            elif ch in ":}]":
+                self._pending = []
+                self._close_string()
+                self._step(ch)
+            elif ch == ",":
+                self._pending.append(ch)
+                self._state = _QUOTE_COMMA
+            else:
+                self._literal_quote()
+                self._step(ch)
+            return
+        if state == _QUOTE_COMMA:
+            if ch.isspace():
+                self._pending.append(ch)
+            elif ch in "\"'{}[]-" or ch.isdigit():
+                self._pending = []
+                self._close_string()
+                self._out.append(",")
+                self._step(ch)
+            else:
+                self._literal_quote()
+                self._step(ch)
+            return
+        if state == _OUTSIDE:
+            if ch == "{":
+                self._stack.append("{")
+                self._out.append("{")
+                self._state = _VALUE
+            return
+
+        # _VALUE: giữa các phần tử của object / array
+        if self._word:
+            if ch.isalnum() or ch in "_.+-/":
+                self._word.append(ch)
+                return
+            if ch.isspace():
+                return
+            self._flush_word(ch)
+        if ch.isspace() or ch == "`":
+            if ch == "`":
+                self.repaired = True
+            return
+        if ch in "\"'":
+            self._quote = ch
+            self._out.append('"')
+            self._state = _STRING
+            if ch == "'":
+                self.repaired = True
+        elif ch in "{[":
+            self._stack.append(ch)
+            self._out.append(ch)
+        elif ch in "}]":
+            self._close_container()
+        elif ch in ",:":
+            self._out.append(ch)
+        else:
+            self._word.append(ch)
+
+    def _close_container(self):
+        if self._out and self._out[-1] == ",":
+            self._out.pop()
+            self.repaired = True
+        elif self._out and self._out[-1] == ":":
+            self._out.append("null")
+            self.repaired = True
+        self._out.append(_CLOSERS[self._stack.pop()])
+        if not self._stack:
+            self._state = _DONE
+
+    def text(self) -> str:
+        """JSON đã sửa (đóng nốt string / ngoặc nếu output bị cắt)"""
+        if self._state == _OUTSIDE:
+            raise JsonRepairError("Không tìm thấy object JSON")
+        state, out = self._state, list(self._out)
+        if state != _DONE:
+            self.repaired = True
+            # Chạy trên bản sao để parser vẫn nhận tiếp được chunk
+            clone = TolerantJsonParser.__new__(TolerantJsonParser)
+            clone.__dict__.update(self.__dict__)
+            clone._out, clone._stack, clone._word = out, list(self._stack), list(self._word)
+            if state == _UNICODE:
+                clone._hex = list(self._hex)
+                clone._flush_unicode()
+                clone._close_string()
+            elif state in (_STRING, _ESCAPE):
+                clone._close_string()
+            elif state in (_QUOTE, _QUOTE_COMMA):
+                clone._close_string()
+            elif clone._word:
+                clone._flush_word("")
+            while clone._stack:
+                clone._close_container()
+            out = clone._out
+        return "".join(out)
+
+    def result(self) -> Any:
+        candidate = self.text()
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError as e:
+            raise JsonRepairError(f"{e} trong {candidate[:200]!r}") from None
+
+
+_decoder = json.JSONDecoder()
+
+
+def _decode_strict(raw_text: str) -> Optional[Any]:
+    """Đường nhanh cho output đã đúng JSON: raw_decode (C) từ dấu { đầu tiên, None nếu lỗi"""
+    start = raw_text.find("{")
+    if start == -1:
+        return None
+    try:
+        return _decoder.raw_decode(raw_text, start)[0]
+    except json.JSONDecodeError:
+        return None
+
+
+def parse_tolerant(raw_text: str) -> Any:
+    value = _decode_strict(raw_text or "")
+    if value is not None:
+        return value
+    parser = TolerantJsonParser()
+    parser.feed(raw_text or "")
+    return parser.result()
+
+
+# =======================
+# 2. Kiểm tra theo schema
+# =======================
+
+def _normalize_enum(value: str) -> str:
+    """"Trung bình" -> "trung_binh" (bỏ dấu, chữ thường, khoảng trắng thành _)"""
+    text = unicodedata.normalize("NFD", str(value).strip().lower()).replace("đ", "d")
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return re.sub(r"[\s-]+", "_", text)
+
+
+def coerce(value: Any, schema: dict, path: str = "$") -> Any:
+    """Ép value về đúng schema (subset JSON Schema: object / array / string / number / enum)"""
+    kind = schema.get("type")
+    if kind == "object":
+        if isinstance(value, list) and len(value) == 1 and isinstance(value[0], dict):
+            value = value[0]
+        if not isinstance(value, dict):
+            raise JsonRepairError(f"{path}: cần object, nhận {type(value).__name__}")
+        result = {}
+        for key, sub in schema.get("properties", {}).items():
+            if value.get(key) is not None:
+                result[key] = coerce(value[key], sub, f"{path}.{key}")
+            elif key in schema.get("required", ()):
+                raise JsonRepairError(f"{path}: thiếu {key}")
+        return result
+    if kind == "array":
+        items = value if isinstance(value, list) else [value]
+        return [coerce(item, schema.get("items", {}), f"{path}[{i}]") for i, item in enumerate(items)]
+    if kind == "number":
+        if isinstance(value, bool):
+            raise JsonRepairError(f"{path}: cần số, nhận {value}")
+        if not isinstance(value, (int, float)):
+            match = _NUMBER.search(str(value))
+            if not match:
+                raise JsonRepairError(f"{path}: cần số, nhận {value!r}")
+            value = match.group(0).replace(",", ".")
+        number = float(value)
+        if "minimum" in schema:
+            number = max(number, float(schema["minimum"]))
+        if "maximum" in schema:
+            number = min(number, float(schema["maximum"]))
+        return number
+    if kind == "string":
+        if isinstance(value, (dict, list)):
+            raise JsonRepairError(f"{path}: cần string, nhận {type(value).__name__}")
+        text = str(value).strip()
+        if "enum" in schema:
+            normalized = _normalize_enum(text)
+            if normalized not in schema["enum"]:
+                raise JsonRepairError(f"{path}: {text!r} không thuộc {schema['enum']}")
+            return normalized
+        return text
+    return value
+
+
+# =======================
+# 3. Hàm dùng trong interviewer
+# =======================
+
+_stats_lock = threading.Lock()
+_stats = {"ok": 0, "repaired": 0, "failed": 0}
+
+
+def parse_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _record(outcome: str, raw_text: str, schema_name: Optional[str], error: str = ""):
+    with _stats_lock:
+        _stats[outcome] += 1
+    if CORPUS_PATH and outcome != "ok":
+        line = json.dumps({"schema": schema_name, "outcome": outcome, "error": error, "raw": raw_text},
+                          ensure_ascii=False)
+        with _stats_lock, open(CORPUS_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def extract_json(raw_text: str, schema: Optional[str] = None, expected_keys: Optional[list] = None) -> dict:
+    """Object JSON đầu tiên trong raw_text, đã ép theo SCHEMAS[schema]; {} nếu không đọc được.
+
+    Không có schema thì chỉ giữ các key trong expected_keys (nếu có).
+    """
+    value = _decode_strict(raw_text or "")
+    repaired = value is None
+    try:
+        if repaired:
+            parser = TolerantJsonParser()
+            parser.feed(raw_text or "")
+            value = parser.result()
+            repaired = parser.repaired
+        if schema is not None:
+            value = coerce(value, SCHEMAS[schema])
+        elif not isinstance(value, dict):
+            raise JsonRepairError(f"cần object, nhận {type(value).__name__}")
+        elif expected_keys:
+            value = {k: v for k, v in value.items() if k in expected_keys}
+    except JsonRepairError as e:
+        _record("failed", raw_text, schema, str(e))
+        return {}
+    _record("repaired" if repaired else "ok", raw_text, schema)
+    return value
+
+
+# =======================
+# 4. Benchmark + fuzz
+# =======================
+
+def _legacy_extract(raw_text: str) -> dict:
+    """Cách parse cũ của interviewer (trước TolerantJson), chỉ để so sánh"""
+    text = (raw_text or "").strip()
+    first_brace, last_brace = text.find("{"), text.rfind("}")
+    if first_brace == -1 or last_brace <= first_brace:
+        return {}
+    candidate = text[first_brace:last_brace + 1]
+    candidate = re.sub(r"```[a-zA-Z]*", "", candidate).replace("```", "")
+    candidate = re.sub(r'\".*?\"', lambda m: m.group(0).replace("\n", "\\n"), candidate, flags=re.S)
+    try:
+        return json.loads(candidate)
+    except Exception:
+        return {}
+
+
+def load_corpus(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def benchmark(cases: list, repeat: int = 20) -> dict:
+    """Tỉ lệ đọc được (đúng schema) và thời gian parse trung bình của 2 cách"""
+    report = {}
+    for name, parse in (("legacy", _legacy_extract), ("tolerant", lambda raw: parse_tolerant(raw))):
+        ok = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            ok = 0
+            for case in cases:
+                try:
+                    value = parse(case["raw"])
+                    coerce(value, SCHEMAS[case["schema"]])
+                    ok += 1
+                except (JsonRepairError, AttributeError):
+                    pass
+        elapsed = time.perf_counter() - start
+        report[name] = {"parsed": ok, "total": len(cases), "us_per_parse": elapsed / (repeat * len(cases)) * 1e6}
+    return report
+
+
+_FUZZ_TEXTS = [
+    "Biến final trong Java khác gì hằng số static final?",
+    'Giải thích đoạn code: String s = "abc"; s.concat("d"); System.out.println(s);',
+    "Kiểu int\tchiếm bao nhiêu byte?\nCho ví dụ ép kiểu từ long sang int.",
+    r"Regex \d+ dùng để làm gì trong String.matches()?",
+    "So sánh == và equals() khi dùng với 'String' trong Java.",
+]
+
+
+def _corrupt(payload: dict, rng: random.Random) -> str:
+    """Output lỗi kiểu LLM hay trả về, dựng từ payload đúng"""
+    separator = ":\n    " if rng.random() < 0.3 else ": "
+    body = ", ".join(f'"{k}"{separator}' + (f'"{v}"' if isinstance(v, str) and rng.random() < 0.5 else
+                                           json.dumps(v, ensure_ascii=False))
+                     for k, v in payload.items())
+    text = "{" + body + (", " if rng.random() < 0.3 else "") + "}"
+    if rng.random() < 0.4:
+        text = f"```json\n{text}\n```"
+    if rng.random() < 0.3:
+        text = "Đây là kết quả:\n" + text + "\nHy vọng hữu ích!"
+    return text
+
+
+def fuzz(iterations: int = 1000, seed: int = 0) -> dict:
+    """Payload ngẫu nhiên -> làm lỗi -> parse (nguyên khối và theo chunk ngẫu nhiên) -> so lại"""
+    rng = random.Random(seed)
+    failures = []
+    for i in range(iterations):
+        question = rng.choice(_FUZZ_TEXTS)
+        payload = rng.choice([{"question": question},
+                              {"score": rng.randint(0, 10), "analysis": question}])
+        raw = _corrupt(payload, rng)
+        parser = TolerantJsonParser()
+        pos = 0
+        while pos < len(raw):
+            size = rng.randint(1, 12)
+            parser.feed(raw[pos:pos + size])
+            pos += size
+        try:
+            whole, chunked = parse_tolerant(raw), parser.result()
+        except JsonRepairError as e:
+            failures.append({"raw": raw, "error": str(e)})
+            continue
+        if whole != chunked or {k: whole.get(k) for k in payload} != payload:
+            failures.append({"raw": raw, "expected": payload, "whole": whole, "chunked": chunked})
+    return {"iterations": iterations, "failures": len(failures), "examples": failures[:5]}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark / fuzz parser JSON chịu lỗi")
+    parser.add_argument("--bench", metavar="CORPUS", help="File JSONL {schema, raw} (vd json_corpus.jsonl)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--fuzz", type=int, metavar="N", help="Số output lỗi sinh ngẫu nhiên")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.bench:
+        cases = load_corpus(args.bench)
+        for name, r in benchmark(cases, args.repeat).items():
+            print(f"📊 {name:<8} đọc được {r['parsed']}/{r['total']} | {r['us_per_parse']:.1f} µs/lần")
+    if args.fuzz:
+        report = fuzz(args.fuzz, args.seed)
+        status = "✅" if not report["failures"] else "❌"
+        print(f"{status} Fuzz: {report['failures']}/{report['iterations']} output không khôi phục đúng")
+        for example in report["examples"]:
+            print(json.dumps(example, ensure_ascii=False))
@@ -1,10 +1,7 @@
 # Load from disk
-from langchain.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
+from EmbeddingRegistry import load_faiss, print_model_stats
 
-db=FAISS.load_local("vector_db2chunk_nltk", embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large-instruct", )
-,allow_dangerous_deserialization=True)
+db = load_faiss("vector_db2chunk_nltk")
 # # Example query
 query= """Nhập dữ liệu từ bàn phím trong Java
 # """
@@ -17,3 +14,5 @@ for r, score in results:
     print(f"Score: {score:.4f}")
     print(r.page_content[:])
     print("-" * 80)
+
+print_model_stats()